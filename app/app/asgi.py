@@ -2,15 +2,21 @@
 ASGI config for app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Django 2.1 ships no ASGI handler, so requests go through core.asgi, e.g.
+
+    uvicorn app.asgi:application --workers 4
 
 For more information on this file, see
-https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+https://asgi.readthedocs.io/en/latest/specs/main.html
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+django.setup(set_prefix=False)
+
+from core.asgi import ASGIHandler  # noqa: E402
 
-application = get_asgi_application()
+application = ASGIHandler()
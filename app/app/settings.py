@@ -14,6 +14,8 @@ from pathlib import Path
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -39,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -47,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.RequestProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -76,20 +81,149 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'app.wsgi.application'
 
+# threads of an ASGI worker (app.asgi, see core.asgi) that run requests;
+# each may hold a database connection, so keep DB_POOL_MAX_SIZE in step
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+# request bodies over this many bytes are refused with a 413 before they
+# are read, 0 for no limit
+ASGI_MAX_BODY_SIZE = int(
+    os.environ.get('ASGI_MAX_BODY_SIZE', 20 * 1024 * 1024)
+)
+
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# connection management, see core.db.postgresql; DB_POOL picks one of
+# - `none`: each thread keeps its own connection for DB_CONN_MAX_AGE
+#   seconds (0 reconnects on every request)
+# - `pool`: requests borrow from a per-process pool of at most
+#   DB_POOL_MAX_SIZE connections, waiting up to DB_POOL_TIMEOUT seconds
+#   when all are busy; size it to the threads of a worker, and keep
+#   workers * size under the server's max_connections
+# - `pgbouncer`: persistent connections to a PgBouncer in transaction
+#   pooling mode, which cannot hold the server-side cursors of
+#   QuerySet.iterator() across transactions so those are disabled
+DB_POOL = os.environ.get('DB_POOL', 'none')
+if DB_POOL not in ('none', 'pool', 'pgbouncer'):
+    raise ImproperlyConfigured(f'Unknown DB_POOL {DB_POOL!r}')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.postgresql',
         'HOST': os.environ.get('DB_HOST'),
+        'PORT': os.environ.get('DB_PORT', ''),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # pooled connections go back to the pool at the end of a request
+        'CONN_MAX_AGE': (
+            0 if DB_POOL == 'pool'
+            else int(os.environ.get('DB_CONN_MAX_AGE', 60))
+        ),
+        'CONN_HEALTH_CHECKS': os.environ.get(
+            'DB_CONN_HEALTH_CHECKS', '1'
+        ) == '1',
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'MAX_LIFETIME': float(
+                os.environ.get('DB_POOL_MAX_LIFETIME', 1800)
+            ),
+        } if DB_POOL == 'pool' else None,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOL == 'pgbouncer',
+    }
+}
+
+# streaming replicas of `default`, see core.db.routers; DB_REPLICA_HOSTS is
+# a comma separated list of host[:port] that list and retrieve requests
+# read from. Tests mirror them onto the test database of `default`.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host, PORT=port,
+                            TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+
+# seconds a user keeps reading from `default` after a write; keep it above
+# the replication lag so clients read their own writes
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.environ.get('DB_REPLICA_PIN_SECONDS', 5)
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# use a shared backend (e.g. memcached) when running several processes so
+# cache invalidation reaches all of them
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# the read-your-writes pins of core.db.routers live in the default cache
+# and must be seen by every worker that may serve the user's next read
+if DATABASE_REPLICAS and CACHES['default']['BACKEND'] in (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache'):
+    raise ImproperlyConfigured(
+        'DB_REPLICA_HOSTS needs a CACHE_BACKEND shared between processes'
+    )
+
+# seconds a user's serialized tag/ingredient list stays cached
+RECIPE_ATTR_CACHE_TIMEOUT = 300
+
+# most items accepted by one request to a `bulk` endpoint
+RECIPE_BULK_MAX_ITEMS = 10000
+
+# most ids accepted by each of the `tags` and `ingredients` recipe filters
+RECIPE_FILTER_MAX_IDS = 500
+
+# render recipe tags and ingredients from Recipe.related_snapshot instead
+# of prefetching them, see core.snapshots
+RECIPE_SNAPSHOT_READS = True
+
+# per view timing, query and size histograms served at /metrics, see
+# core.middleware; each process keeps its own, so scrape every worker (or
+# run one per container). The endpoint is only served with METRICS_TOKEN
+# set, to requests sending an `Authorization: Bearer <token>` header.
+REQUEST_METRICS = True
+REQUEST_METRICS_SERVER_TIMING = True
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# opt-in request profiling, see core.middleware.RequestProfilerMiddleware;
+# staff users can ask for a capture with `X-Profile: cprofile|sample`, and
+# PROFILE_SAMPLE_RATES maps view labels as in /metrics to the fraction of
+# their requests to capture. List and merge captures with the `profiles`
+# command. PROFILE_MAX_CAPTURES bounds the stored captures (0 keeps all).
+REQUEST_PROFILING = True
+PROFILE_ROOT = os.environ.get('PROFILE_ROOT', '/vol/web/profiles')
+PROFILE_SAMPLE_RATES = {}
+PROFILE_SAMPLE_MODE = 'sample'
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_MAX_CAPTURES = 500
+
+# token -> user resolution cache of core.authentication; the shared tier
+# is a CACHES alias (or None) consulted when the local LRU misses
+TOKEN_AUTH_CACHE_SIZE = 10000
+TOKEN_AUTH_CACHE_TTL = 60
+TOKEN_AUTH_SHARED_CACHE = os.environ.get('TOKEN_AUTH_SHARED_CACHE') or None
+# auth tokens expire TOKEN_TTL seconds after they were last used, and a
+# login after that issues a new one; the stored expiry is moved forward
+# at most every TOKEN_TTL_REFRESH seconds so requests rarely write
+TOKEN_TTL = int(os.environ.get('TOKEN_TTL', 14 * 24 * 3600))
+TOKEN_TTL_REFRESH = int(os.environ.get('TOKEN_TTL_REFRESH', 3600))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -110,6 +244,45 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/2.1/topics/auth/passwords/
+# PASSWORD_HASHER picks the hasher of new passwords; hashes made by the
+# other ones, or with a different cost, still verify and are upgraded on
+# the user's next login
+
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2')
+_PASSWORD_HASHERS = {
+    'argon2': 'core.hashers.Argon2PasswordHasher',
+    'bcrypt': 'core.hashers.BCryptSHA256PasswordHasher',
+    'pbkdf2': 'core.hashers.PBKDF2PasswordHasher',
+}
+if PASSWORD_HASHER not in _PASSWORD_HASHERS:
+    raise ImproperlyConfigured(
+        f'PASSWORD_HASHER must be one of {", ".join(_PASSWORD_HASHERS)}'
+    )
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items()
+    if name != PASSWORD_HASHER
+]
+# memory in KiB; the defaults cost about as much CPU as Django's PBKDF2
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 19456))
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 1))
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PBKDF2_ITERATIONS = int(os.environ.get('PBKDF2_ITERATIONS', 120000))
+
+# attempts at /api/user/token/ per email and per client address, as
+# token buckets of "<burst>/<sec|min|hour|day>" refilled evenly; failed
+# logins spend an attempt, and with none left the request is answered
+# with a 429 before any password is hashed. Buckets are process-local,
+# at most LOGIN_RATE_LIMIT_SIZE of them are kept
+LOGIN_RATE_LIMITS = {
+    'email': os.environ.get('LOGIN_RATE_LIMIT_EMAIL', '5/min'),
+    'ip': os.environ.get('LOGIN_RATE_LIMIT_IP', '30/min'),
+}
+LOGIN_RATE_LIMIT_SIZE = 100000
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.1/topics/i18n/
 
@@ -133,4 +306,49 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# uploads above this size are streamed to a temporary file on disk
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+
+# background processing of uploaded recipe images, see recipe.images;
+# 0 workers processes images inline during the request
+RECIPE_IMAGE_WORKERS = 2
+RECIPE_IMAGE_SIZES = (1200, 600, 300)
+RECIPE_IMAGE_QUALITY = 85
+
+# on-demand recipe thumbnails, see recipe.thumbnails; requested sizes are
+# rounded up to one of these and the cache directory (RECIPE_THUMBNAIL_ROOT,
+# MEDIA_ROOT/thumbnails by default) is kept under
+# RECIPE_THUMBNAIL_CACHE_BYTES by evicting the least recently used files;
+# each process rescans the directory every RECIPE_THUMBNAIL_RESCAN seconds
+# to account for the files other workers wrote
+RECIPE_THUMBNAIL_SIZES = (100, 200, 400, 800)
+RECIPE_THUMBNAIL_CACHE_BYTES = 512 * 1024 * 1024
+RECIPE_THUMBNAIL_RESCAN = 60
+RECIPE_THUMBNAIL_MAX_AGE = 300
+
 AUTH_USER_MODEL = 'core.User'
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    # orjson backed JSON, falling back to the stdlib encoder when missing
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # reverse proxies in front of gunicorn that append to X-Forwarded-For;
+    # client addresses (throttles, login rate limits) are taken from that
+    # many hops back, with 0 REMOTE_ADDR is used and the header ignored
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+if DEBUG:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append(
+        'rest_framework.renderers.BrowsableAPIRenderer'
+    )
@@ -0,0 +1,189 @@
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+
+class RequestTooLarge(Exception):
+    """ the request body is over ASGI_MAX_BODY_SIZE """
+
+
+class ASGIHandler:
+    """ Serve Django over ASGI 3 with request and response I/O off-thread.
+
+    Django 2.1 has neither async views nor an async ORM, so requests are
+    still handled by the regular WSGI handler in a bounded pool of
+    ASGI_THREADS threads. Everything around it happens on the event
+    loop: the body of a request, uploads included, is received before a
+    thread is taken, and a buffered response is sent after the thread is
+    released. Slow clients, idle keep-alive connections and large uploads
+    then cost a coroutine instead of a worker thread. Streaming responses
+    (the recipe export) keep their thread while they are generated.
+    """
+
+    def __init__(self, threads=None):
+        self.wsgi = WSGIHandler()
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads or settings.ASGI_THREADS,
+            thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope {scope["type"]!r}')
+
+        try:
+            body = await self.read_body(scope, receive)
+        except RequestTooLarge:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain'),
+                                    (b'connection', b'close')]})
+            await send({'type': 'http.response.body',
+                        'body': b'Request body too large'})
+            return
+        if body is None:
+            return
+        loop = asyncio.get_event_loop()
+        try:
+            status, headers, content = await loop.run_in_executor(
+                self.executor, self.handle, scope, body, loop, send
+            )
+        finally:
+            body.close()
+        if content is None:
+            return
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, scope, receive):
+        """ the request body in a spooled file, None if the client left.
+
+        Raises RequestTooLarge once the declared or received length goes
+        over ASGI_MAX_BODY_SIZE, before Django gets to check the body.
+        """
+        limit = settings.ASGI_MAX_BODY_SIZE
+        for name, value in scope.get('headers', []):
+            if name == b'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    continue
+                if limit and length > limit:
+                    raise RequestTooLarge()
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        received = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            received += len(chunk)
+            if limit and received > limit:
+                body.close()
+                raise RequestTooLarge()
+            body.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+    def handle(self, scope, body, loop, send):
+        """ run the request in this pool thread.
+
+        Returns (status, headers, body), or a None body once a streaming
+        response has been sent from here.
+        """
+        result = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            result['status'] = int(status.split(' ', 1)[0])
+            result['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in response_headers
+            ]
+
+        response = self.wsgi(environ(scope, body), start_response)
+        try:
+            if not getattr(response, 'streaming', False):
+                return result['status'], result['headers'], b''.join(response)
+
+            def send_now(message):
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+            send_now({'type': 'http.response.start',
+                      'status': result['status'],
+                      'headers': result['headers']})
+            for chunk in response:
+                if chunk:
+                    send_now({'type': 'http.response.body', 'body': chunk,
+                              'more_body': True})
+            send_now({'type': 'http.response.body', 'body': b''})
+            return result['status'], result['headers'], None
+        finally:
+            # fires request_finished in the thread that holds the request's
+            # database connections
+            response.close()
+
+
+def environ(scope, body):
+    """ WSGI environ of an ASGI http scope """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    # PATH_INFO is the decoded path, raw_path keeps the %-escapes
+    path = scope['path']
+    root_path = scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    body.seek(0, 2)
+    length = body.tell()
+    body.seek(0)
+    env = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'CONTENT_LENGTH': str(length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            env['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = f'HTTP_{name}'
+        env[key] = f'{env[key]},{value}' if key in env else value
+    return env
@@ -0,0 +1,255 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core.models import TokenExpiry
+
+
+# never cached, the password hash must not reach the shared cache; a
+# request needing them loads them from the database as deferred fields
+UNCACHED_USER_FIELDS = ('password', 'last_login')
+
+
+class TokenCache:
+    """ Thread-safe, process-local LRU of token key -> cached entry.
+
+    Entries expire after TOKEN_AUTH_CACHE_TTL seconds, which bounds how
+    long another process can keep serving a token that was revoked there.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'TOKEN_AUTH_CACHE_SIZE', 10000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60)
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            self._keys_by_user.setdefault(entry['user_id'], set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def evict(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is None:
+            return
+        user_id = item[1]['user_id']
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+
+token_cache = TokenCache()
+
+
+def _shared_cache():
+    """ the optional cross-process cache tier, None when disabled """
+    alias = getattr(settings, 'TOKEN_AUTH_SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _shared_key(key):
+    return f'authtoken:{key}'
+
+
+def invalidate_token(key):
+    """ forget a single token in every cache tier """
+    token_cache.evict(key)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(_shared_key(key))
+
+
+def invalidate_user(user_id, keys=()):
+    """ forget every cached token of a user """
+    token_cache.evict_user(user_id)
+    shared = _shared_cache()
+    if shared is not None and keys:
+        shared.delete_many([_shared_key(key) for key in keys])
+
+
+def token_ttl():
+    return timedelta(seconds=getattr(settings, 'TOKEN_TTL', 14 * 24 * 3600))
+
+
+def token_expires(token):
+    """ expiry of a token loaded with select_related('expiry') """
+    try:
+        return token.expiry.expires
+    except TokenExpiry.DoesNotExist:
+        # made before its row was, e.g. by a fixture
+        return token.created + token_ttl()
+
+
+def obtain_token(user):
+    """ (token, expiry) to log a user in with.
+
+    The user's token is reused while it is valid and replaced by a new
+    key once it expired.
+    """
+    now = timezone.now()
+    token = Token.objects.select_related('expiry').filter(user=user).first()
+    if token is not None and token_expires(token) > now:
+        expires = now + token_ttl()
+        if not TokenExpiry.objects.filter(token=token) \
+                                  .update(expires=expires):
+            TokenExpiry.objects.get_or_create(
+                token=token, defaults={'expires': expires}
+            )
+        return token, expires
+
+    with transaction.atomic():
+        if token is not None:
+            token.delete()
+        # a concurrent first login may have created it meanwhile
+        token, _ = Token.objects.get_or_create(user=user)
+    return token, token_expires(token)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ Token authentication that caches token -> user resolution.
+
+    Lookups go through the process-local LRU first, then the shared
+    cache named by TOKEN_AUTH_SHARED_CACHE if set, and only then the
+    database. Each request gets its own user instance built from the
+    cached field values, so views are free to modify it.
+
+    The token's expiry is cached along with the user. A token used within
+    TOKEN_TTL_REFRESH seconds of its last extension is not extended again,
+    so only the first request after that interval writes.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None:
+            entry = self._load(key)
+            token_cache.set(key, entry)
+
+        now = timezone.now()
+        if entry['expires'] <= now:
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        refresh = timedelta(seconds=getattr(settings, 'TOKEN_TTL_REFRESH',
+                                            3600))
+        if entry['expires'] < now + token_ttl() - refresh:
+            entry = self._extend(key, entry, now)
+
+        user, token = self._build(key, entry)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return (user, token)
+
+    def _load(self, key):
+        """ resolve the token through the shared cache or the database """
+        shared = _shared_cache()
+        if shared is not None:
+            entry = shared.get(_shared_key(key))
+            if entry is not None:
+                return entry
+
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user', 'expiry') \
+                                 .get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        user = token.user
+        entry = {
+            'db': user._state.db,
+            'user_id': user.pk,
+            'user': {
+                field.attname: getattr(user, field.attname)
+                for field in user._meta.concrete_fields
+                if field.attname not in UNCACHED_USER_FIELDS
+            },
+            'created': token.created,
+            'expires': token_expires(token),
+        }
+        if shared is not None:
+            shared.set(_shared_key(key), entry, token_cache.ttl)
+        return entry
+
+    def _extend(self, key, entry, now):
+        """ slide the expiry of a token in use, return the new entry """
+        expires = now + token_ttl()
+        if not TokenExpiry.objects.filter(token_id=key) \
+                                  .update(expires=expires):
+            try:
+                with transaction.atomic():
+                    TokenExpiry.objects.create(token_id=key, expires=expires)
+            except IntegrityError:
+                # the token was deleted meanwhile
+                return entry
+        entry = dict(entry, expires=expires)
+        token_cache.set(key, entry)
+        shared = _shared_cache()
+        if shared is not None:
+            shared.set(_shared_key(key), entry, token_cache.ttl)
+        return entry
+
+    def _build(self, key, entry):
+        fields = entry['user']
+        user = get_user_model().from_db(
+            entry['db'], list(fields), list(fields.values())
+        )
+        model = self.get_model()
+        token = model.from_db(
+            entry['db'], ['key', 'user_id', 'created'],
+            [key, entry['user_id'], entry['created']]
+        )
+        token.user = user
+        return user, token
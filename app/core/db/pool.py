@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+from collections import deque
+
+# counters kept per database alias, see connection_stats()
+COUNTERS = (
+    'connections_opened',
+    'connections_closed',
+    'checkouts',
+    'pool_waits',
+    'pool_wait_seconds',
+    'pool_wait_max_seconds',
+    'pool_timeouts',
+    'health_check_failures',
+)
+
+_stats = {}
+_stats_lock = threading.Lock()
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """ no connection became free within the pool timeout """
+
+
+def record(alias, **values):
+    """ add `values` to the counters of `alias`, `*_max_*` keep the max """
+    with _stats_lock:
+        stats = _stats.setdefault(alias, dict.fromkeys(COUNTERS, 0))
+        for name, value in values.items():
+            if '_max_' in name:
+                stats[name] = max(stats[name], value)
+            else:
+                stats[name] += value
+
+
+def connection_stats():
+    """ alias -> counters, plus the size of its pool when it has one """
+    with _stats_lock:
+        stats = {alias: dict(values) for alias, values in _stats.items()}
+    with _pools_lock:
+        pools = list(_pools.items())
+    for (alias, pid, _), pool in pools:
+        if pid != os.getpid():
+            continue
+        values = stats.setdefault(alias, dict.fromkeys(COUNTERS, 0))
+        values['pool_size'] = pool.size
+        values['pool_idle'] = len(pool.idle)
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class ConnectionPool:
+    """ Thread-safe, process-local pool of DB-API connections.
+
+    At most `max_size` connections exist at once; a checkout beyond that
+    waits up to `timeout` seconds for a release. Connections older than
+    `max_lifetime` seconds are closed instead of being handed out again,
+    which spreads reconnects out rather than letting every worker renew
+    its connections at once after a database restart.
+
+    `check(connection)` vets an idle connection before it is handed out
+    and `reset(connection)` cleans one up on release; either returning
+    False gets the connection closed.
+    """
+
+    def __init__(self, alias, connect, check=None, reset=None, max_size=10,
+                 timeout=30, max_lifetime=None):
+        self.alias = alias
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.size = 0
+        self.closed = False
+        # (connection, opened at) of the free connections, most recent last
+        self.idle = deque()
+        self._opened = {}
+        self._available = threading.Condition(threading.Lock())
+
+    def acquire(self):
+        """ a free connection, opening one while under `max_size` """
+        start = time.monotonic()
+        while True:
+            connection, opened = self._checkout(start)
+            if connection is None:
+                break
+            if self.check is None or self.check(connection):
+                with self._available:
+                    self._opened[id(connection)] = opened
+                return connection
+            record(self.alias, health_check_failures=1)
+            with self._available:
+                self._discard(connection)
+                self._available.notify()
+
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._available:
+                self.size -= 1
+                self._available.notify()
+            raise
+        record(self.alias, connections_opened=1)
+        with self._available:
+            self._opened[id(connection)] = time.monotonic()
+        return connection
+
+    def _checkout(self, start):
+        """ an idle (connection, opened at), or (None, None) for a new slot """
+        waited = False
+        with self._available:
+            while True:
+                if self.idle:
+                    connection, opened = self.idle.pop()
+                    if not self._expired(opened):
+                        break
+                    self._discard(connection)
+                    continue
+                if self.size < self.max_size:
+                    self.size += 1
+                    connection = opened = None
+                    break
+                remaining = start + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    record(self.alias, pool_timeouts=1)
+                    raise PoolTimeout(
+                        f'No connection to {self.alias!r} became free within '
+                        f'{self.timeout}s ({self.max_size} in use)'
+                    )
+                waited = True
+                self._available.wait(remaining)
+        if waited:
+            wait = time.monotonic() - start
+            record(self.alias, pool_waits=1, pool_wait_seconds=wait,
+                   pool_wait_max_seconds=wait)
+        return connection, opened
+
+    def release(self, connection, discard=False):
+        """ hand `connection` back, closing it when broken or `discard` """
+        if not discard and self.reset is not None:
+            try:
+                discard = not self.reset(connection)
+            except Exception:
+                discard = True
+        with self._available:
+            opened = self._opened.pop(id(connection), None)
+            if opened is None:
+                # not ours, e.g. checked out before the pool was replaced
+                self._close(connection)
+                return
+            if discard or self.closed or self._expired(opened):
+                self._discard(connection)
+            else:
+                self.idle.append((connection, opened))
+            self._available.notify()
+
+    def close(self):
+        """ close the idle connections, checked out ones when released """
+        with self._available:
+            self.closed = True
+            while self.idle:
+                self._discard(self.idle.pop()[0])
+
+    def _expired(self, opened):
+        return (self.max_lifetime is not None and
+                time.monotonic() - opened >= self.max_lifetime)
+
+    def _discard(self, connection):
+        self.size -= 1
+        self._close(connection)
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        record(self.alias, connections_closed=1)
+
+
+def get_pool(alias, params, factory):
+    """ the pool of `alias`, built by `factory` for these connection params.
+
+    A forked worker builds its own pool, leaving the parent's connections
+    alone since closing them would end the parent's sessions, and a pool
+    is replaced when its parameters change (the test runner points the
+    alias at the test database).
+    """
+    key = (alias, os.getpid(), repr(sorted(params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            for other in [k for k in _pools if k[0] == alias]:
+                stale = _pools.pop(other)
+                if other[1] == key[1]:
+                    stale.close()
+            pool = _pools[key] = factory()
+        return pool
+
+
+def close_pools():
+    """ close the idle connections of every pool and forget the pools """
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[1] == os.getpid()]
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,131 @@
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.base import Database
+from psycopg2 import extensions
+
+from core.db import pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """ PostgreSQL backend with health checks, pooling and metrics.
+
+    Reads two extra DATABASES keys:
+
+    * CONN_HEALTH_CHECKS: before the first query of a request a reused
+      connection is pinged and replaced when the server dropped it, so a
+      persistent connection (CONN_MAX_AGE) or a pooled one never fails a
+      request after a database restart or an idle timeout.
+    * POOL: a dict of core.db.pool.ConnectionPool options (MAX_SIZE,
+      TIMEOUT, MAX_LIFETIME). Closing the connection then hands it back to
+      the process-wide pool instead of disconnecting.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        self._pool = None
+        self._discard = False
+
+    @property
+    def pool_options(self):
+        return self.settings_dict.get('POOL')
+
+    def get_new_connection(self, conn_params):
+        pool.record(self.alias, checkouts=1)
+        if not self.pool_options:
+            connection = super().get_new_connection(conn_params)
+            pool.record(self.alias, connections_opened=1)
+            return connection
+
+        self._pool = pool.get_pool(
+            self.alias, conn_params, lambda: self.build_pool(conn_params)
+        )
+        try:
+            connection = self._pool.acquire()
+        except pool.PoolTimeout as exc:
+            raise Database.OperationalError(str(exc))
+        # as the stock backend does after connecting
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def build_pool(self, conn_params):
+        options = self.pool_options
+        return pool.ConnectionPool(
+            self.alias,
+            lambda: Database.connect(**conn_params),
+            check=(check_connection
+                   if self.settings_dict.get('CONN_HEALTH_CHECKS') else None),
+            reset=reset_connection,
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 30),
+            max_lifetime=options.get('MAX_LIFETIME'),
+        )
+
+    def connect(self):
+        # a new connection needs no check, and setting it up calls
+        # ensure_connection() again (ensure_timezone), where a check would
+        # open a transaction before set_autocommit
+        self.health_check_done = True
+        super().connect()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self._pool is None:
+            pool.record(self.alias, connections_closed=1)
+            return super()._close()
+        # a connection closed inside atomic() stays referenced by this
+        # wrapper, so it must not be handed to another thread
+        discard = self._discard or self.in_atomic_block
+        self._pool.release(self.connection, discard=discard)
+        self._pool = None
+        self._discard = False
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if (self.connection is None or self.health_check_done or
+                self.in_atomic_block or
+                not self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            return
+        if not self.is_usable():
+            pool.record(self.alias, health_check_failures=1)
+            self._discard = True
+            self.close()
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        self.close_if_health_check_failed()
+        super().ensure_connection()
+
+
+def check_connection(connection):
+    """ whether the server still answers on `connection` """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+def reset_connection(connection):
+    """ roll back whatever a released connection left open, False if dead """
+    if connection.closed:
+        return False
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
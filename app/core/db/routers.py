@@ -0,0 +1,70 @@
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# alias reads are routed to, None outside of reads_from()
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def choose_replica():
+    """ a random replica alias, None when there are none """
+    aliases = replicas()
+    return random.choice(aliases) if aliases else None
+
+
+@contextmanager
+def reads_from(alias):
+    """ route the reads made inside the block to `alias` """
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _pin_key(user_id):
+    return f'db:primary-pin:{user_id}'
+
+
+def pin_primary(user_id):
+    """ keep the user's reads on the primary while replicas catch up.
+
+    The pin is kept in the default cache, which settings require to be
+    shared between processes when replicas are configured.
+    """
+    timeout = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5)
+    if user_id is not None and timeout and replicas():
+        cache.set(_pin_key(user_id), True, timeout)
+
+
+def is_pinned(user_id):
+    return user_id is not None and bool(cache.get(_pin_key(user_id)))
+
+
+class ReplicaRouter:
+    """ Send the reads of a reads_from() block to a replica.
+
+    Everything else, writes included, goes to `default`, even for
+    instances that were read from a replica. Migrations only run on
+    `default`; replicas receive them through replication.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """ Argon2 with the cost set by the ARGON2_* settings """
+
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    """ bcrypt with the work factor set by BCRYPT_ROUNDS """
+
+    @property
+    def rounds(self):
+        return settings.BCRYPT_ROUNDS
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """ PBKDF2-SHA256 with the iterations set by PBKDF2_ITERATIONS """
+
+    @property
+    def iterations(self):
+        return settings.PBKDF2_ITERATIONS
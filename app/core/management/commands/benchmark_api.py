@@ -0,0 +1,345 @@
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmark_baseline.json')
+# baseline entries stored under this key apply to every scale
+ALL_SCALES = '*'
+METRICS = ('queries', 'p50_ms', 'p95_ms', 'peak_kb')
+BATCH_SIZE = 5000
+BULK_ITEMS = 100
+TAGS_PER_RECIPE = 3
+INGREDIENTS_PER_RECIPE = 5
+
+# setup runs untimed before each request and returns the state the
+# request needs; request returns the response
+Case = namedtuple('Case', ('name', 'setup', 'request'))
+
+
+def percentile(values, pct):
+    """ nearest-rank percentile of a list of numbers """
+    ordered = sorted(values)
+    index = max(0, int(round(pct / 100.0 * len(ordered))) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def sample_image():
+    """ return a small in-memory JPEG upload """
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64)).save(buffer, format='JPEG')
+    buffer.name = 'bench.jpg'
+    buffer.seek(0)
+    return buffer
+
+
+def consume(response):
+    """ read a streamed response so its generation is measured """
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+class Command(BaseCommand):
+    """ Django command to benchmark the API against stored baselines """
+    help = (
+        'Seed synthetic data and record query count, latency and peak '
+        'memory for every API endpoint, failing on baseline regressions'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=int, action='append', dest='scales',
+            help='Number of recipes to seed; repeatable (default 1k/10k/100k)'
+        )
+        parser.add_argument(
+            '--users', type=int, default=4,
+            help='Number of users the seeded recipes are spread across'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Number of timed requests per endpoint'
+        )
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Allowed relative slack for latency and memory metrics'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Write the measured metrics to the baseline file'
+        )
+
+    def handle(self, *args, **options):
+        """ Handle the command """
+        scales = options['scales'] or [1000, 10000, 100000]
+        results = {}
+        for scale in scales:
+            self.stdout.write(f'Benchmarking scale {scale}')
+            results[str(scale)] = self.run_scale(
+                scale, options['users'], options['repeat']
+            )
+            self.report(results[str(scale)])
+
+        if options['save_baseline']:
+            self.save_baseline(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS('Baseline saved'))
+            return
+
+        failures = self.compare(
+            self.load_baseline(options['baseline']),
+            results,
+            options['tolerance']
+        )
+        if failures:
+            for failure in failures:
+                self.stderr.write(failure)
+            raise CommandError(f'{len(failures)} benchmark regression(s)')
+        self.stdout.write(self.style.SUCCESS('Benchmarks within baseline'))
+
+    def run_scale(self, scale, users, repeat):
+        """ seed data for one scale, measure every case and roll back """
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root,
+                                  RECIPE_IMAGE_WORKERS=0,
+                                  ALLOWED_HOSTS=['testserver']), \
+                transaction.atomic():
+            user = self.seed(scale, users)
+            client = APIClient()
+            token = Token.objects.create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+            results = {}
+            for case in self.cases(user):
+                results[case.name] = self.measure(client, case, repeat)
+            transaction.set_rollback(True)
+        return results
+
+    def seed(self, scale, users):
+        """ create users owning `scale` recipes with tags and ingredients """
+        owners = [
+            get_user_model().objects.create_user(
+                f'bench{i}@example.com', 'benchpass', name=f'Bench {i}'
+            )
+            for i in range(max(users, 1))
+        ]
+        per_user = max(scale // len(owners), 1)
+        attrs_per_user = max(per_user // 10, INGREDIENTS_PER_RECIPE)
+        for owner in owners:
+            tag_ids = self._bulk_ids(Tag, [
+                Tag(user=owner, name=f'tag {i}')
+                for i in range(attrs_per_user)
+            ], owner)
+            ingredient_ids = self._bulk_ids(Ingredient, [
+                Ingredient(user=owner, name=f'ingredient {i}')
+                for i in range(attrs_per_user)
+            ], owner)
+            recipe_ids = self._bulk_ids(Recipe, [
+                Recipe(user=owner, title=f'recipe {i}', time_minutes=i % 90,
+                       price='9.99')
+                for i in range(per_user)
+            ], owner)
+            self._bulk_links(Recipe.tags.through, 'tag_id',
+                             recipe_ids, tag_ids, TAGS_PER_RECIPE)
+            self._bulk_links(Recipe.ingredients.through, 'ingredient_id',
+                             recipe_ids, ingredient_ids,
+                             INGREDIENTS_PER_RECIPE)
+        return owners[0]
+
+    def _bulk_ids(self, model, objs, owner):
+        model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+        return list(model.objects.filter(user=owner)
+                    .order_by('id').values_list('id', flat=True))
+
+    def _bulk_links(self, through, column, recipe_ids, target_ids, per):
+        rows = []
+        for i, recipe_id in enumerate(recipe_ids):
+            for j in range(per):
+                target = target_ids[(i + j) % len(target_ids)]
+                rows.append(through(recipe_id=recipe_id, **{column: target}))
+            if len(rows) >= BATCH_SIZE:
+                through.objects.bulk_create(rows)
+                rows = []
+        through.objects.bulk_create(rows)
+
+    def cases(self, user):
+        """ one case per endpoint exposed by the recipe and user urls """
+        recipe = Recipe.objects.filter(user=user).order_by('-id').first()
+        tag_ids = list(recipe.tags.values_list('id', flat=True))
+        ingredient_ids = list(recipe.ingredients.values_list('id', flat=True))
+        detail = reverse('recipe:recipe-detail', args=[recipe.id])
+        payload = {
+            'title': 'Benchmark recipe',
+            'time_minutes': 10,
+            'price': '5.00',
+            'tags': tag_ids,
+            'ingredients': ingredient_ids,
+        }
+        bulk_payload = [
+            dict(payload, title=f'Bulk recipe {i}') for i in range(BULK_ITEMS)
+        ]
+        counter = iter(range(10 ** 9))
+
+        def new_recipe():
+            return Recipe.objects.create(
+                user=user, title='to delete', time_minutes=1, price='1.00'
+            )
+
+        def new_email():
+            return f'new{next(counter)}@example.com'
+
+        return [
+            Case('api-root', None, lambda c, _: c.get(
+                reverse('recipe:api-root'))),
+            Case('tag-list', None, lambda c, _: c.get(
+                reverse('recipe:tag-list'))),
+            Case('tag-list-assigned', None, lambda c, _: c.get(
+                reverse('recipe:tag-list'), {'assigned_only': 1})),
+            Case('tag-create', None, lambda c, _: c.post(
+                reverse('recipe:tag-list'), {'name': 'bench tag'})),
+            Case('ingredient-list', None, lambda c, _: c.get(
+                reverse('recipe:ingredient-list'))),
+            Case('ingredient-list-assigned', None, lambda c, _: c.get(
+                reverse('recipe:ingredient-list'), {'assigned_only': 1})),
+            Case('ingredient-create', None, lambda c, _: c.post(
+                reverse('recipe:ingredient-list'), {'name': 'bench ing'})),
+            Case('recipe-list', None, lambda c, _: c.get(
+                reverse('recipe:recipe-list'))),
+            Case('recipe-list-filtered', None, lambda c, _: c.get(
+                reverse('recipe:recipe-list'),
+                {'tags': ','.join(str(i) for i in tag_ids)})),
+            Case('recipe-list-facets', None, lambda c, _: c.get(
+                reverse('recipe:recipe-list'), {'facets': 1})),
+            Case('recipe-search', None, lambda c, _: c.get(
+                reverse('recipe:recipe-list'), {'search': 'recipe'})),
+            Case('recipe-export', None, lambda c, _: consume(c.get(
+                reverse('recipe:recipe-export')))),
+            Case('recipe-export-csv', None, lambda c, _: consume(c.get(
+                reverse('recipe:recipe-export'), {'type': 'csv'}))),
+            Case('recipe-create', None, lambda c, _: c.post(
+                reverse('recipe:recipe-list'), payload, format='json')),
+            Case('recipe-bulk-create', None, lambda c, _: c.post(
+                reverse('recipe:recipe-bulk'), bulk_payload, format='json')),
+            Case('recipe-detail', None, lambda c, _: c.get(detail)),
+            Case('recipe-update', None, lambda c, _: c.put(
+                detail, payload, format='json')),
+            Case('recipe-partial-update', None, lambda c, _: c.patch(
+                detail, {'title': 'Patched'}, format='json')),
+            Case('recipe-delete', new_recipe, lambda c, obj: c.delete(
+                reverse('recipe:recipe-detail', args=[obj.id]))),
+            Case('recipe-upload-image', sample_image, lambda c, img: c.post(
+                reverse('recipe:recipe-upload-image', args=[recipe.id]),
+                {'image': img}, format='multipart')),
+            Case('recipe-image', None, lambda c, _: c.get(
+                reverse('recipe:recipe-image', args=[recipe.id]),
+                {'size': 100})),
+            Case('user-create', new_email, lambda c, email: APIClient().post(
+                reverse('user:create'),
+                {'email': email, 'password': 'benchpass', 'name': 'New'})),
+            Case('user-token', None, lambda c, _: APIClient().post(
+                reverse('user:token'),
+                {'email': user.email, 'password': 'benchpass'})),
+            Case('user-me', None, lambda c, _: c.get(reverse('user:me'))),
+            Case('user-me-update', None, lambda c, _: c.patch(
+                reverse('user:me'), {'name': 'Bench'})),
+        ]
+
+    def measure(self, client, case, repeat):
+        """ time `repeat` requests, then capture queries and peak memory """
+        timings = []
+        for _ in range(repeat):
+            state = case.setup() if case.setup else None
+            start = time.perf_counter()
+            res = case.request(client, state)
+            timings.append((time.perf_counter() - start) * 1000)
+            if res.status_code >= 400:
+                raise CommandError(
+                    f'{case.name} returned {res.status_code}: {res.content!r}'
+                )
+
+        state = case.setup() if case.setup else None
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                case.request(client, state)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'queries': len(ctx.captured_queries),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'peak_kb': round(peak / 1024.0, 1),
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"endpoint":<28}{"queries":>8}{"p50 ms":>10}'
+            f'{"p95 ms":>10}{"peak kb":>10}'
+        )
+        for name, metrics in results.items():
+            self.stdout.write(
+                f'{name:<28}{metrics["queries"]:>8}{metrics["p50_ms"]:>10}'
+                f'{metrics["p95_ms"]:>10}{metrics["peak_kb"]:>10}'
+            )
+
+    def load_baseline(self, path):
+        try:
+            with open(path) as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            raise CommandError(f'No benchmark baseline at {path}')
+
+    def save_baseline(self, path, results):
+        try:
+            baseline = self.load_baseline(path)
+        except CommandError:
+            baseline = {}
+        baseline.update(results)
+        with open(path, 'w') as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+
+    def compare(self, baseline, results, tolerance):
+        """ return a message for every metric past its baseline """
+        failures = []
+        for scale, cases in results.items():
+            for name, metrics in cases.items():
+                for metric in METRICS:
+                    limit = self._limit(baseline, scale, name, metric)
+                    if limit is None:
+                        continue
+                    if metric != 'queries':
+                        limit = limit * (1 + tolerance)
+                    if metrics[metric] > limit:
+                        failures.append(
+                            f'[{scale}] {name} {metric}: '
+                            f'{metrics[metric]} > {limit}'
+                        )
+        return failures
+
+    def _limit(self, baseline, scale, name, metric):
+        for key in (scale, ALL_SCALES):
+            value = baseline.get(key, {}).get(name, {}).get(metric)
+            if value is not None:
+                return value
+        return None
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.management.commands.benchmark_api import percentile
+
+
+class HTTPError(Exception):
+    """ the server sent something that is not an HTTP/1.1 response """
+
+
+async def read_response(reader):
+    """ (status, keep alive) of the next response, its body consumed """
+    status_line = await reader.readline()
+    if not status_line:
+        raise HTTPError('connection closed')
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        raise HTTPError(f'bad status line {status_line!r}')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+class Target:
+    """ one server under test, and what its connections measured """
+
+    def __init__(self, name, url, token):
+        parts = urlsplit(url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError(f'{url} is not an http:// URL')
+        self.name = name
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        headers = [f'GET {path} HTTP/1.1', f'Host: {parts.netloc}',
+                   'Connection: keep-alive']
+        if token:
+            headers.append(f'Authorization: Token {token}')
+        self.request = ('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1')
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+
+    async def connection(self, delay, measure_from, deadline):
+        """ one client connection sending requests back to back """
+        loop = asyncio.get_event_loop()
+        await asyncio.sleep(delay)
+        reader = writer = None
+        while loop.time() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(
+                        self.host, self.port
+                    )
+                start = time.perf_counter()
+                writer.write(self.request)
+                status, keep_alive = await read_response(reader)
+            except (OSError, HTTPError, asyncio.IncompleteReadError):
+                self.errors += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                await asyncio.sleep(0.05)
+                continue
+            # only requests done once every connection is open count
+            if loop.time() >= measure_from:
+                self.latencies.append(time.perf_counter() - start)
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+            if not keep_alive:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    async def run(self, connections, duration, ramp_up):
+        """ connect over `ramp_up` seconds, then measure for `duration` """
+        loop = asyncio.get_event_loop()
+        measure_from = loop.time() + ramp_up
+        await asyncio.gather(*(
+            self.connection(ramp_up * index / connections, measure_from,
+                            measure_from + duration)
+            for index in range(connections)
+        ))
+
+
+class Command(BaseCommand):
+    """ Django command to load servers with many concurrent connections """
+    help = (
+        'Open many keep-alive connections to each target (NAME=URL) and '
+        'send requests back to back for a while, then compare throughput '
+        'and latency, e.g. a WSGI and an ASGI deployment of the same '
+        'endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets', nargs='+', metavar='NAME=URL',
+            help='e.g. wsgi=http://localhost:8000/api/recipe/recipes/'
+        )
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Seconds of measured load per target'
+        )
+        parser.add_argument(
+            '--ramp-up', type=float, default=5,
+            help='Seconds over which the connections are opened'
+        )
+        parser.add_argument('--token', help='API token sent with requests')
+
+    def handle(self, *args, **options):
+        """ Handle the command """
+        targets = []
+        for target in options['targets']:
+            name, sep, url = target.partition('=')
+            if not sep:
+                raise CommandError(f'{target} is not NAME=URL')
+            targets.append(Target(name, url, options['token']))
+
+        for target in targets:
+            self.stdout.write(
+                f'Loading {target.name} with {options["connections"]} '
+                f'connections for {options["duration"]:g}s'
+            )
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(target.run(
+                    options['connections'], options['duration'],
+                    options['ramp_up']
+                ))
+            finally:
+                loop.close()
+        self.report(targets, options['duration'])
+
+    def report(self, targets, seconds):
+        self.stdout.write(
+            f'{"target":12} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} '
+            f'{"p99 ms":>9} {"errors":>7} {"non-2xx":>8}'
+        )
+        for target in targets:
+            latencies = [value * 1000 for value in target.latencies] or [0]
+            failed = sum(count for status, count in target.statuses.items()
+                         if not 200 <= status < 300)
+            self.stdout.write(
+                f'{target.name:12} {len(target.latencies) / seconds:9.1f} '
+                f'{percentile(latencies, 50):9.1f} '
+                f'{percentile(latencies, 95):9.1f} '
+                f'{percentile(latencies, 99):9.1f} '
+                f'{target.errors:7} {failed:8}'
+            )
@@ -0,0 +1,151 @@
+import asyncio
+import multiprocessing
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.management.commands.benchmark_concurrency import Target
+
+CONFIG = os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout):
+    """ wait until the server accepts connections """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(
+                f'gunicorn exited with status {process.returncode}'
+            )
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError(f'gunicorn did not listen on {port} in {timeout}s')
+
+
+def children_cpu_seconds():
+    """ user + system CPU time of reaped child processes so far """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Command(BaseCommand):
+    """ Django command to measure WSGI throughput per worker and core """
+    help = (
+        'Start gunicorn with the production profile (gunicorn.conf.py) for '
+        'each worker count, load a URL path with concurrent connections and '
+        'report throughput per worker and per CPU second the server used'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='/api/recipe/recipes/',
+            help='Path requested on the started server'
+        )
+        parser.add_argument(
+            '--workers', type=int, nargs='+',
+            default=[1, multiprocessing.cpu_count()],
+            help='Worker counts to measure, one server each'
+        )
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument(
+            '--worker-class', default='gthread', choices=('gthread', 'sync')
+        )
+        parser.add_argument('--connections', type=int, default=64)
+        parser.add_argument(
+            '--duration', type=float, default=20,
+            help='Seconds of measured load per worker count'
+        )
+        parser.add_argument('--ramp-up', type=float, default=2)
+        parser.add_argument('--token', help='API token sent with requests')
+        parser.add_argument(
+            '--startup-timeout', type=float, default=30,
+            help='Seconds to wait for the server to listen'
+        )
+
+    def handle(self, *args, **options):
+        """ Handle the command """
+        if not options['path'].startswith('/'):
+            raise CommandError(f'{options["path"]} is not a path')
+        results = []
+        for workers in options['workers']:
+            if workers < 1:
+                raise CommandError('worker counts must be at least 1')
+            self.stdout.write(
+                f'Loading {workers} {options["worker_class"]} worker(s) with '
+                f'{options["connections"]} connections for '
+                f'{options["duration"]:g}s'
+            )
+            results.append((workers,) + self.measure(workers, options))
+        self.report(results, options['duration'])
+
+    def measure(self, workers, options):
+        """ (target, server CPU seconds) of one gunicorn run """
+        port = free_port()
+        env = dict(
+            os.environ,
+            GUNICORN_BIND=f'127.0.0.1:{port}',
+            GUNICORN_WORKERS=str(workers),
+            GUNICORN_THREADS=str(options['threads']),
+            GUNICORN_WORKER_CLASS=options['worker_class'],
+            GUNICORN_ACCESS_LOG='off',
+            GUNICORN_LOG_LEVEL='warning',
+            # recycling would restart workers mid measurement
+            GUNICORN_MAX_REQUESTS='0',
+        )
+        cpu_before = children_cpu_seconds()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', CONFIG, 'app.wsgi'],
+            cwd=settings.BASE_DIR, env=env
+        )
+        try:
+            wait_for_port(port, process, options['startup_timeout'])
+            target = Target(f'{workers}w', f'http://127.0.0.1:{port}'
+                            f'{options["path"]}', options['token'])
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(target.run(
+                    options['connections'], options['duration'],
+                    options['ramp_up']
+                ))
+            finally:
+                loop.close()
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+        # includes the start up and ramp up, so it slightly overstates the
+        # CPU time spent on the measured requests
+        return target, children_cpu_seconds() - cpu_before
+
+    def report(self, results, seconds):
+        cores = multiprocessing.cpu_count()
+        self.stdout.write(f'{cores} CPU core(s) available')
+        self.stdout.write(
+            f'{"workers":>7} {"req/s":>9} {"/worker":>9} {"/core":>9} '
+            f'{"cpu s":>7} {"req/cpu s":>9} {"errors":>7} {"non-2xx":>8}'
+        )
+        for workers, target, cpu in results:
+            rate = len(target.latencies) / seconds
+            failed = sum(count for status, count in target.statuses.items()
+                         if not 200 <= status < 300)
+            self.stdout.write(
+                f'{workers:7} {rate:9.1f} {rate / workers:9.1f} '
+                f'{rate / min(workers, cores):9.1f} {cpu:7.1f} '
+                f'{len(target.latencies) / cpu if cpu else 0:9.1f} '
+                f'{target.errors:7} {failed:8}'
+            )
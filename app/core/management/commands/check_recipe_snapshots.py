@@ -0,0 +1,65 @@
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import snapshots
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """ Django command to compare recipe snapshots with the M2M tables """
+    help = (
+        'Rebuild the tag and ingredient snapshot of every recipe from the '
+        'through tables and report the recipes whose stored copy differs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Store the rebuilt snapshot of the recipes that differ'
+        )
+        parser.add_argument(
+            '--user', metavar='EMAIL', help='Only check this user\'s recipes'
+        )
+        parser.add_argument('--batch-size', type=int,
+                            default=snapshots.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        """ Handle the command """
+        recipes = Recipe.objects.order_by('id')
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(email=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'No user with email {options["user"]}')
+            recipes = recipes.filter(user=user)
+
+        rows = recipes.values_list('id', 'related_snapshot') \
+                      .iterator(chunk_size=options['batch_size'])
+        checked = stale = 0
+        while True:
+            batch = dict(islice(rows, options['batch_size']))
+            if not batch:
+                break
+            expected = snapshots.build(list(batch))
+            differs = {
+                pk: snapshot for pk, snapshot in expected.items()
+                if batch[pk] != snapshot
+            }
+            for pk in differs:
+                self.stdout.write(f'Recipe {pk}: stale snapshot')
+            if differs and options['fix']:
+                snapshots.write(differs)
+            checked += len(batch)
+            stale += len(differs)
+
+        if stale and not options['fix']:
+            raise CommandError(
+                f'{stale} of {checked} recipe snapshots are stale, '
+                f'run with --fix to rebuild them'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} recipes, {stale} rebuilt' if stale
+            else f'Checked {checked} recipes, all consistent'
+        ))
@@ -0,0 +1,210 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Tag, Ingredient, Recipe
+from recipe import bulk
+
+SCALAR_FIELDS = ('title', 'time_minutes', 'price', 'link')
+# record key -> model of the names it lists
+RELATED_MODELS = (('tags', Tag), ('ingredients', Ingredient))
+
+
+def read_records(fp, file_format):
+    """ yield the records of a file, CSV rows or raw NDJSON lines """
+    if file_format == 'csv':
+        yield from csv.DictReader(fp)
+        return
+    for line in fp:
+        if line.strip():
+            yield line
+
+
+def parse_names(value, model):
+    """ tag or ingredient names, a list or a JSON array as exported """
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, list):
+        raise ValueError('expected a list of names')
+    field = model._meta.get_field('name')
+    return [
+        field.clean(str(name).strip(), None)
+        for name in value if str(name).strip()
+    ]
+
+
+def parse_record(record):
+    """ validated recipe fields and related names of one record """
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError('expected an object')
+    item = {}
+    for name in SCALAR_FIELDS:
+        field = Recipe._meta.get_field(name)
+        value = record.get(name)
+        if value is None and field.blank:
+            value = ''
+        item[name] = field.clean(value, None)
+    for name, model in RELATED_MODELS:
+        item[name] = parse_names(record.get(name), model)
+    return item
+
+
+class Command(BaseCommand):
+    """ Django command to load recipes from an NDJSON or CSV file """
+    help = (
+        'Stream recipes from an NDJSON or CSV export into the account of a '
+        'user, creating missing tags and ingredients by name. Progress is '
+        'saved after every committed batch so an interrupted import can be '
+        'resumed; at most the batch in flight is loaded twice.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--user', required=True, metavar='EMAIL',
+            help='Email of the user the recipes are imported for'
+        )
+        parser.add_argument(
+            '--format', choices=('ndjson', 'csv'),
+            help='File format, guessed from the extension by default'
+        )
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--method', choices=('auto', 'copy', 'insert'), default='auto',
+            help='Load with PostgreSQL COPY or batched INSERTs'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Skip the records a previous run already committed'
+        )
+        parser.add_argument(
+            '--state-file',
+            help='Where progress is kept (default: PATH.import-state)'
+        )
+        parser.add_argument(
+            '--skip-invalid', action='store_true',
+            help='Report and skip invalid records instead of stopping'
+        )
+
+    def handle(self, *args, **options):
+        """ Handle the command """
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'ndjson'
+        )
+        state_file = options['state_file'] or f'{path}.import-state'
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["user"]}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        method = options['method']
+        if method == 'auto':
+            method = 'copy' if connection.vendor == 'postgresql' else 'insert'
+        if method == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('COPY needs PostgreSQL')
+        self.load = (bulk.copy_recipes if method == 'copy'
+                     else bulk.create_recipes)
+
+        done = 0
+        if options['resume']:
+            done = self.read_state(state_file, path, user)
+            self.stdout.write(f'Resuming after {done} records')
+        self.names = {
+            name: dict(model.objects.filter(user=user)
+                       .values_list('name', 'id'))
+            for name, model in RELATED_MODELS
+        }
+
+        imported = skipped = 0
+        start = time.perf_counter()
+        with open(path, newline='', encoding='utf-8') as fp:
+            records = islice(read_records(fp, file_format), done, None)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                items = []
+                for offset, record in enumerate(batch, done + 1):
+                    try:
+                        items.append(parse_record(record))
+                    except (ValidationError, ValueError, TypeError) as exc:
+                        message = f'Record {offset}: {exc}'
+                        if not options['skip_invalid']:
+                            raise CommandError(message)
+                        self.stderr.write(message)
+                        skipped += 1
+
+                with transaction.atomic():
+                    self.resolve_names(user, items)
+                    if items:
+                        self.load(user, items)
+                done += len(batch)
+                imported += len(items)
+                self.write_state(state_file, path, user, done)
+
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{imported} recipes imported, {skipped} skipped '
+                    f'({imported / max(elapsed, 1e-9):.0f} recipes/s)'
+                )
+
+        if os.path.exists(state_file):
+            os.remove(state_file)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes in '
+            f'{time.perf_counter() - start:.1f}s'
+        ))
+
+    def resolve_names(self, user, items):
+        """ swap tag and ingredient names for ids, creating missing ones """
+        for name, model in RELATED_MODELS:
+            ids = self.names[name]
+            missing = list(dict.fromkeys(
+                value for item in items for value in item[name]
+                if value not in ids
+            ))
+            if missing:
+                created = bulk.create_attrs(
+                    model, user, [{'name': value} for value in missing]
+                )
+                ids.update(zip(missing, created))
+            for item in items:
+                item[name] = [ids[value] for value in item[name]]
+
+    def read_state(self, state_file, path, user):
+        try:
+            with open(state_file) as fp:
+                state = json.load(fp)
+        except FileNotFoundError:
+            return 0
+        if state.get('path') != os.path.abspath(path) or \
+                state.get('user') != user.pk:
+            raise CommandError(
+                f'{state_file} belongs to another import, remove it first'
+            )
+        return state['records']
+
+    def write_state(self, state_file, path, user, records):
+        """ record progress, replacing the file so it is never partial """
+        tmp = f'{state_file}.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump({
+                'path': os.path.abspath(path),
+                'user': user.pk,
+                'records': records,
+            }, fp)
+        os.replace(tmp, state_file)
@@ -0,0 +1,111 @@
+import io
+import pstats
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    """ Django command to list and merge captured request profiles """
+    help = (
+        'List the request profiles captured by RequestProfilerMiddleware, '
+        'or aggregate the matching ones: cProfile captures into one pstats '
+        'report (and dump with --output), sampled ones into one folded '
+        'stack file for flamegraph.pl or speedscope.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('list', 'aggregate'))
+        parser.add_argument('--view', help='Only captures of this view')
+        parser.add_argument('--mode', choices=sorted(profiling.MODES))
+        parser.add_argument(
+            '--last', type=int,
+            help='Only the newest N matching captures'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the merged pstats dump or folded stacks here'
+        )
+        parser.add_argument(
+            '--sort', default='cumulative',
+            help='pstats sort key of the cProfile report'
+        )
+        parser.add_argument('--limit', type=int, default=30,
+                            help='Rows of the report')
+
+    def handle(self, *args, **options):
+        """ Handle the command """
+        found = [
+            meta for meta in profiling.captures()
+            if options['view'] in (None, meta.get('view')) and
+            options['mode'] in (None, meta['mode'])
+        ]
+        if options['last']:
+            found = found[-options['last']:]
+        if options['action'] == 'list':
+            self.list(found)
+            return
+        if not found:
+            raise CommandError('No matching captures')
+
+        modes = {meta['mode'] for meta in found}
+        if len(modes) > 1:
+            raise CommandError(
+                'Captures of both modes match, pick one with --mode'
+            )
+        if modes == {'sample'}:
+            self.aggregate_samples(found, options)
+        else:
+            self.aggregate_profiles(found, options)
+
+    def list(self, found):
+        for meta in found:
+            started = datetime.fromtimestamp(meta['started'], timezone.utc)
+            self.stdout.write(
+                f'{meta["id"]}  {started:%Y-%m-%d %H:%M:%S}  '
+                f'{meta["duration"] * 1000:8.1f} ms  {meta["mode"]:8}  '
+                f'{meta.get("view", "-")}  {meta.get("method", "")} '
+                f'{meta.get("path", "")}'
+            )
+        self.stdout.write(f'{len(found)} captures')
+
+    def aggregate_profiles(self, found, options):
+        """ merged pstats of the cProfile captures """
+        stream = io.StringIO()
+        stats = pstats.Stats(found[0]['path'], stream=stream)
+        for meta in found[1:]:
+            stats.add(meta['path'])
+        if options['output']:
+            stats.dump_stats(options['output'])
+        stats.strip_dirs().sort_stats(options['sort']) \
+             .print_stats(options['limit'])
+        self.stdout.write(f'{len(found)} captures merged')
+        self.stdout.write(stream.getvalue())
+
+    def aggregate_samples(self, found, options):
+        """ summed folded stacks, and the leaf frames seen most often """
+        stacks = Counter()
+        for meta in found:
+            with open(meta['path']) as fp:
+                for line in fp:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    stacks[stack] += int(count)
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                for stack, count in stacks.most_common():
+                    fp.write(f'{stack} {count}\n')
+
+        total = sum(stacks.values())
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rpartition(';')[2]] += count
+        self.stdout.write(
+            f'{len(found)} captures merged, {total} samples'
+        )
+        for frame, count in leaves.most_common(options['limit']):
+            self.stdout.write(
+                f'{count / max(total, 1):6.1%}  {count:6}  {frame}'
+            )
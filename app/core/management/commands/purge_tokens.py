@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.models import TokenExpiry
+
+
+class Command(BaseCommand):
+    """ Django command to delete expired auth tokens """
+    help = (
+        'Delete the auth tokens that expired, oldest first, in batches '
+        'that each commit on their own so the table is never locked for '
+        'long'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        """ Handle the command """
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        now = timezone.now()
+        expired = TokenExpiry.objects.filter(expires__lte=now) \
+                                     .order_by('expires') \
+                                     .values_list('token_id', flat=True)
+        total = 0
+        while True:
+            keys = list(expired[:batch_size])
+            if not keys:
+                break
+            # the expiry rows go with their token
+            Token.objects.filter(key__in=keys).delete()
+            total += len(keys)
+            self.stdout.write(f'Deleted {total} expired tokens')
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {total} tokens expired before {now:%Y-%m-%d %H:%M}'
+        ))
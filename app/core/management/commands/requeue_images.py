@@ -0,0 +1,32 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from recipe import images
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """ Django command to process the recipe images left unprocessed """
+    help = (
+        'Process the recipe images still pending or processing, e.g. after '
+        'the server exited with image jobs queued. Run it while no server '
+        'is up, or images being processed may be done twice'
+    )
+
+    def handle(self, *args, **options):
+        """ Handle the command """
+        recipe_ids = images.stale_recipe_ids()
+        failed = 0
+        for recipe_id in recipe_ids:
+            try:
+                images.process_image(recipe_id)
+            except Exception:
+                logger.exception('Processing image of recipe %s failed',
+                                 recipe_id)
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(recipe_ids) - failed} of {len(recipe_ids)} '
+            f'stale recipe images'
+        ))
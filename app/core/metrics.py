@@ -0,0 +1,221 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+from core.db import pool
+
+# timing of the request being handled, see core.middleware
+current_timing = contextvars.ContextVar('current_timing', default=None)
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                16777216)
+
+
+class RequestTiming:
+    """ what one request spent, filled in while it is handled """
+    __slots__ = ('view', 'queries', 'db_seconds', 'serialize_seconds',
+                 'serializing')
+
+    def __init__(self):
+        self.view = 'unmatched'
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.serializing = False
+
+    def record_query(self, execute, sql, params, many, context):
+        """ execute_wrapper counting and timing every query """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class TimedSerializerMixin:
+    """ add the time spent representing objects to the serializer time.
+
+    Only the outermost serializer is timed, so nested serializers are not
+    counted twice; queries made while representing are counted both here
+    and as database time.
+    """
+
+    def to_representation(self, instance):
+        timing = current_timing.get()
+        if timing is None or timing.serializing:
+            return super().to_representation(instance)
+        timing.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timing.serialize_seconds += time.perf_counter() - start
+            timing.serializing = False
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    """ monotonically increasing count per label values """
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """ distribution of observations over fixed cumulative buckets """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = \
+                    [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self._series.items()
+            )
+        names = self.labelnames + ('le',)
+        bounds = [_format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       _format_labels(names, labels + (bound,)), cumulative)
+            yield (f'{self.name}_sum',
+                   _format_labels(self.labelnames, labels), total)
+            yield (f'{self.name}_count',
+                   _format_labels(self.labelnames, labels), cumulative)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+REQUESTS = Counter(
+    'http_requests_total', 'Requests handled, by view and status code.',
+    ('view', 'status')
+)
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Wall time of requests.',
+    TIME_BUCKETS, ('view',)
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request.',
+    QUERY_BUCKETS, ('view',)
+)
+DB_SECONDS = Histogram(
+    'http_request_db_duration_seconds', 'Database time per request.',
+    TIME_BUCKETS, ('view',)
+)
+SERIALIZE_SECONDS = Histogram(
+    'http_request_serialize_duration_seconds',
+    'Serializer representation time per request.', TIME_BUCKETS, ('view',)
+)
+RESPONSE_BYTES = Histogram(
+    'http_response_size_bytes', 'Size of non-streaming response bodies.',
+    SIZE_BUCKETS, ('view',)
+)
+METRICS = (REQUESTS, REQUEST_SECONDS, DB_QUERIES, DB_SECONDS,
+           SERIALIZE_SECONDS, RESPONSE_BYTES)
+
+
+def observe(timing, seconds, status, size):
+    """ record one handled request """
+    labels = (timing.view,)
+    REQUESTS.inc((timing.view, status))
+    REQUEST_SECONDS.observe(seconds, labels)
+    DB_QUERIES.observe(timing.queries, labels)
+    DB_SECONDS.observe(timing.db_seconds, labels)
+    SERIALIZE_SECONDS.observe(timing.serialize_seconds, labels)
+    if size is not None:
+        RESPONSE_BYTES.observe(size, labels)
+
+
+def clear():
+    for metric in METRICS:
+        metric.clear()
+
+
+def _connection_lines():
+    """ the core.db.pool counters of this process, by database alias """
+    stats = pool.connection_stats()
+    names = sorted({name for values in stats.values() for name in values})
+    for name in names:
+        counter = name in pool.COUNTERS and '_max_' not in name
+        metric = f'db_{name}' + ('_total' if counter else '')
+        yield f'# TYPE {metric} {"counter" if counter else "gauge"}'
+        for alias in sorted(stats):
+            if name in stats[alias]:
+                yield '{}{} {}'.format(
+                    metric, _format_labels(('alias',), (alias,)),
+                    _format_value(stats[alias][name])
+                )
+
+
+def render():
+    """ every metric of this process in the Prometheus text format """
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {_format_value(value)}')
+    lines.extend(_connection_lines())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,152 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from core import metrics, profiling
+from core.authentication import CachedTokenAuthentication
+
+logger = logging.getLogger(__name__)
+
+
+def view_name(view_func, method):
+    """ `ViewClass.action` label of a resolved view """
+    cls = getattr(view_func, 'cls', None) or \
+        getattr(view_func, 'view_class', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+class RequestMetricsMiddleware:
+    """ Time requests and record them per view, see core.metrics.
+
+    Wall time covers the middleware below this one, so it belongs first
+    in MIDDLEWARE. Queries on every database alias are counted through an
+    execute wrapper. With REQUEST_METRICS_SERVER_TIMING the breakdown is
+    sent back in a Server-Timing header as well.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_METRICS:
+            return self.get_response(request)
+
+        timing = metrics.RequestTiming()
+        token = metrics.current_timing.set(timing)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timing.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.current_timing.reset(token)
+        seconds = time.perf_counter() - start
+
+        size = None
+        if not response.streaming:
+            size = int(response.get('Content-Length') or
+                       len(response.content))
+        metrics.observe(timing, seconds, response.status_code, size)
+        if settings.REQUEST_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(timing, seconds)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = metrics.current_timing.get()
+        if timing is not None:
+            timing.view = view_name(view_func, request.method)
+
+
+def server_timing(timing, seconds):
+    """ Server-Timing header value, durations in milliseconds """
+    return ', '.join((
+        f'app;dur={seconds * 1000:.1f}',
+        f'db;dur={timing.db_seconds * 1000:.1f};'
+        f'desc="{timing.queries} queries"',
+        f'serialize;dur={timing.serialize_seconds * 1000:.1f}',
+    ))
+
+
+class RequestProfilerMiddleware:
+    """ Profile single requests into PROFILE_ROOT, see core.profiling.
+
+    A staff user asks for a capture with an `X-Profile` header or a
+    `profile` query parameter set to a mode (`1` picks cProfile) and gets
+    its id back in `X-Profile-Id`. PROFILE_SAMPLE_RATES additionally
+    profiles that fraction of the requests of the listed views, e.g.
+    {'RecipeViewSet.list': 0.01}, in PROFILE_SAMPLE_MODE. It runs the view
+    itself, so it belongs last in MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.REQUEST_PROFILING:
+            return None
+        view = view_name(view_func, request.method)
+        mode = self.requested_mode(request)
+        if mode is None:
+            rate = settings.PROFILE_SAMPLE_RATES.get(view, 0)
+            if not rate or random.random() >= rate:
+                return None
+            mode = settings.PROFILE_SAMPLE_MODE
+        elif not self.is_staff(request):
+            return None
+
+        capture = profiling.Capture(mode)
+        capture.start()
+        try:
+            response = view_func(request, *view_args, **view_kwargs)
+            # serializing the JSON body is part of the cost
+            if callable(getattr(response, 'render', None)):
+                response.render()
+        finally:
+            capture.stop()
+            try:
+                capture.save(view=view, method=request.method,
+                             path=request.get_full_path())
+            except OSError:
+                logger.exception('Could not save profile %s', capture.id)
+        response['X-Profile-Id'] = capture.id
+        return response
+
+    def requested_mode(self, request):
+        """ the capture mode asked for by the request, if any """
+        value = request.META.get('HTTP_X_PROFILE') or \
+            request.GET.get('profile')
+        if not value:
+            return None
+        if value in profiling.MODES:
+            return value
+        return profiling.DEFAULT_MODE if value == '1' else None
+
+    def is_staff(self, request):
+        """ whether a session or API token authenticates a staff user """
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        try:
+            result = CachedTokenAuthentication().authenticate(
+                Request(request)
+            )
+        except exceptions.APIException:
+            return False
+        return result is not None and result[0].is_staff
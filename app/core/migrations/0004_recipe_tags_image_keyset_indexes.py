@@ -0,0 +1,41 @@
+# Generated by Django 2.1.15 on 2026-10-18 01:59
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_recipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags',
+            field=models.ManyToManyField(to='core.Tag'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='ingredients',
+            field=models.ManyToManyField(to='core.Ingredient'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-name', 'id'], name='core_ingr_user_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='core_recipe_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-name', 'id'], name='core_tag_user_name_id_idx'),
+        ),
+    ]
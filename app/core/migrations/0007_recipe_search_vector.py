@@ -0,0 +1,56 @@
+# Generated by Django 2.1.15 on 2026-10-18 02:20
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# core.search.UPDATE_SQL as of this migration, for every recipe
+BACKFILL_SQL = """
+UPDATE core_recipe SET search_vector =
+    setweight(to_tsvector('english'::regconfig,
+                          coalesce(core_recipe.title, '')), 'A') ||
+    setweight(to_tsvector('english'::regconfig, coalesce((
+        SELECT string_agg(t.name, ' ')
+        FROM core_tag t
+        JOIN core_recipe_tags rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = core_recipe.id
+    ), '')), 'B') ||
+    setweight(to_tsvector('english'::regconfig, coalesce((
+        SELECT string_agg(i.name, ' ')
+        FROM core_ingredient i
+        JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = core_recipe.id
+    ), '')), 'C')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """ GIN index and backfill, only PostgreSQL has full-text search """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX core_recipe_search_idx ON core_recipe '
+        'USING gin (search_vector)'
+    )
+    schema_editor.execute(BACKFILL_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS core_recipe_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# (index, table, columns) serving "recipes with tag/ingredient X" lookups
+# and the assigned_only joins with index-only scans; the auto-created
+# through tables only index (recipe_id, target_id) and each column alone
+INDEXES = (
+    ('core_recipe_tags_tag_recipe_idx', 'core_recipe_tags',
+     'tag_id, recipe_id'),
+    ('core_recipe_ingr_ingr_recipe_idx', 'core_recipe_ingredients',
+     'ingredient_id, recipe_id'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    # build without blocking writes on PostgreSQL
+    concurrently = schema_editor.connection.vendor == 'postgresql'
+    for name, table, columns in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX {"CONCURRENTLY " if concurrently else ""}'
+            f'IF NOT EXISTS {name} ON {table} ({columns})'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0007_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.1.15 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+# the snapshot core.snapshots built at this migration: [id, name] pairs
+# in id order, stored as JSON text
+BACKFILL_SQL = """
+UPDATE core_recipe SET related_snapshot = json_build_object(
+    'tags', coalesce((
+        SELECT json_agg(json_build_array(t.id, t.name) ORDER BY t.id)
+        FROM core_recipe_tags rt
+        JOIN core_tag t ON t.id = rt.tag_id
+        WHERE rt.recipe_id = core_recipe.id
+    ), '[]'::json),
+    'ingredients', coalesce((
+        SELECT json_agg(json_build_array(i.id, i.name) ORDER BY i.id)
+        FROM core_recipe_ingredients ri
+        JOIN core_ingredient i ON i.id = ri.ingredient_id
+        WHERE ri.recipe_id = core_recipe.id
+    ), '[]'::json)
+)::text
+WHERE EXISTS (
+    SELECT 1 FROM core_recipe_tags WHERE recipe_id = core_recipe.id
+) OR EXISTS (
+    SELECT 1 FROM core_recipe_ingredients WHERE recipe_id = core_recipe.id
+)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_m2m_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='related_snapshot',
+            field=models.TextField(default='{"tags": [], "ingredients": []}', editable=False, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.1.15 on 2026-10-18 02:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_expiry(apps, schema_editor):
+    """ existing tokens get a full lifetime from now """
+    from datetime import timedelta
+    from django.conf import settings
+    from django.utils import timezone
+    Token = apps.get_model('authtoken', 'Token')
+    TokenExpiry = apps.get_model('core', 'TokenExpiry')
+    using = schema_editor.connection.alias
+    expires = timezone.now() + timedelta(seconds=settings.TOKEN_TTL)
+    keys = Token.objects.using(using).values_list('key', flat=True)
+    TokenExpiry.objects.using(using).bulk_create(
+        [TokenExpiry(token_id=key, expires=expires) for key in keys.iterator()],
+        batch_size=1000
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0002_auto_20160226_1747'),
+        ('core', '0009_recipe_related_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenExpiry',
+            fields=[
+                ('token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='expiry', serialize=False, to='authtoken.Token')),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(set_expiry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.1.15 on 2026-10-18 03:00
+
+import core.models
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_user_updated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='related_snapshot',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=core.models.empty_snapshot, editable=False, null=True),
+        ),
+    ]
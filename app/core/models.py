@@ -1,5 +1,7 @@
 import uuid
 import os
+from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager,\
                                         PermissionsMixin
@@ -9,10 +11,14 @@ def recipe_image_file_path(instance, filename):
     """ Generate file path for new recipe image """
     ext = filename.split('.')[-1]
     # extension of file
-    filename = f'{uuid.uuid4}.{ext}'
+    filename = f'{uuid.uuid4()}.{ext}'
 
     return os.path.join('uploads/recipe/',filename)
 
+def empty_snapshot():
+    """ related snapshot of a recipe without tags or ingredients """
+    return {'tags': [], 'ingredients': []}
+
 class UserManager(BaseUserManager):
 
     def create_user(self, email, password=None, **extra_fields):
@@ -40,6 +46,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # last change through a save that includes it, validates conditional
+    # requests to the user's profile
+    updated = models.DateTimeField(auto_now=True)
 
     objects = UserManager()
 
@@ -53,6 +62,13 @@ class Tag(models.Model):
         on_delete = models.CASCADE,
     )
 
+    class Meta:
+        # matches the keyset ordering of the tag list endpoint
+        indexes = [
+            models.Index(fields=['user', '-name', 'id'],
+                         name='core_tag_user_name_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -64,11 +80,29 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        # matches the keyset ordering of the ingredient list endpoint
+        indexes = [
+            models.Index(fields=['user', '-name', 'id'],
+                         name='core_ingr_user_name_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
 class Recipe(models.Model):
     """ Recipe object """
+    IMAGE_PENDING = 'pending'
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = (
+        (IMAGE_PENDING, 'Pending'),
+        (IMAGE_PROCESSING, 'Processing'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Failed'),
+    )
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
@@ -78,10 +112,57 @@ class Recipe(models.Model):
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
-    ingredients = models.ManyToManyField('Tag')
+    tags = models.ManyToManyField('Tag')
     # add image field, image optional, dont add () in function recipe_image_file_path dont
     # want to call it make a reference to it, so called everytime we upload
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # progress of the background processing of the uploaded image
+    image_status = models.CharField(
+        max_length=10,
+        blank=True,
+        choices=IMAGE_STATUS_CHOICES
+    )
+    # sha256 of the processed image, keys the thumbnail cache
+    image_hash = models.CharField(max_length=64, blank=True)
+    # weighted title, tag and ingredient names, maintained by core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # tag and ingredient ids and names, maintained by core.snapshots so
+    # lists render without the M2M lookups
+    related_snapshot = JSONField(
+        null=True,
+        editable=False,
+        default=empty_snapshot
+    )
+
+    class Meta:
+        # matches the keyset ordering of the recipe list endpoint
+        indexes = [
+            models.Index(fields=['user', '-id'],
+                         name='core_recipe_user_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        recipe = super().from_db(db, field_names, values)
+        # the title the stored search vector was built from, see
+        # core.signals.update_recipe_search
+        recipe._indexed_title = recipe.__dict__.get('title')
+        return recipe
 
     def __str__(self):
         return self.title
+
+
+class TokenExpiry(models.Model):
+    """ when an auth token stops authenticating, see core.authentication """
+    token = models.OneToOneField(
+        'authtoken.Token',
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='expiry'
+    )
+    # indexed for the purge of expired tokens
+    expires = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.token_id} expires {self.expires:%Y-%m-%d %H:%M}'
@@ -0,0 +1,27 @@
+from django.conf import settings
+
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from core.renderers import FastJSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
+
+
+class FastJSONParser(parsers.JSONParser):
+    """ JSON parser decoding request bodies with orjson when installed """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % exc)
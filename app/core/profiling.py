@@ -0,0 +1,152 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+# capture modes and the extension of their dump
+MODES = {
+    # deterministic, every call timed, readable with pstats or snakeviz
+    'cprofile': 'prof',
+    # stacks sampled from another thread, in the folded format taken by
+    # flamegraph.pl and speedscope
+    'sample': 'folded',
+}
+DEFAULT_MODE = 'cprofile'
+
+
+def frame_label(frame):
+    code = frame.f_code
+    filename = code.co_filename
+    for root in sys.path:
+        if root and filename.startswith(root + os.sep):
+            filename = filename[len(root) + 1:]
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(
+        ';', ':'
+    )
+
+
+def folded_stack(frame):
+    """ `root;...;leaf` of the stack ending at `frame` """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """ Count the stacks of one thread, sampled every `interval` seconds.
+
+    The sampling runs in a helper thread, so the profiled code is only
+    slowed by the interpreter switching threads, and time blocked in the
+    database or on I/O shows up as well as CPU time.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[folded_stack(frame)] += 1
+
+
+class Capture:
+    """ profile the code run between start() and stop() in this thread """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.id = uuid.uuid4().hex[:12]
+        self._profile = None
+        self._sampler = None
+
+    def start(self):
+        self.started = time.time()
+        if self.mode == 'sample':
+            self._sampler = StackSampler(
+                threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL
+            )
+            self._sampler.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+        else:
+            self._profile.disable()
+        self.duration = time.time() - self.started
+
+    def save(self, **meta):
+        """ write the dump and its metadata to PROFILE_ROOT """
+        root = settings.PROFILE_ROOT
+        os.makedirs(root, exist_ok=True)
+        started = datetime.fromtimestamp(self.started, timezone.utc)
+        name = f'{started:%Y%m%dT%H%M%S%f}-{self.id}'
+        path = os.path.join(root, f'{name}.{MODES[self.mode]}')
+        if self._sampler is not None:
+            with open(path, 'w') as fp:
+                for stack, count in self._sampler.stacks.most_common():
+                    fp.write(f'{stack} {count}\n')
+        else:
+            self._profile.dump_stats(path)
+        with open(os.path.join(root, f'{name}.json'), 'w') as fp:
+            json.dump(dict(meta, id=self.id, mode=self.mode,
+                           started=self.started, duration=self.duration,
+                           dump=os.path.basename(path)), fp)
+        prune(root, settings.PROFILE_MAX_CAPTURES)
+        return path
+
+
+def captures(root=None):
+    """ metadata of the stored captures, oldest first """
+    root = root or settings.PROFILE_ROOT
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in sorted(names):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(root, name)) as fp:
+                meta = json.load(fp)
+        except (OSError, ValueError):
+            continue
+        meta['path'] = os.path.join(root, meta['dump'])
+        meta['meta_path'] = os.path.join(root, name)
+        found.append(meta)
+    return found
+
+
+def prune(root, keep):
+    """ delete the oldest captures beyond the newest `keep` """
+    stale = captures(root)[:-keep] if keep else []
+    for meta in stale:
+        for path in (meta['path'], meta['meta_path']):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,62 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast
+
+from core.models import Recipe
+
+# text search configuration used for both the stored vector and queries
+SEARCH_CONFIG = 'english'
+# ranks are stored as integers so keyset cursors compare them exactly
+RANK_SCALE = 1000000
+BATCH_SIZE = 1000
+
+# title weighs most, then tag names, then ingredient names
+UPDATE_SQL = """
+UPDATE core_recipe SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig,
+                          coalesce(core_recipe.title, '')), 'A') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(t.name, ' ')
+        FROM core_tag t
+        JOIN core_recipe_tags rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = core_recipe.id
+    ), '')), 'B') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(i.name, ' ')
+        FROM core_ingredient i
+        JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = core_recipe.id
+    ), '')), 'C')
+WHERE core_recipe.id = ANY(%(ids)s)
+"""
+
+
+def update_search_vectors(recipe_ids, using='default'):
+    """ recompute the stored search vector of the given recipes """
+    recipe_ids = list(recipe_ids)
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            cursor.execute(UPDATE_SQL, {
+                'config': SEARCH_CONFIG,
+                'ids': recipe_ids[start:start + BATCH_SIZE],
+            })
+
+
+def search_recipes(queryset, terms):
+    """ filter recipes matching `terms`, annotated with an integer rank """
+    query = SearchQuery(terms, config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query) * RANK_SCALE,
+                  BigIntegerField())
+    )
+
+
+def recipe_ids_using(model, instance):
+    """ ids of the recipes tagged with a Tag or using an Ingredient """
+    if model._meta.model_name == 'tag':
+        return Recipe.tags.through.objects.filter(tag_id=instance.pk) \
+                                          .values_list('recipe_id', flat=True)
+    return Recipe.ingredients.through.objects \
+                 .filter(ingredient_id=instance.pk) \
+                 .values_list('recipe_id', flat=True)
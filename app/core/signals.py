@@ -0,0 +1,163 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from core import authentication, search, snapshots
+from core.models import Ingredient, Recipe, Tag, TokenExpiry
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_refresh():
+    """ refresh the vectors and snapshots the block changes once, when it
+    exits, instead of after every recipe save and link change """
+    if getattr(_deferred, 'pending', None) is not None:
+        yield
+        return
+    # using -> 'vector' or 'related' (vector and snapshot) -> recipe ids,
+    # and the recipes to hand their new snapshot
+    _deferred.pending, _deferred.instances = {}, []
+    try:
+        yield
+        pending, instances = _deferred.pending, _deferred.instances
+    finally:
+        _deferred.pending = _deferred.instances = None
+    updated = {}
+    for using, queued in pending.items():
+        search.update_search_vectors(queued['vector'] | queued['related'],
+                                     using=using)
+        if queued['related']:
+            updated.update(snapshots.update_snapshots(
+                list(queued['related']), using=using
+            ))
+    for instance in instances:
+        if instance.pk in updated:
+            instance.related_snapshot = updated[instance.pk]
+
+
+def _defer(recipe_ids, using, kind):
+    """ queue the recipes in deferred_refresh(), False outside one """
+    if getattr(_deferred, 'pending', None) is None:
+        return False
+    queued = _deferred.pending.setdefault(
+        using, {'vector': set(), 'related': set()}
+    )
+    queued[kind].update(recipe_ids)
+    return True
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """ a revoked token must stop authenticating right away """
+    authentication.invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=Token)
+def set_token_expiry(sender, instance, created, raw, **kwargs):
+    """ new tokens are valid for TOKEN_TTL from their creation """
+    if created and not raw:
+        expires = instance.created + authentication.token_ttl()
+        TokenExpiry.objects.create(token=instance, expires=expires)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """ drop cached copies of a changed (e.g. deactivated) user """
+    if created:
+        return
+    keys = ()
+    if authentication._shared_cache() is not None:
+        keys = Token.objects.filter(user_id=instance.pk) \
+                            .values_list('key', flat=True)
+    authentication.invalidate_user(instance.pk, keys)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, created, update_fields=None,
+                         **kwargs):
+    """ the title is part of the search vector, tag and ingredient names
+    are refreshed when the links change """
+    if update_fields is not None and 'title' not in update_fields:
+        return
+    if not created and \
+            instance.title == getattr(instance, '_indexed_title', None):
+        return
+    if not _defer([instance.pk], instance._state.db, 'vector'):
+        search.update_search_vectors([instance.pk],
+                                     using=instance._state.db)
+    instance._indexed_title = instance.title
+
+
+def refresh_related(recipe_ids, using):
+    """ links or names of tags and ingredients of these recipes changed.
+
+    Returns recipe id -> new snapshot, or None in deferred_refresh().
+    """
+    recipe_ids = list(recipe_ids)
+    if _defer(recipe_ids, using, 'related'):
+        return None
+    search.update_search_vectors(recipe_ids, using=using)
+    return snapshots.update_snapshots(recipe_ids, using=using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_assignments(sender, instance, action, reverse, pk_set, **kwargs):
+    """ tag and ingredient names are part of a recipe's vector and snapshot """
+    if action == 'pre_clear' and reverse:
+        # a tag or ingredient is dropped from every recipe, remember which
+        instance._related_recipe_ids = list(
+            search.recipe_ids_using(type(instance), instance)
+        )
+        return
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = getattr(instance, '_related_recipe_ids', [])
+    else:
+        recipe_ids = pk_set or []
+    updated = refresh_related(recipe_ids, instance._state.db)
+    if reverse:
+        return
+    # the caller may serialize this instance next
+    if updated is None:
+        _deferred.instances.append(instance)
+    else:
+        instance.related_snapshot = updated[instance.pk]
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_renamed(sender, instance, created, **kwargs):
+    """ a renamed tag or ingredient changes every recipe using it """
+    if created:
+        return
+    refresh_related(search.recipe_ids_using(sender, instance),
+                    instance._state.db)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_deleted(sender, instance, **kwargs):
+    """ the M2M rows are gone by post_delete, collect the recipes now """
+    instance._related_recipe_ids = list(
+        search.recipe_ids_using(sender, instance)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_deleted(sender, instance, **kwargs):
+    refresh_related(getattr(instance, '_related_recipe_ids', []),
+                    instance._state.db)
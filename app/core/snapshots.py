@@ -0,0 +1,75 @@
+import json
+
+from django.conf import settings
+from django.db import connections
+
+from core.models import Recipe
+
+BATCH_SIZE = 500
+# snapshot key, related model name on the through table
+RELATIONS = (('tags', 'tag'), ('ingredients', 'ingredient'))
+
+
+def enabled():
+    """ whether serializers render from the snapshot """
+    return getattr(settings, 'RECIPE_SNAPSHOT_READS', True)
+
+
+def load(recipe):
+    """ snapshot of a recipe, None if missing or disabled """
+    if not enabled():
+        return None
+    return recipe.related_snapshot
+
+
+def build(recipe_ids, using='default', model=Recipe):
+    """ recipe id -> snapshot, read from the through tables.
+
+    Tags and ingredients are listed as [id, name] pairs in id order.
+    """
+    snapshots = {pk: {name: [] for name, _ in RELATIONS}
+                 for pk in recipe_ids}
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        batch = recipe_ids[start:start + BATCH_SIZE]
+        for name, target in RELATIONS:
+            through = getattr(model, name).through
+            rows = through.objects.using(using) \
+                          .filter(recipe_id__in=batch) \
+                          .order_by(f'{target}_id') \
+                          .values_list('recipe_id', f'{target}_id',
+                                       f'{target}__name')
+            for recipe_id, pk, value in rows:
+                snapshots[recipe_id][name].append([pk, value])
+    return snapshots
+
+
+def write(snapshots, using='default', model=Recipe):
+    """ store recipe id -> snapshot, one UPDATE per batch """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    items = list(snapshots.items())
+    # every recipe takes a (pk, snapshot) pair plus its pk in the IN list
+    size = min(BATCH_SIZE, connection.ops.bulk_batch_size(
+        ['pk', 'pk', 'pk'], items
+    ))
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), max(size, 1)):
+            batch = items[start:start + max(size, 1)]
+            cursor.execute(
+                'UPDATE %s SET %s = CASE %s %s END WHERE %s IN (%s)' % (
+                    qn(model._meta.db_table), qn('related_snapshot'),
+                    qn('id'),
+                    ' '.join(['WHEN %s THEN CAST(%s AS jsonb)'] * len(batch)),
+                    qn('id'), ', '.join(['%s'] * len(batch)),
+                ),
+                [value for pk, snapshot in batch
+                 for value in (pk, json.dumps(snapshot))] +
+                [pk for pk, _ in batch]
+            )
+
+
+def update_snapshots(recipe_ids, using='default', model=Recipe):
+    """ rebuild and store the snapshot of the given recipes """
+    snapshots = build(list(dict.fromkeys(recipe_ids)), using, model)
+    write(snapshots, using, model)
+    return snapshots
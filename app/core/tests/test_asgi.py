@@ -0,0 +1,192 @@
+import asyncio
+import gc
+import io
+import json
+from urllib.parse import quote
+
+from django.contrib.auth import get_user_model
+from django.test import (
+    SimpleTestCase, TransactionTestCase, override_settings
+)
+
+from rest_framework.authtoken.models import Token
+
+from core.asgi import ASGIHandler, environ
+from core.models import Recipe
+
+
+def http_scope(method, path, query=b'', headers=()):
+    return {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': quote(path).encode('ascii'),
+        'root_path': '',
+        'query_string': query,
+        'headers': [(b'host', b'testserver')] + list(headers),
+        'server': ('localhost', 8000),
+        'client': ('127.0.0.1', 5000),
+    }
+
+
+def call(application, scope, body_chunks=(b'',)):
+    """ run one ASGI request, return the messages sent back """
+    received = [
+        {'type': 'http.request', 'body': chunk,
+         'more_body': index < len(body_chunks) - 1}
+        for index, chunk in enumerate(body_chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(application(scope, receive, send))
+    finally:
+        loop.close()
+    return sent
+
+
+class EnvironTests(SimpleTestCase):
+    """ Test the ASGI scope to WSGI environ translation """
+
+    def test_environ(self):
+        """ test the request line, headers and body length carry over """
+        scope = http_scope('POST', '/api/recipe/recipes/', b'tags=1,2', [
+            (b'content-type', b'application/json'),
+            (b'content-length', b'99'),
+            (b'authorization', b'Token abc'),
+            (b'accept', b'text/csv'),
+            (b'accept', b'application/json'),
+        ])
+
+        env = environ(scope, io.BytesIO(b'{}'))
+
+        self.assertEqual(env['REQUEST_METHOD'], 'POST')
+        self.assertEqual(env['PATH_INFO'], '/api/recipe/recipes/')
+        self.assertEqual(env['QUERY_STRING'], 'tags=1,2')
+        self.assertEqual(env['CONTENT_TYPE'], 'application/json')
+        self.assertEqual(env['CONTENT_LENGTH'], '2')
+        self.assertEqual(env['HTTP_AUTHORIZATION'], 'Token abc')
+        self.assertEqual(env['HTTP_ACCEPT'], 'text/csv,application/json')
+        self.assertEqual(env['REMOTE_ADDR'], '127.0.0.1')
+
+    def test_environ_decoded_path(self):
+        """ test PATH_INFO is the decoded path, not the raw one """
+        scope = http_scope('GET', '/app/api/recipe/caf\u00e9 soup/')
+        scope['root_path'] = '/app'
+
+        env = environ(scope, io.BytesIO())
+
+        self.assertEqual(scope['raw_path'],
+                         b'/app/api/recipe/caf%C3%A9%20soup/')
+        self.assertEqual(env['SCRIPT_NAME'], '/app')
+        self.assertEqual(env['PATH_INFO'].encode('latin-1').decode('utf-8'),
+                         '/api/recipe/caf\u00e9 soup/')
+
+
+class ASGIHandlerTests(TransactionTestCase):
+    """ Test serving the API over ASGI """
+
+    def setUp(self):
+        self.application = ASGIHandler(threads=2)
+        user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass', name='Test'
+        )
+        self.auth = (b'authorization',
+                     f'Token {Token.objects.create(user=user)}'.encode())
+        Recipe.objects.create(user=user, title='Soup', time_minutes=10,
+                              price=5.00)
+
+    def tearDown(self):
+        self.application.executor.shutdown()
+        # the pool threads' persistent connections are only closed once
+        # their wrappers are collected, the test database is dropped next
+        gc.collect()
+
+    def test_list(self):
+        """ test a buffered response is sent in one body message """
+        start, body = call(self.application, http_scope(
+            'GET', '/api/recipe/recipes/', headers=[self.auth]
+        ))
+
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'application/json'),
+                      start['headers'])
+        self.assertEqual(json.loads(body['body'])['results'][0]['title'],
+                         'Soup')
+
+    def test_create_from_chunked_body(self):
+        """ test a body received in several messages reaches the view """
+        payload = json.dumps({'title': 'Stew', 'time_minutes': 5,
+                              'price': '3.00', 'tags': [],
+                              'ingredients': []}).encode()
+
+        start, body = call(
+            self.application,
+            http_scope('POST', '/api/recipe/recipes/', headers=[
+                self.auth, (b'content-type', b'application/json'),
+            ]),
+            [payload[:10], payload[10:]]
+        )
+
+        self.assertEqual(start['status'], 201)
+        self.assertTrue(Recipe.objects.filter(title='Stew').exists())
+
+    def test_streaming_response(self):
+        """ test a streaming response is sent chunk by chunk """
+        messages = call(self.application, http_scope(
+            'GET', '/api/recipe/recipes/export/', headers=[self.auth]
+        ))
+
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertTrue(all(message['more_body']
+                            for message in messages[1:-1]))
+        self.assertFalse(messages[-1].get('more_body', False))
+        lines = b''.join(message['body'] for message in messages[1:])
+        self.assertEqual(json.loads(lines.splitlines()[0])['title'], 'Soup')
+
+    @override_settings(ASGI_MAX_BODY_SIZE=8)
+    def test_body_too_large(self):
+        """ test bodies over the limit are refused with a 413 """
+        declared = http_scope('POST', '/api/recipe/recipes/', headers=[
+            self.auth, (b'content-length', b'100'),
+        ])
+        start, _ = call(self.application, declared, [b'x' * 100])
+        self.assertEqual(start['status'], 413)
+
+        streamed = http_scope('POST', '/api/recipe/recipes/',
+                              headers=[self.auth])
+        start, _ = call(self.application, streamed, [b'x' * 5, b'x' * 5])
+        self.assertEqual(start['status'], 413)
+        self.assertFalse(Recipe.objects.exclude(title='Soup').exists())
+
+    def test_lifespan(self):
+        """ test startup and shutdown are acknowledged """
+        events = [{'type': 'lifespan.startup'},
+                  {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return events.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(
+                self.application({'type': 'lifespan'}, receive, send)
+            )
+        finally:
+            loop.close()
+
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
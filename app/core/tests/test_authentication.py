@@ -0,0 +1,161 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.authentication import CachedTokenAuthentication, token_cache
+from core.models import TokenExpiry
+
+
+def sample_user(email='test@gmail.com', password='testpass'):
+    """ Create sample user """
+    return get_user_model().objects.create_user(email, password, name='Test')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """ Test the cached token authentication backend """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = sample_user()
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def tearDown(self):
+        token_cache.clear()
+
+    def test_authenticate_cached(self):
+        """ test a repeated token lookup does not query the db """
+        user, token = self.auth.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            cached_user, cached_token = \
+                self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(cached_user, self.user)
+        self.assertEqual(cached_user.email, self.user.email)
+        self.assertEqual(cached_token.key, self.token.key)
+        self.assertIsNot(cached_user, user)
+
+    def test_invalid_token(self):
+        """ test an unknown token is rejected """
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials('missing')
+
+    def test_deleted_token_invalidated(self):
+        """ test deleting a token stops it authenticating """
+        self.auth.authenticate_credentials(self.token.key)
+
+        self.token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivated_user_invalidated(self):
+        """ test deactivating a user stops their token authenticating """
+        self.auth.authenticate_credentials(self.token.key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_updated_user_refreshed(self):
+        """ test a changed user is reloaded on the next request """
+        self.auth.authenticate_credentials(self.token.key)
+
+        self.user.name = 'New name'
+        self.user.save()
+        user, _ = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user.name, 'New name')
+
+    @override_settings(TOKEN_AUTH_CACHE_TTL=10)
+    def test_entry_expires(self):
+        """ test cached entries are reloaded after the TTL """
+        with patch('core.authentication.time.monotonic', return_value=0):
+            self.auth.authenticate_credentials(self.token.key)
+
+        with patch('core.authentication.time.monotonic', return_value=11):
+            with self.assertNumQueries(1):
+                self.auth.authenticate_credentials(self.token.key)
+
+    @override_settings(TOKEN_AUTH_CACHE_SIZE=2)
+    def test_cache_bounded(self):
+        """ test the least recently used token is evicted """
+        tokens = [self.token] + [
+            Token.objects.create(user=sample_user(f'user{i}@gmail.com'))
+            for i in range(2)
+        ]
+        for token in tokens:
+            self.auth.authenticate_credentials(token.key)
+
+        self.assertEqual(len(token_cache), 2)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_shared_cache_tier(self):
+        """ test a local miss is served from the shared cache """
+        self.auth.authenticate_credentials(self.token.key)
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            user, _ = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+
+        self.token.delete()
+        token_cache.clear()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_expired_token(self):
+        """ test a token is rejected once it expired """
+        TokenExpiry.objects.filter(token=self.token) \
+                           .update(expires=timezone.now())
+
+        with self.assertRaisesMessage(AuthenticationFailed, 'expired'):
+            self.auth.authenticate_credentials(self.token.key)
+
+    @override_settings(TOKEN_TTL=3600, TOKEN_TTL_REFRESH=600)
+    def test_sliding_expiry(self):
+        """ test a used token is extended once per refresh interval """
+        now = timezone.now()
+        TokenExpiry.objects.filter(token=self.token) \
+                           .update(expires=now + timedelta(seconds=3600))
+        self.auth.authenticate_credentials(self.token.key)
+        with patch('core.authentication.timezone.now',
+                   return_value=now + timedelta(seconds=300)):
+            with self.assertNumQueries(0):
+                self.auth.authenticate_credentials(self.token.key)
+
+        later = now + timedelta(seconds=1200)
+        with patch('core.authentication.timezone.now', return_value=later):
+            with self.assertNumQueries(1):
+                self.auth.authenticate_credentials(self.token.key)
+            with self.assertNumQueries(0):
+                self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(TokenExpiry.objects.get(token=self.token).expires,
+                         later + timedelta(seconds=3600))
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_password_not_cached(self):
+        """ test the password hash is left out of the cached entries """
+        self.auth.authenticate_credentials(self.token.key)
+
+        entry = token_cache.get(self.token.key)
+        self.assertNotIn('password', entry['user'])
+        self.assertNotIn('password',
+                         cache.get(f'authtoken:{self.token.key}')['user'])
+
+        user, _ = self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('testpass'))
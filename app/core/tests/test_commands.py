@@ -1,8 +1,24 @@
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
 from unittest.mock import patch
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core import profiling
+from core.models import Tag, Recipe, TokenExpiry
+from recipe import export
 
 class CommandsTestCase(TestCase):
     def test_wait_for_db_ready(self):
@@ -12,6 +28,27 @@ class CommandsTestCase(TestCase):
             call_command('wait_for_db')
             self.assertEqual(gi.call_count,1)
 
+    @patch('recipe.images.process_image')
+    def test_requeue_images(self, process_image):
+        """ test images left pending or processing are processed """
+        user = get_user_model().objects.create_user('test@gmail.com', 'pw')
+        recipes = [
+            Recipe.objects.create(user=user, title=status, time_minutes=5,
+                                  price=5, image=f'{status}.jpg',
+                                  image_status=status)
+            for status in (Recipe.IMAGE_PENDING, Recipe.IMAGE_PROCESSING,
+                           Recipe.IMAGE_READY, Recipe.IMAGE_FAILED)
+        ]
+        Recipe.objects.create(user=user, title='none', time_minutes=5,
+                              price=5, image_status=Recipe.IMAGE_PENDING)
+        out = StringIO()
+
+        call_command('requeue_images', stdout=out)
+
+        self.assertEqual([args[0] for args, _ in process_image.call_args_list],
+                         [recipes[0].id, recipes[1].id])
+        self.assertIn('Processed 2 of 2', out.getvalue())
+
     @patch('time.sleep', return_value=None)
     def test_wait_for_db(self, ts):
         """ test waiting for db """
@@ -19,3 +56,270 @@ class CommandsTestCase(TestCase):
             gi.side_effect=[OperationalError]*5+[True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count,6)
+
+    def test_benchmark_api_within_baseline(self):
+        """ test benchmark passes when metrics are within the baseline """
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as baseline:
+            json.dump({'*': {'recipe-list': {'queries': 100}}}, baseline)
+            baseline.flush()
+            out = StringIO()
+            call_command('benchmark_api', scales=[20], users=2, repeat=1,
+                         baseline=baseline.name, stdout=out)
+
+        self.assertIn('recipe-list', out.getvalue())
+        self.assertIn('within baseline', out.getvalue())
+
+    def test_benchmark_api_regression(self):
+        """ test benchmark fails when a query count goes past baseline """
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as baseline:
+            json.dump({'*': {'recipe-list': {'queries': 0}}}, baseline)
+            baseline.flush()
+            with self.assertRaises(CommandError):
+                call_command('benchmark_api', scales=[20], users=2,
+                             repeat=1, baseline=baseline.name,
+                             stdout=StringIO(), stderr=StringIO())
+
+    def _write(self, content, suffix='.ndjson'):
+        fp = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        with fp:
+            fp.write(content)
+        self.addCleanup(os.remove, fp.name)
+        return fp.name
+
+    def test_import_recipes(self):
+        """ test importing NDJSON reuses and creates tags by name """
+        user = get_user_model().objects.create_user('test@gmail.com', 'pass')
+        vegan = Tag.objects.create(user=user, name='Vegan')
+        path = self._write(
+            json.dumps({'title': 'Curry', 'time_minutes': 20,
+                        'price': '5.50', 'tags': ['Vegan', 'Hot'],
+                        'ingredients': ['Rice']}) + '\n' +
+            json.dumps({'title': 'Soup', 'time_minutes': 10,
+                        'price': 3, 'tags': ['Hot']}) + '\n'
+        )
+        out = StringIO()
+
+        call_command('import_recipes', path, user='test@gmail.com',
+                     batch_size=1, stdout=out)
+
+        self.assertIn('Imported 2 recipes', out.getvalue())
+        curry = Recipe.objects.get(user=user, title='Curry')
+        self.assertEqual(sorted(tag.name for tag in curry.tags.all()),
+                         ['Hot', 'Vegan'])
+        self.assertIn(vegan, curry.tags.all())
+        self.assertEqual(Tag.objects.filter(user=user).count(), 2)
+        self.assertEqual(
+            [i.name for i in curry.ingredients.all()], ['Rice']
+        )
+        soup = Recipe.objects.get(user=user, title='Soup')
+        self.assertEqual(str(soup.price), '3.00')
+        self.assertFalse(os.path.exists(f'{path}.import-state'))
+
+    def test_import_recipes_csv_export_round_trip(self):
+        """ test a CSV export loads back into another account """
+        user = get_user_model().objects.create_user('test@gmail.com', 'pass')
+        recipe = Recipe.objects.create(
+            user=user, title='Curry, hot', time_minutes=20, price='5.50'
+        )
+        recipe.tags.add(Tag.objects.create(user=user, name='Vegan'))
+        content = b''.join(
+            export.csv_stream(Recipe.objects.filter(user=user))
+        ).decode()
+        path = self._write(content, suffix='.csv')
+        other = get_user_model().objects.create_user('o@gmail.com', 'pass')
+
+        call_command('import_recipes', path, user='o@gmail.com',
+                     stdout=StringIO())
+
+        copy = Recipe.objects.get(user=other)
+        self.assertEqual(copy.title, 'Curry, hot')
+        self.assertEqual([t.name for t in copy.tags.all()], ['Vegan'])
+        self.assertNotEqual(copy.tags.get().pk, recipe.tags.get().pk)
+
+    def test_import_recipes_resume(self):
+        """ test resuming skips the records already committed """
+        user = get_user_model().objects.create_user('test@gmail.com', 'pass')
+        path = self._write(''.join(
+            json.dumps({'title': f'recipe {i}', 'time_minutes': 5,
+                        'price': '1.00'}) + '\n'
+            for i in range(3)
+        ))
+        with open(f'{path}.import-state', 'w') as fp:
+            json.dump({'path': os.path.abspath(path), 'user': user.pk,
+                       'records': 2}, fp)
+
+        call_command('import_recipes', path, user='test@gmail.com',
+                     resume=True, stdout=StringIO())
+
+        self.assertEqual(
+            [r.title for r in Recipe.objects.filter(user=user)],
+            ['recipe 2']
+        )
+
+    def test_import_recipes_invalid_record(self):
+        """ test invalid records stop the import unless skipped """
+        get_user_model().objects.create_user('test@gmail.com', 'pass')
+        path = self._write(
+            json.dumps({'title': 'ok', 'time_minutes': 5,
+                        'price': '1.00'}) + '\n' +
+            json.dumps({'title': '', 'time_minutes': 5,
+                        'price': '1.00'}) + '\n' +
+            'not json\n'
+        )
+        self.addCleanup(
+            lambda: os.path.exists(f'{path}.import-state') and
+            os.remove(f'{path}.import-state')
+        )
+
+        with self.assertRaisesMessage(CommandError, 'Record 2'):
+            call_command('import_recipes', path, user='test@gmail.com',
+                         stdout=StringIO())
+        self.assertFalse(Recipe.objects.exists())
+
+        err = StringIO()
+        call_command('import_recipes', path, user='test@gmail.com',
+                     skip_invalid=True, stdout=StringIO(), stderr=err)
+
+        self.assertEqual(Recipe.objects.get().title, 'ok')
+        self.assertIn('Record 3', err.getvalue())
+
+    def test_check_recipe_snapshots(self):
+        """ test stale snapshots are reported, then rebuilt with --fix """
+        user = get_user_model().objects.create_user('test@gmail.com', 'pass')
+        recipe = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=20, price='5.50'
+        )
+        recipe.tags.add(Tag.objects.create(user=user, name='Vegan'))
+        Recipe.objects.create(user=user, title='Soup', time_minutes=5,
+                              price='1.00')
+
+        call_command('check_recipe_snapshots', stdout=StringIO())
+
+        Recipe.objects.filter(pk=recipe.pk).update(related_snapshot=None)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_recipe_snapshots', stdout=out)
+        self.assertIn(f'Recipe {recipe.pk}', out.getvalue())
+
+        call_command('check_recipe_snapshots', fix=True, stdout=StringIO())
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.related_snapshot['tags'],
+                         [[recipe.tags.get().pk, 'Vegan']])
+
+
+    def test_profiles(self):
+        """ test captured profiles are listed and merged """
+        with tempfile.TemporaryDirectory() as root, \
+                override_settings(PROFILE_ROOT=root):
+            for _ in range(2):
+                capture = profiling.Capture('cprofile')
+                capture.start()
+                sorted(range(1000))
+                capture.stop()
+                capture.save(view='RecipeViewSet.list')
+            with open(os.path.join(root, 'x.folded'), 'w') as fp:
+                fp.write('a;b 2\na;c 1\n')
+            with open(os.path.join(root, 'x.json'), 'w') as fp:
+                json.dump({'id': 'x', 'mode': 'sample', 'started': 0,
+                           'duration': 0.1, 'dump': 'x.folded'}, fp)
+
+            out = StringIO()
+            call_command('profiles', 'list', stdout=out)
+            self.assertIn('3 captures', out.getvalue())
+
+            out = StringIO()
+            call_command('profiles', 'aggregate', mode='cprofile',
+                         view='RecipeViewSet.list', stdout=out)
+            self.assertIn('2 captures merged', out.getvalue())
+
+            merged = os.path.join(root, 'merged.folded')
+            out = StringIO()
+            call_command('profiles', 'aggregate', mode='sample',
+                         output=merged, stdout=out)
+            self.assertIn('3 samples', out.getvalue())
+            with open(merged) as fp:
+                self.assertEqual(fp.read(), 'a;b 2\na;c 1\n')
+
+            with self.assertRaises(CommandError):
+                call_command('profiles', 'aggregate', stdout=StringIO())
+
+    def test_benchmark_concurrency(self):
+        """ test concurrent connections are loaded and reported """
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            out = StringIO()
+            call_command(
+                'benchmark_concurrency',
+                f'local=http://127.0.0.1:{server.server_port}/',
+                connections=5, duration=0.3, ramp_up=0, stdout=out
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        row = out.getvalue().splitlines()[-1].split()
+        self.assertEqual(row[0], 'local')
+        self.assertGreater(float(row[1]), 0)
+        self.assertEqual(row[-2:], ['0', '0'])
+
+    @patch('core.management.commands.benchmark_serving.children_cpu_seconds',
+           side_effect=[1.0, 3.0])
+    @patch('core.management.commands.benchmark_serving.wait_for_port')
+    @patch('subprocess.Popen')
+    def test_benchmark_serving(self, popen, wait_for_port, cpu):
+        """ test gunicorn is started per worker count and reported """
+        async def run(target, connections, duration, ramp_up):
+            target.latencies = [0.01] * 10
+            target.statuses = {200: 10}
+
+        out = StringIO()
+        with patch('core.management.commands.benchmark_concurrency.'
+                   'Target.run', run):
+            call_command('benchmark_serving', '/metrics', workers=[1],
+                         threads=2, connections=4, duration=0.5, ramp_up=0,
+                         stdout=out)
+
+        env = popen.call_args[1]['env']
+        self.assertEqual(env['GUNICORN_WORKERS'], '1')
+        self.assertEqual(env['GUNICORN_THREADS'], '2')
+        self.assertEqual(wait_for_port.call_args[0][1], popen.return_value)
+        popen.return_value.wait.assert_called_once_with()
+        lines = out.getvalue().splitlines()
+        self.assertRegex(lines[-3], r'^\d+ CPU core')
+        row = lines[-1].split()
+        self.assertEqual(row[:2], ['1', '20.0'])
+        self.assertEqual(row[-3:], ['5.0', '0', '0'])
+
+    def test_purge_tokens(self):
+        """ test expired tokens are deleted in batches """
+        now = timezone.now()
+        tokens = [
+            Token.objects.create(user=get_user_model().objects.create_user(
+                f'user{index}@gmail.com', 'testpass'
+            ))
+            for index in range(3)
+        ]
+        TokenExpiry.objects.filter(token__in=tokens[:2]) \
+                           .update(expires=now - timedelta(1))
+
+        out = StringIO()
+        call_command('purge_tokens', batch_size=1, stdout=out)
+
+        self.assertEqual(list(Token.objects.all()), tokens[2:])
+        self.assertEqual(TokenExpiry.objects.count(), 1)
+        self.assertIn('Purged 2 tokens', out.getvalue())
@@ -0,0 +1,166 @@
+import threading
+from contextlib import contextmanager
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase
+
+from core.db import pool
+
+
+class FakeConnection:
+    """ stand-in for a DB-API connection """
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """ Test the process-local connection pool """
+
+    def setUp(self):
+        pool.reset_stats()
+        self.opened = []
+
+    def connect(self):
+        self.opened.append(FakeConnection())
+        return self.opened[-1]
+
+    def test_release_reuses_connection(self):
+        """ test a released connection is handed out again """
+        connections = pool.ConnectionPool('test', self.connect, max_size=2)
+
+        first = connections.acquire()
+        connections.release(first)
+        second = connections.acquire()
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.opened), 1)
+        stats = pool.connection_stats()['test']
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_closed'], 0)
+
+    def test_exhausted_pool_times_out(self):
+        """ test a checkout past max_size waits, then fails """
+        connections = pool.ConnectionPool('test', self.connect, max_size=1,
+                                          timeout=0.05)
+        connections.acquire()
+
+        with self.assertRaises(pool.PoolTimeout):
+            connections.acquire()
+
+        stats = pool.connection_stats()['test']
+        self.assertEqual(stats['pool_waits'], 0)
+        self.assertEqual(stats['pool_timeouts'], 1)
+
+    def test_waiting_checkout_gets_released_connection(self):
+        """ test a waiting checkout is served by a release and timed """
+        connections = pool.ConnectionPool('test', self.connect, max_size=1,
+                                          timeout=5)
+        first = connections.acquire()
+        timer = threading.Timer(0.05, connections.release, [first])
+        timer.start()
+
+        second = connections.acquire()
+        timer.join()
+
+        self.assertIs(first, second)
+        stats = pool.connection_stats()['test']
+        self.assertEqual(stats['pool_waits'], 1)
+        self.assertGreater(stats['pool_wait_seconds'], 0)
+        self.assertEqual(stats['pool_wait_max_seconds'],
+                         stats['pool_wait_seconds'])
+
+    def test_broken_connections_replaced(self):
+        """ test failed checks and resets close the connection """
+        connections = pool.ConnectionPool(
+            'test', self.connect, max_size=1,
+            check=lambda conn: not conn.closed,
+            reset=lambda conn: conn is not self.opened[0],
+        )
+        first = connections.acquire()
+        connections.release(first)
+        self.assertTrue(first.closed)
+
+        second = connections.acquire()
+        connections.release(second)
+        second.closed = True
+        third = connections.acquire()
+
+        self.assertEqual(self.opened, [first, second, third])
+        self.assertEqual(connections.size, 1)
+        stats = pool.connection_stats()['test']
+        self.assertEqual(stats['health_check_failures'], 1)
+        self.assertEqual(stats['connections_closed'], 2)
+
+    def test_connections_recycled_after_max_lifetime(self):
+        """ test connections older than max_lifetime are not reused """
+        connections = pool.ConnectionPool('test', self.connect, max_size=1,
+                                          max_lifetime=0)
+
+        first = connections.acquire()
+        connections.release(first)
+        second = connections.acquire()
+
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        self.assertEqual(connections.size, 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+class PooledBackendTests(TestCase):
+    """ Test the pooled PostgreSQL backend """
+
+    @contextmanager
+    def wrapper(self, alias, **options):
+        """ a backend connection registered under an extra alias.
+
+        connection_created receivers (contrib.postgres) look the alias up
+        in `connections`, so it must resolve to this very wrapper.
+        """
+        from core.db.postgresql.base import DatabaseWrapper
+
+        settings_dict = dict(connection.settings_dict, **options)
+        wrapper = DatabaseWrapper(settings_dict, alias=alias)
+        with patch.dict(connections.databases, {alias: settings_dict}):
+            connections[alias] = wrapper
+            try:
+                yield wrapper
+            finally:
+                wrapper.close()
+                pool.close_pools()
+                del connections[alias]
+
+    def test_new_connection_with_health_checks(self):
+        """ test a fresh connection opens with health checks enabled """
+        with self.wrapper('checked', CONN_HEALTH_CHECKS=True,
+                          POOL=None) as checked:
+            checked.ensure_connection()
+
+            self.assertTrue(checked.get_autocommit())
+            with checked.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                self.assertEqual(cursor.fetchone(), (1,))
+
+    def test_closed_connection_returns_to_pool(self):
+        """ test closing a pooled connection keeps it for the next one """
+        pool.reset_stats()
+        with self.wrapper('pooled', CONN_HEALTH_CHECKS=True,
+                          POOL={'MAX_SIZE': 1}) as pooled:
+            pooled.ensure_connection()
+            raw = pooled.connection
+            pooled.close()
+            pooled.ensure_connection()
+
+            self.assertIs(pooled.connection, raw)
+            with pooled.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                self.assertEqual(cursor.fetchone(), (1,))
+
+        stats = pool.connection_stats()['pooled']
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['checkouts'], 2)
@@ -0,0 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+ME_URL = reverse('user:me')
+METRICS_URL = reverse('metrics')
+
+
+class HistogramTests(SimpleTestCase):
+    """ Test the Prometheus histogram """
+
+    def test_samples_cumulative(self):
+        """ test buckets count every observation up to their bound """
+        histogram = metrics.Histogram('latency', 'Latency.', (1, 5),
+                                      ('view',))
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value, ('list',))
+
+        self.assertEqual(list(histogram.samples()), [
+            ('latency_bucket', '{view="list",le="1"}', 2),
+            ('latency_bucket', '{view="list",le="5"}', 3),
+            ('latency_bucket', '{view="list",le="+Inf"}', 4),
+            ('latency_sum', '{view="list"}', 14.5),
+            ('latency_count', '{view="list"}', 4),
+        ])
+
+
+class RequestMetricsTests(TestCase):
+    """ Test the request metrics middleware and endpoint """
+
+    def setUp(self):
+        metrics.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass', name='Test'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=10, price=5.00
+        )
+
+    def tearDown(self):
+        metrics.clear()
+
+    def test_server_timing(self):
+        """ test responses break their time down by component """
+        res = self.client.get(RECIPES_URL)
+
+        parts = [part.split(';') for part in res['Server-Timing'].split(', ')]
+        self.assertEqual([part[0] for part in parts],
+                         ['app', 'db', 'serialize'])
+        self.assertIn('desc="1 queries"', parts[1])
+        [sample] = [value for name, _, value
+                    in metrics.SERIALIZE_SECONDS.samples()
+                    if name.endswith('_sum')]
+        self.assertGreater(sample, 0)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_per_view_action(self):
+        """ test requests are recorded under their view and action """
+        self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+        self.client.get(ME_URL)
+
+        res = self.client.get(METRICS_URL,
+                              HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        body = res.content.decode()
+        self.assertIn(
+            'http_requests_total{view="RecipeViewSet.list",status="200"} 2',
+            body
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count'
+            '{view="RecipeViewSet.list"} 2', body
+        )
+        self.assertIn(
+            'http_request_db_queries_sum{view="RecipeViewSet.list"} 2', body
+        )
+        self.assertIn(
+            'http_response_size_bytes_count{view="ManageUserView.get"} 1',
+            body
+        )
+        self.assertIn('# TYPE http_request_serialize_duration_seconds '
+                      'histogram', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """ test the endpoint wants the bearer token when one is set """
+        client = APIClient()
+
+        self.assertEqual(client.get(METRICS_URL).status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(client.get(METRICS_URL).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_not_served_without_token(self):
+        """ test the endpoint is not served unless a token is set """
+        self.assertEqual(APIClient().get(METRICS_URL).status_code, 404)
+
+    @override_settings(REQUEST_METRICS=False)
+    def test_disabled(self):
+        """ test nothing is recorded with REQUEST_METRICS off """
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+        self.assertNotIn('RecipeViewSet.list', metrics.render())
@@ -1,5 +1,6 @@
 from unittest.mock import patch
 
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from core import models
@@ -76,6 +77,36 @@ class ModelTests(TestCase):
         mock_uuid.return_value = uuid
         file_path = models.recipe_image_file_path(None,'myimage.jpg')
 
-        exp_path = f'upload/recipe/{uuid}.jpg'
+        exp_path = f'uploads/recipe/{uuid}.jpg'
 
-        self.assertEqual(file_path, exp_path)
\ No newline at end of file
+        self.assertEqual(file_path, exp_path)
+
+    def test_recipe_m2m_composite_indexes(self):
+        """ test the through tables are indexed by target then recipe """
+        for table, column in (('core_recipe_tags', 'tag_id'),
+                              ('core_recipe_ingredients', 'ingredient_id')):
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(
+                    cursor, table
+                )
+            indexed = [c['columns'] for c in constraints.values()
+                       if c['index']]
+            self.assertIn([column, 'recipe_id'], indexed)
+
+
+    @patch('core.search.update_search_vectors')
+    def test_recipe_vector_updated_on_title_change(self, update_vectors):
+        """ test saving a recipe only recomputes its vector for a new title """
+        recipe = models.Recipe.objects.create(
+            user=sample_user(), title='Stew', time_minutes=5, price=5.00
+        )
+        update_vectors.reset_mock()
+        recipe = models.Recipe.objects.get(pk=recipe.pk)
+
+        recipe.price = 6.00
+        recipe.save()
+        update_vectors.assert_not_called()
+
+        recipe.title = 'Curry'
+        recipe.save()
+        update_vectors.assert_called_once_with([recipe.pk], using='default')
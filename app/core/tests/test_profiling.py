@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import profiling
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class RequestProfilerTests(TestCase):
+    """ Test the request profiler middleware """
+
+    def setUp(self):
+        self.profile_root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            PROFILE_ROOT=self.profile_root.name,
+            PROFILE_SAMPLE_INTERVAL=0.0005,
+        )
+        self.settings.enable()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass', name='Test'
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+    def tearDown(self):
+        self.settings.disable()
+        self.profile_root.cleanup()
+
+    def test_staff_requested_capture(self):
+        """ test a staff user can profile one request """
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self.client.get(RECIPES_URL, HTTP_X_PROFILE='cprofile')
+
+        self.assertEqual(res.status_code, 200)
+        [meta] = profiling.captures()
+        self.assertEqual(res['X-Profile-Id'], meta['id'])
+        self.assertEqual(meta['view'], 'RecipeViewSet.list')
+        self.assertEqual(meta['mode'], 'cprofile')
+        self.assertTrue(os.path.exists(meta['path']))
+
+    def test_capture_requires_staff(self):
+        """ test other users cannot trigger a capture """
+        res = self.client.get(RECIPES_URL, {'profile': '1'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(profiling.captures(), [])
+
+    def test_sampled_view(self):
+        """ test a view's sample rate captures folded stacks """
+        with override_settings(
+                PROFILE_SAMPLE_RATES={'RecipeViewSet.list': 1.0}):
+            self.client.get(RECIPES_URL)
+            self.client.get(reverse('user:me'))
+
+        [meta] = profiling.captures()
+        self.assertEqual(meta['mode'], 'sample')
+        with open(meta['path']) as fp:
+            for line in fp:
+                stack, count = line.rsplit(' ', 1)
+                self.assertGreater(int(count), 0)
+                self.assertIn(';', stack)
+
+    def test_prune(self):
+        """ test only the newest PROFILE_MAX_CAPTURES are kept """
+        self.user.is_staff = True
+        self.user.save()
+
+        with override_settings(PROFILE_MAX_CAPTURES=2):
+            ids = [
+                self.client.get(RECIPES_URL, HTTP_X_PROFILE='1')
+                ['X-Profile-Id'] for _ in range(3)
+            ]
+
+        kept = [meta['id'] for meta in profiling.captures()]
+        self.assertEqual(len(kept), 2)
+        self.assertIn(ids[-1], kept)
+        self.assertEqual(len(os.listdir(self.profile_root.name)), 4)
@@ -0,0 +1,71 @@
+import datetime
+import io
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+
+class FastJSONRendererTests(TestCase):
+    """ Test the fast JSON renderer matches the DRF renderer """
+
+    def assertSameOutput(self, data, media_type=None):
+        expected = JSONRenderer().render(data, media_type)
+        self.assertEqual(FastJSONRenderer().render(data, media_type),
+                         expected)
+
+    def test_render_serialized_recipe(self):
+        """ test rendering plain serializer output """
+        self.assertSameOutput([{
+            'id': 1,
+            'title': 'Crème brûlée',
+            'tags': [1, 2],
+            'price': '5.00',
+            'link': '',
+        }])
+
+    def test_render_decimal_datetime_and_lazy_strings(self):
+        """ test types the stdlib encoder does not handle natively """
+        self.assertSameOutput({
+            'price': Decimal('12.50'),
+            'created': timezone.now(),
+            'day': datetime.date(2021, 3, 29),
+            'label': gettext_lazy('Unable to authenticate'),
+        })
+
+    def test_render_escapes_line_separators(self):
+        """ test output stays a strict javascript subset """
+        self.assertSameOutput({'title': 'a\u2028b\u2029c'})
+
+    def test_render_indent(self):
+        """ test indented output falls back to the DRF renderer """
+        self.assertSameOutput({'id': 1}, 'application/json; indent=4')
+
+    def test_render_none(self):
+        """ test rendering no data returns an empty body """
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class FastJSONParserTests(TestCase):
+    """ Test the fast JSON parser """
+
+    def test_parse(self):
+        """ test parsing a JSON request body """
+        body = b'{"title": "Cr\xc3\xa8me", "tags": [1, 2], "price": 5.5}'
+
+        data = FastJSONParser().parse(io.BytesIO(body))
+
+        self.assertEqual(data, JSONParser().parse(io.BytesIO(body)))
+
+    def test_parse_invalid(self):
+        """ test invalid JSON raises a parse error """
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"title": '))
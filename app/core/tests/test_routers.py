@@ -0,0 +1,103 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.db import routers
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+ME_URL = reverse('user:me')
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    """ Test the read replica router """
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_routing(self):
+        """ test reads follow reads_from() and writes stay on default """
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+        with routers.reads_from('replica_0'):
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Recipe), 'default')
+
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'core'))
+
+
+# `default` stands in for a replica, the test only tracks the routing
+@override_settings(DATABASE_REPLICAS=['default'])
+class ReplicaReadApiTests(TestCase):
+    """ Test which requests read from a replica """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', 'testpass', name='Test'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=10, price=5.00
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def replica_reads(self, method, url, **kwargs):
+        """ the aliases a request routed its reads to """
+        with patch.object(routers, 'reads_from',
+                          wraps=routers.reads_from) as reads_from:
+            res = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(res.status_code, 400)
+        return [call[0][0] for call in reads_from.call_args_list]
+
+    def test_safe_actions_read_replica(self):
+        """ test list and retrieve read from a replica """
+        detail_url = reverse('recipe:recipe-detail', args=[self.recipe.id])
+
+        self.assertEqual(self.replica_reads('get', RECIPES_URL), ['default'])
+        self.assertEqual(self.replica_reads('get', detail_url), ['default'])
+        self.assertEqual(self.replica_reads('get', ME_URL), ['default'])
+        self.assertEqual(
+            self.replica_reads('get', RECIPES_URL + 'export/'), []
+        )
+
+    def test_write_pins_user_to_primary(self):
+        """ test a user reads from the primary right after a write """
+        detail_url = reverse('recipe:recipe-detail', args=[self.recipe.id])
+
+        self.assertEqual(
+            self.replica_reads('patch', detail_url, data={'title': 'Stew'}),
+            []
+        )
+        self.assertEqual(self.replica_reads('get', detail_url), [])
+
+        with override_settings(DATABASE_REPLICA_PIN_SECONDS=0):
+            cache.clear()
+            self.assertEqual(
+                self.replica_reads('get', detail_url), ['default']
+            )
+
+    def test_pin_set_after_write(self):
+        """ test the pin starts once the write is done, not before """
+        detail_url = reverse('recipe:recipe-detail', args=[self.recipe.id])
+        titles = []
+
+        def pin_primary(user_id):
+            titles.append(Recipe.objects.get(pk=self.recipe.pk).title)
+
+        with patch.object(routers, 'pin_primary', side_effect=pin_primary):
+            self.client.patch(detail_url, {'title': 'Stew'})
+            self.client.patch(detail_url, {'time_minutes': 'soon'})
+
+        self.assertEqual(titles, ['Stew'])
@@ -0,0 +1,47 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from core.throttling import LoginRateLimiter, parse_rate
+
+
+@override_settings(LOGIN_RATE_LIMITS={'email': '2/min', 'ip': None})
+class LoginRateLimiterTests(SimpleTestCase):
+    """ Test the login token buckets """
+
+    def setUp(self):
+        self.limiter = LoginRateLimiter()
+        self.keys = [('email', 'test@gmail.com'), ('ip', '127.0.0.1')]
+
+    def test_parse_rate(self):
+        """ test rates give the burst and tokens per second """
+        self.assertEqual(parse_rate('30/min'), (30, 0.5))
+        self.assertEqual(parse_rate('1/s'), (1, 1))
+
+    @patch('core.throttling.time.monotonic')
+    def test_bucket_refills(self, monotonic):
+        """ test an empty bucket waits for its refill """
+        monotonic.return_value = 100
+        self.assertIsNone(self.limiter.acquire(self.keys))
+        self.assertIsNone(self.limiter.acquire(self.keys))
+
+        self.assertEqual(self.limiter.acquire(self.keys), 30)
+        monotonic.return_value = 130
+        self.assertIsNone(self.limiter.acquire(self.keys))
+        # kinds without a rate are not limited
+        self.assertEqual(len(self.limiter), 1)
+
+    @patch('core.throttling.time.monotonic', return_value=100)
+    def test_release(self, monotonic):
+        """ test released attempts are available again """
+        for _ in range(5):
+            self.assertIsNone(self.limiter.acquire(self.keys))
+            self.limiter.release(self.keys)
+
+    @override_settings(LOGIN_RATE_LIMIT_SIZE=2)
+    def test_bounded(self):
+        """ test the least recently used buckets are dropped """
+        for index in range(3):
+            self.limiter.acquire([('email', f'user{index}@gmail.com')])
+
+        self.assertEqual(len(self.limiter), 2)
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """ (burst, tokens per second) of a "<burst>/<period>" rate """
+    burst, period = rate.split('/')
+    return int(burst), int(burst) / PERIODS[period[0]]
+
+
+class LoginRateLimiter:
+    """ Thread-safe, process-local token buckets of login attempts.
+
+    A bucket per kind of key (see LOGIN_RATE_LIMITS) holds up to `burst`
+    attempts and refills evenly over the period. Buckets are kept in an
+    LRU of LOGIN_RATE_LIMIT_SIZE entries; one dropped from it starts
+    over full.
+    """
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'LOGIN_RATE_LIMIT_SIZE', 100000)
+
+    def acquire(self, keys):
+        """ take an attempt from the bucket of each (kind, value) key.
+
+        Takes nothing and returns the seconds until an attempt is
+        available if any bucket is empty, None otherwise.
+        """
+        rates = getattr(settings, 'LOGIN_RATE_LIMITS', {})
+        keys = [key for key in keys if rates.get(key[0])]
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            wait = 0
+            for key in keys:
+                burst, refill = parse_rate(rates[key[0]])
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * refill)
+                buckets.append((key, tokens))
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / refill)
+            if wait:
+                return wait
+            for key, tokens in buckets:
+                self._set(key, tokens - 1, now)
+            return None
+
+    def release(self, keys):
+        """ give back the attempts of a successful login """
+        rates = getattr(settings, 'LOGIN_RATE_LIMITS', {})
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                if key not in self._buckets or not rates.get(key[0]):
+                    continue
+                burst, refill = parse_rate(rates[key[0]])
+                tokens, updated = self._buckets[key]
+                tokens = min(burst, tokens + (now - updated) * refill + 1)
+                self._set(key, tokens, now)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _set(self, key, tokens, now):
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_size:
+            self._buckets.popitem(last=False)
+
+
+login_rate_limiter = LoginRateLimiter()
+
+
+def login_keys(email, request):
+    """ the rate limited keys of a login attempt """
+    keys = [('email', email.strip().lower())]
+    if request is not None:
+        # the client address, honouring NUM_PROXIES like DRF throttles
+        keys.append(('ip', BaseThrottle().get_ident(request)))
+    return keys
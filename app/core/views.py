@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from rest_framework.permissions import SAFE_METHODS
+
+from core import metrics as request_metrics
+from core.db import routers
+
+
+class ReplicaReadMixin:
+    """ Serve the safe `replica_actions` of a view from a read replica.
+
+    Successful unsafe requests pin their user to the primary for
+    DATABASE_REPLICA_PIN_SECONDS from when the response is ready, so a
+    client always reads its own writes however long they took.
+    Authentication runs before the switch and stays on the primary, which
+    keeps freshly issued tokens valid.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS:
+            return
+        alias = self.get_read_database(request)
+        if alias is not None:
+            self._replica_reads = routers.reads_from(alias)
+            self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica_reads = self.__dict__.pop('_replica_reads', None)
+        if replica_reads is not None:
+            replica_reads.__exit__(None, None, None)
+        elif request.method not in SAFE_METHODS and \
+                response.status_code < 400:
+            routers.pin_primary(getattr(request.user, 'pk', None))
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def get_read_database(self, request):
+        """ replica alias for this request, None to stay on the primary """
+        # plain generic views have no action, their safe method retrieves
+        if getattr(self, 'action', 'retrieve') not in self.replica_actions:
+            return None
+        alias = routers.choose_replica()
+        if alias is None or routers.is_pinned(request.user.pk):
+            return None
+        return alias
+
+
+@require_GET
+def metrics(request):
+    """ request and connection metrics of this process for Prometheus.
+
+    Only served with METRICS_TOKEN set, to scrapers sending it.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404()
+    if not constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(
+        request_metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,73 @@
+"""
+Production WSGI serving profile, read by gunicorn from the working
+directory:
+
+    gunicorn app.wsgi
+
+Every setting can be overridden per environment with the GUNICORN_*
+variables below. Send the master SIGHUP to gracefully replace the
+workers after a config change; with preloading the application code is
+only re-imported by a new master (SIGUSR2, then SIGQUIT the old one).
+"""
+
+import gc
+import multiprocessing
+import os
+
+
+def env(name, default, cast=str):
+    value = os.environ.get(f'GUNICORN_{name}')
+    return default if value in (None, '') else cast(value)
+
+
+cores = multiprocessing.cpu_count()
+
+bind = env('BIND', '0.0.0.0:8000')
+# gthread workers serve `threads` requests at once each, which overlaps
+# database waits; `sync` workers handle one request at a time
+worker_class = env('WORKER_CLASS', 'gthread')
+workers = env('WORKERS', cores, int)
+threads = env('THREADS', 4, int)
+# connections kept open per worker, idle keep-alive ones included
+worker_connections = env('WORKER_CONNECTIONS', 1000, int)
+backlog = env('BACKLOG', 2048, int)
+
+# import the app once in the master so workers share its memory pages
+# copy-on-write instead of each importing Django
+preload_app = env('PRELOAD', '1') == '1'
+
+# recycle workers after this many requests, jittered so they do not all
+# restart together, to bound slow leaks and fragmentation
+max_requests = env('MAX_REQUESTS', 5000, int)
+max_requests_jitter = env('MAX_REQUESTS_JITTER', 500, int)
+
+timeout = env('TIMEOUT', 30, int)
+# time in-flight requests (and queued image jobs) get on reload/shutdown
+graceful_timeout = env('GRACEFUL_TIMEOUT', 30, int)
+keepalive = env('KEEPALIVE', 5, int)
+
+# 'off' disables the access log, e.g. under load tests
+accesslog = env('ACCESS_LOG', '-')
+if accesslog == 'off':
+    accesslog = None
+errorlog = '-'
+loglevel = env('LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    # objects of the preloaded app live as long as the master; moving them
+    # out of the collector's reach keeps garbage collections in workers
+    # from writing to (and so copying) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # connections are opened lazily, but never share one the master made
+    from django.db import connections
+    for connection in connections.all():
+        connection.close()
+
+
+def worker_exit(server, worker):
+    from core.db import pool
+    pool.close_pools()
@@ -0,0 +1,307 @@
+import csv
+import io
+
+from django.db import connections, transaction
+
+from core import search, snapshots
+from core.models import Ingredient, Recipe, Tag
+from recipe import cache
+
+BATCH_SIZE = 500
+# recipe M2M name and the column its through table points at the target
+LINKS = (('tags', 'tag_id'), ('ingredients', 'ingredient_id'))
+RELATED_FIELDS = tuple(name for name, _ in LINKS)
+
+
+def batches(items, size=BATCH_SIZE):
+    """ split a list into consecutive slices of at most `size` items """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def owned_ids(model, user):
+    """ ids of every `model` row owned by the user """
+    return set(model.objects.filter(user=user)
+               .values_list('id', flat=True))
+
+
+def _bulk_insert(model, objs):
+    """ bulk_create `objs`; PostgreSQL sets the pk of every one """
+    return model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+
+
+def _bulk_update(model, objs, names, user):
+    """ write the fields `names` of the user's objs, one UPDATE per batch.
+
+    Django 2.1 has no QuerySet.bulk_update, and building its CASE WHEN
+    expressions through the ORM costs more than running them, so the
+    statement is put together directly.
+    """
+    if not objs or not names:
+        return
+    connection = connections[model.objects.db]
+    qn = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in names]
+    pk = qn(model._meta.pk.column)
+    # every field takes a (pk, value) pair per obj, plus the IN list
+    # and the user
+    size = min(BATCH_SIZE, connection.ops.bulk_batch_size(
+        ['pk'] * (2 * len(fields) + 2), objs
+    ))
+    with connection.cursor() as cursor:
+        for batch in batches(objs, max(size, 1)):
+            assignments, params = [], []
+            for field in fields:
+                case = 'CASE %s %s END' % (
+                    pk, ' '.join(['WHEN %s THEN %s'] * len(batch))
+                )
+                if connection.vendor == 'postgresql':
+                    # the CASE parameters are untyped otherwise
+                    case = 'CAST(%s AS %s)' % (case,
+                                               field.db_type(connection))
+                assignments.append('%s = %s' % (qn(field.column), case))
+                for obj in batch:
+                    params += [obj.pk, field.get_db_prep_save(
+                        getattr(obj, field.attname), connection
+                    )]
+            params += [user.pk] + [obj.pk for obj in batch]
+            cursor.execute(
+                'UPDATE %s SET %s WHERE %s = %%s AND %s IN (%s)' % (
+                    qn(model._meta.db_table), ', '.join(assignments),
+                    qn('user_id'), pk, ', '.join(['%s'] * len(batch)),
+                ),
+                params
+            )
+
+
+def _scalars(item):
+    return {
+        name: value for name, value in item.items()
+        if name != 'id' and name not in RELATED_FIELDS
+    }
+
+
+def _write_links(recipe_ids, items, replace):
+    """ insert the tag and ingredient rows of each recipe item """
+    for name, column in LINKS:
+        through = getattr(Recipe, name).through
+        pairs = [
+            (recipe_id, item[name])
+            for recipe_id, item in zip(recipe_ids, items)
+            if name in item
+        ]
+        if replace:
+            for batch in batches([recipe_id for recipe_id, _ in pairs]):
+                through.objects.filter(recipe_id__in=batch).delete()
+        _insert_rows(through, ('recipe_id', column), [
+            (recipe_id, pk)
+            for recipe_id, pks in pairs
+            for pk in dict.fromkeys(pks)
+        ])
+
+
+def _insert_rows(model, columns, rows):
+    """ multi-row INSERT of plain tuples.
+
+    Link rows are only ever integer pairs, building model instances for
+    bulk_create costs more than the inserts themselves.
+    """
+    if not rows:
+        return
+    connection = connections[model.objects.db]
+    qn = connection.ops.quote_name
+    size = min(BATCH_SIZE, connection.ops.bulk_batch_size(columns, rows))
+    placeholder = '(%s)' % ', '.join(['%s'] * len(columns))
+    with connection.cursor() as cursor:
+        for batch in batches(rows, max(size, 1)):
+            cursor.execute(
+                'INSERT INTO %s (%s) VALUES %s' % (
+                    qn(model._meta.db_table),
+                    ', '.join(qn(column) for column in columns),
+                    ', '.join([placeholder] * len(batch)),
+                ),
+                [value for row in batch for value in row]
+            )
+
+
+def _invalidate_assignments(user, items):
+    """ recipe links changed, `assigned_only` lists may differ """
+    for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+        if any(name in item for item in items):
+            cache.invalidate(model, user.pk)
+
+
+def create_recipes(user, items):
+    """ insert validated recipe items with their tags and ingredients """
+    with transaction.atomic():
+        recipes = _bulk_insert(Recipe, [
+            Recipe(user=user, **_scalars(item)) for item in items
+        ])
+        recipe_ids = [recipe.pk for recipe in recipes]
+        _write_links(recipe_ids, items, replace=False)
+        # bulk inserts send no post_save or m2m_changed signals
+        search.update_search_vectors(recipe_ids)
+        snapshots.update_snapshots(recipe_ids)
+    _invalidate_assignments(user, items)
+    return recipe_ids
+
+
+def _copy_rows(cursor, model, columns, rows):
+    """ COPY plain tuples into the table of `model` """
+    buffer = io.StringIO()
+    # quote everything so empty strings are not read back as NULL
+    csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (
+            model._meta.db_table, ', '.join(columns)
+        ),
+        buffer
+    )
+
+
+def copy_recipes(user, items):
+    """ create_recipes through PostgreSQL COPY.
+
+    COPY can't return the generated keys, so the ids are drawn from the
+    sequence first and written explicitly.
+    """
+    connection = connections[Recipe.objects.db]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)",
+            [Recipe._meta.db_table, len(items)]
+        )
+        recipe_ids = [row[0] for row in cursor.fetchall()]
+        _copy_rows(
+            cursor, Recipe,
+            ('id', 'user_id', 'title', 'time_minutes', 'price', 'link',
+             'image_status', 'image_hash'),
+            [
+                (pk, user.pk, item['title'], item['time_minutes'],
+                 item['price'], item.get('link', ''), '', '')
+                for pk, item in zip(recipe_ids, items)
+            ]
+        )
+        for name, column in LINKS:
+            _copy_rows(
+                cursor, getattr(Recipe, name).through,
+                ('recipe_id', column),
+                [
+                    (pk, target)
+                    for pk, item in zip(recipe_ids, items)
+                    for target in dict.fromkeys(item.get(name, ()))
+                ]
+            )
+        search.update_search_vectors(recipe_ids)
+        snapshots.update_snapshots(recipe_ids)
+    _invalidate_assignments(user, items)
+    return recipe_ids
+
+
+def update_recipes(user, items):
+    """ apply validated partial recipe items, each carrying its id """
+    groups = {}
+    for item in items:
+        names = tuple(sorted(_scalars(item)))
+        groups.setdefault(names, []).append(
+            Recipe(pk=item['id'], user=user, **_scalars(item))
+        )
+    recipe_ids = [item['id'] for item in items]
+    with transaction.atomic():
+        for names, recipes in groups.items():
+            _bulk_update(Recipe, recipes, names, user)
+        _write_links(recipe_ids, items, replace=True)
+        search.update_search_vectors([
+            item['id'] for item in items
+            if {'title', 'tags', 'ingredients'} & set(item)
+        ])
+        snapshots.update_snapshots([
+            item['id'] for item in items
+            if {'tags', 'ingredients'} & set(item)
+        ])
+    _invalidate_assignments(user, items)
+    return recipe_ids
+
+
+def create_attrs(model, user, items):
+    """ insert validated tag or ingredient items """
+    with transaction.atomic():
+        objs = _bulk_insert(model, [
+            model(user=user, **_scalars(item)) for item in items
+        ])
+    cache.invalidate(model, user.pk)
+    return [obj.pk for obj in objs]
+
+
+def update_attrs(model, user, items):
+    """ rename tags or ingredients, refreshing the recipes using them """
+    renamed = [model(pk=item['id'], user=user, name=item['name'])
+               for item in items if 'name' in item]
+    name = 'tags' if model is Tag else 'ingredients'
+    column = dict(LINKS)[name]
+    through = getattr(Recipe, name).through
+    with transaction.atomic():
+        _bulk_update(model, renamed, ['name'], user)
+        recipe_ids = set()
+        for batch in batches([obj.pk for obj in renamed]):
+            recipe_ids.update(
+                through.objects.filter(**{f'{column}__in': batch})
+                               .values_list('recipe_id', flat=True)
+            )
+        search.update_search_vectors(recipe_ids)
+        snapshots.update_snapshots(recipe_ids)
+    cache.invalidate(model, user.pk)
+    return [item['id'] for item in items]
+
+
+def _delete_rows(model, user, ids):
+    """ DELETE the user's rows with these ids, without per-object signals """
+    connection = connections[model.objects.db]
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM %s WHERE %s = %%s AND %s IN (%s)' % (
+                qn(model._meta.db_table), qn('user_id'),
+                qn(model._meta.pk.column), ', '.join(['%s'] * len(ids)),
+            ),
+            [user.pk] + list(ids)
+        )
+
+
+def delete_owned(model, user, ids):
+    """ delete the user's `model` rows with these ids.
+
+    The per-object delete signals would refresh the vectors, snapshots
+    and caches once per row; they are bypassed and each is refreshed
+    once per batch instead.
+    """
+    recipe_ids = set()
+    with transaction.atomic():
+        for batch in batches(list(ids)):
+            batch = list(model.objects.filter(user=user, pk__in=batch)
+                                      .values_list('pk', flat=True))
+            if not batch:
+                continue
+            if model is Recipe:
+                for name, _ in LINKS:
+                    getattr(Recipe, name).through.objects \
+                        .filter(recipe_id__in=batch).delete()
+            else:
+                name = 'tags' if model is Tag else 'ingredients'
+                column = dict(LINKS)[name]
+                links = getattr(Recipe, name).through.objects \
+                    .filter(**{f'{column}__in': batch})
+                recipe_ids.update(links.values_list('recipe_id', flat=True))
+                links.delete()
+            _delete_rows(model, user, batch)
+        if recipe_ids:
+            search.update_search_vectors(recipe_ids)
+            snapshots.update_snapshots(recipe_ids)
+    if model is Recipe:
+        # assigned_only lists may have lost entries
+        cache.invalidate(Tag, user.pk)
+        cache.invalidate(Ingredient, user.pk)
+    else:
+        cache.invalidate(model, user.pk)
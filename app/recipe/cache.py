@@ -0,0 +1,54 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import quote_etag
+
+
+def _version_key(model, user_id):
+    return f'recipe:{model._meta.model_name}:{user_id}:version'
+
+
+def get_version(model, user_id):
+    """ return the current cache version of a user's list of `model` """
+    key = _version_key(model, user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # another process may have set it first, keep theirs
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate(model, user_id):
+    """ make every cached list of `model` for the user stale.
+
+    Inside a transaction the version is bumped again once it commits:
+    another request may read the old rows after the first bump and cache
+    them under that version.
+    """
+    key = _version_key(model, user_id)
+    cache.set(key, uuid.uuid4().hex, None)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(
+            lambda: cache.set(key, uuid.uuid4().hex, None)
+        )
+
+
+def list_etag(version, url):
+    """ ETag of a list response, changes whenever the version does """
+    digest = hashlib.md5(f'{version}:{url}'.encode('utf-8')).hexdigest()
+    return quote_etag(digest)
+
+
+def list_key(model, user_id, version, url):
+    """ cache key of the serialized list for one URL """
+    digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+    return f'recipe:{model._meta.model_name}:{user_id}:{version}:{digest}'
+
+
+def list_timeout():
+    return getattr(settings, 'RECIPE_ATTR_CACHE_TIMEOUT', 300)
@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from core.models import Recipe
+from core.renderers import FastJSONRenderer
+
+# recipes read per server-side cursor fetch, and per tag/ingredient lookup
+CHUNK_SIZE = 500
+FIELDS = ('id', 'title', 'time_minutes', 'price', 'link', 'tags',
+          'ingredients')
+# ?type= value -> content type
+EXPORT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _names(name, target, recipe_ids):
+    """ recipe id -> sorted tag or ingredient names of those recipes """
+    through = getattr(Recipe, name).through
+    names = {}
+    rows = through.objects.filter(recipe_id__in=recipe_ids) \
+                          .order_by(f'{target}__name') \
+                          .values_list('recipe_id', f'{target}__name')
+    for recipe_id, value in rows:
+        names.setdefault(recipe_id, []).append(value)
+    return names
+
+
+def export_chunks(queryset, chunk_size=None):
+    """ yield lists of recipe dicts, tags and ingredients by name.
+
+    Recipes are read through a server-side cursor and each chunk fetches
+    its tag and ingredient names in one query per relation, so memory
+    stays bounded by the chunk size whatever the collection size.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    recipes = queryset.order_by('id').values_list(
+        'id', 'title', 'time_minutes', 'price', 'link'
+    ).iterator(chunk_size=chunk_size)
+    for chunk in _chunks(recipes, chunk_size):
+        ids = [row[0] for row in chunk]
+        tags = _names('tags', 'tag', ids)
+        ingredients = _names('ingredients', 'ingredient', ids)
+        yield [
+            {
+                'id': pk,
+                'title': title,
+                'time_minutes': time_minutes,
+                'price': str(price),
+                'link': link,
+                'tags': tags.get(pk, []),
+                'ingredients': ingredients.get(pk, []),
+            }
+            for pk, title, time_minutes, price, link in chunk
+        ]
+
+
+def ndjson_stream(queryset):
+    """ one JSON object per line """
+    renderer = FastJSONRenderer()
+    for chunk in export_chunks(queryset):
+        yield b''.join(renderer.render(row) + b'\n' for row in chunk)
+
+
+def csv_stream(queryset):
+    """ CSV with a header, tags and ingredients as JSON arrays """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    for chunk in export_chunks(queryset):
+        for row in chunk:
+            row['tags'] = json.dumps(row['tags'], ensure_ascii=False)
+            row['ingredients'] = json.dumps(row['ingredients'],
+                                            ensure_ascii=False)
+            writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def stream(queryset, export_type):
+    """ encoded chunks of the export of `queryset` in `export_type` """
+    if export_type == 'csv':
+        return csv_stream(queryset)
+    return ndjson_stream(queryset)
@@ -0,0 +1,49 @@
+from django.db import connections
+
+from core.models import Tag, Ingredient, Recipe
+
+# facet name, related model and the column the through table points at
+FACETS = (
+    ('tags', Tag, 'tag_id'),
+    ('ingredients', Ingredient, 'ingredient_id'),
+)
+
+FACET_SQL = """
+SELECT %(facet)s, target.id, target.name, COUNT(*)
+FROM %(through)s link
+JOIN %(target)s target ON target.id = link.%(column)s
+WHERE link.recipe_id IN (%(recipes)s)
+GROUP BY target.id, target.name
+"""
+
+
+def recipe_facets(queryset):
+    """ how many recipes of `queryset` carry each tag and ingredient.
+
+    Both relations are counted by one UNION ALL of GROUP BYs over the
+    through tables, restricted to the filtered recipes by a subquery.
+    """
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+    recipes, params = queryset.order_by().values('id').query \
+                              .get_compiler(using=queryset.db).as_sql()
+    parts, all_params = [], []
+    for facet, model, column in FACETS:
+        parts.append(FACET_SQL % {
+            'facet': '%s',
+            'through': qn(getattr(Recipe, facet).through._meta.db_table),
+            'target': qn(model._meta.db_table),
+            'column': qn(column),
+            'recipes': recipes,
+        })
+        all_params += [facet] + list(params)
+
+    facets = {facet: [] for facet, _, _ in FACETS}
+    with connection.cursor() as cursor:
+        cursor.execute(' UNION ALL '.join(parts), all_params)
+        for facet, pk, name, count in cursor.fetchall():
+            facets[facet].append({'id': pk, 'name': name, 'count': count})
+    for values in facets.values():
+        values.sort(key=lambda value: (-value['count'], value['name'],
+                                       value['id']))
+    return facets
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.db.models import Count
+
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_CHOICES = (MATCH_ANY, MATCH_ALL)
+# recipe M2M name and the column its through table points at the target
+RELATIONS = {'tags': 'tag_id', 'ingredients': 'ingredient_id'}
+
+
+def parse_ids(value, param):
+    """ distinct ids of a comma separated query parameter """
+    try:
+        ids = list(dict.fromkeys(
+            int(part) for part in value.split(',') if part.strip()
+        ))
+    except ValueError:
+        raise ValidationError(
+            {param: ['Enter a comma separated list of integer ids.']}
+        )
+    limit = settings.RECIPE_FILTER_MAX_IDS
+    if len(ids) > limit:
+        raise ValidationError(
+            {param: [f'Ensure this list has at most {limit} ids.']}
+        )
+    return ids
+
+
+def parse_match(value):
+    """ `any` (the default) or `all` """
+    match = (value or MATCH_ANY).lower()
+    if match not in MATCH_CHOICES:
+        raise ValidationError(
+            {'match': [f'Choose one of {", ".join(MATCH_CHOICES)}.']}
+        )
+    return match
+
+
+def filter_related(queryset, name, ids, match=MATCH_ANY):
+    """ recipes linked to any or all of the `name` targets with `ids`.
+
+    Both modes filter through a subquery on the through table rather
+    than joining it, so recipes are never duplicated and the (target,
+    recipe) index answers it whatever the number of ids: `any` is a
+    semi-join, `all` groups the links by recipe and keeps the recipes
+    having one per requested id.
+    """
+    through = getattr(Recipe, name).through
+    links = through.objects.filter(**{f'{RELATIONS[name]}__in': ids})
+    if match == MATCH_ALL:
+        links = links.values('recipe_id') \
+                     .annotate(matched=Count('id')) \
+                     .filter(matched=len(ids))
+    return queryset.filter(id__in=links.values('recipe_id'))
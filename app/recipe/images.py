@@ -0,0 +1,216 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from core.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# EXIF orientation values and the transpose that puts the pixels upright
+ORIENTATION_TAG = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+# formats the sanitized original may be stored as, anything else is JPEG
+KEEP_FORMATS = ('JPEG', 'PNG', 'WEBP')
+# file extensions of the stored formats, the first one is used on renames
+FORMAT_EXTENSIONS = {
+    'JPEG': ('.jpg', '.jpeg'),
+    'PNG': ('.png',),
+    'WEBP': ('.webp',),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-image',
+            )
+        return _executor
+
+
+def schedule(recipe_id):
+    """ process the recipe image once the current transaction commits.
+
+    With RECIPE_IMAGE_WORKERS set to 0 the image is processed right away
+    in the calling thread, which is what the tests use.
+    """
+    if settings.RECIPE_IMAGE_WORKERS <= 0:
+        process_image(recipe_id)
+        return
+    transaction.on_commit(
+        lambda: _get_executor().submit(_run, recipe_id)
+    )
+
+
+def _run(recipe_id):
+    try:
+        process_image(recipe_id)
+    except Exception:
+        logger.exception('Processing image of recipe %s failed', recipe_id)
+    finally:
+        # worker threads own their connection, don't leak it
+        connection.close()
+
+
+def derivative_name(name, size, extension):
+    """ storage name of a resized copy of the image `name` """
+    stem = os.path.splitext(name)[0]
+    return f'{stem}_{size}.{extension}'
+
+
+def derivative_formats():
+    """ (extension, Pillow format) of the derivatives to generate """
+    formats = [('jpg', 'JPEG')]
+    if features.check('webp'):
+        formats.append(('webp', 'WEBP'))
+    return formats
+
+
+def derivative_names(name):
+    """ storage names of every derivative generated for `name` """
+    return [
+        derivative_name(name, size, extension)
+        for size in settings.RECIPE_IMAGE_SIZES
+        for extension, _ in derivative_formats()
+    ]
+
+
+def delete_image_files(storage, name):
+    """ remove an image and its derivatives from storage """
+    for path in [name] + derivative_names(name):
+        storage.delete(path)
+
+
+def stored_name(name, image_format):
+    """ `name` with an extension matching the format it is stored in """
+    stem, extension = os.path.splitext(name)
+    extensions = FORMAT_EXTENSIONS[image_format]
+    if extension.lower() in extensions:
+        return name
+    return stem + extensions[0]
+
+
+def stale_recipe_ids():
+    """ ids of recipes whose image is still pending or processing.
+
+    Jobs live in the memory of the process that scheduled them, so these
+    are lost if it exited before finishing them.
+    """
+    return list(
+        Recipe.objects.filter(image_status__in=(Recipe.IMAGE_PENDING,
+                                                Recipe.IMAGE_PROCESSING))
+                      .exclude(image='').exclude(image=None)
+                      .order_by('id').values_list('id', flat=True)
+    )
+
+
+def _set_status(recipe_id, name, image_status):
+    # only touch the row if the image was not replaced in the meantime
+    return Recipe.objects.filter(pk=recipe_id, image=name) \
+                         .update(image_status=image_status)
+
+
+def process_image(recipe_id):
+    """ verify, strip metadata and generate derivatives of a recipe image """
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    name = recipe.image.name
+    storage = recipe.image.storage
+    if not _set_status(recipe_id, name, Recipe.IMAGE_PROCESSING):
+        return
+
+    try:
+        with storage.open(name, 'rb') as fp:
+            data = fp.read()
+        Image.open(io.BytesIO(data)).verify()
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (IOError, SyntaxError, ValueError,
+            Image.DecompressionBombError) as exc:
+        logger.info('Rejected image of recipe %s: %s', recipe_id, exc)
+        storage.delete(name)
+        Recipe.objects.filter(pk=recipe_id, image=name) \
+                      .update(image=None, image_status=Recipe.IMAGE_FAILED)
+        return
+
+    image_format = image.format if image.format in KEEP_FORMATS else 'JPEG'
+    clean = _strip_metadata(_upright(image))
+    data = encode_image(clean, image_format)
+    # e.g. a re-encoded GIF is stored as .jpg
+    new_name = stored_name(name, image_format)
+    if new_name == name:
+        storage.delete(name)
+    new_name = storage.save(new_name, ContentFile(data))
+
+    rgb = clean.convert('RGB') if clean.mode != 'RGB' else clean
+    for size in settings.RECIPE_IMAGE_SIZES:
+        thumb = rgb.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        for extension, thumb_format in derivative_formats():
+            path = derivative_name(new_name, size, extension)
+            storage.delete(path)
+            storage.save(path, ContentFile(encode_image(thumb, thumb_format)))
+
+    updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image=new_name,
+        image_status=Recipe.IMAGE_READY,
+        image_hash=hashlib.sha256(data).hexdigest(),
+    )
+    if new_name == name:
+        return
+    if updated:
+        storage.delete(name)
+    else:
+        # the image was replaced meanwhile, drop the renamed copy
+        delete_image_files(storage, new_name)
+
+
+def _upright(image):
+    """ apply the EXIF orientation so it can be dropped safely """
+    try:
+        orientation = image.getexif().get(ORIENTATION_TAG)
+    except AttributeError:
+        exif = getattr(image, '_getexif', lambda: None)() or {}
+        orientation = exif.get(ORIENTATION_TAG)
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    return image.transpose(method) if method is not None else image
+
+
+def _strip_metadata(image):
+    """ copy of the pixels without EXIF, ICC or other ancillary data """
+    clean = image.copy()
+    clean.info = {}
+    return clean
+
+
+def encode_image(image, image_format):
+    """ encode a PIL image, converting modes JPEG cannot store """
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format,
+               quality=settings.RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
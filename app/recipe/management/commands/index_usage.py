@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.models import Tag, Ingredient, Recipe
+from recipe import filters
+
+USAGE_SQL = """
+SELECT s.relname, s.indexrelname, s.idx_scan, s.idx_tup_read,
+       s.idx_tup_fetch, pg_relation_size(s.indexrelid)
+FROM pg_stat_user_indexes s
+WHERE s.relname LIKE %s
+ORDER BY s.relname, s.indexrelname
+"""
+
+
+class Command(BaseCommand):
+    """ Django command to report how the core tables' indexes are used """
+    help = (
+        'Report index scans from pg_stat_user_indexes and optionally '
+        'EXPLAIN the API access paths for a user'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--table-prefix', default='core_',
+            help='Only report indexes of tables starting with this prefix'
+        )
+        parser.add_argument(
+            '--unused', action='store_true',
+            help='Only report indexes that were never scanned'
+        )
+        parser.add_argument(
+            '--explain', metavar='EMAIL',
+            help='EXPLAIN ANALYZE the list queries of this user'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        """ Handle the command """
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Index usage statistics need PostgreSQL')
+
+        with connection.cursor() as cursor:
+            cursor.execute(USAGE_SQL, [options['table_prefix'] + '%'])
+            rows = cursor.fetchall()
+
+        self.stdout.write(
+            f'{"table":<28}{"index":<40}{"scans":>10}'
+            f'{"tup read":>12}{"tup fetch":>12}{"size kb":>10}'
+        )
+        for table, index, scans, read, fetched, size in rows:
+            if options['unused'] and scans:
+                continue
+            self.stdout.write(
+                f'{table:<28}{index:<40}{scans:>10}'
+                f'{read:>12}{fetched:>12}{size // 1024:>10}'
+            )
+
+        if options['explain']:
+            self.explain(options['explain'], options['database'])
+
+    def explain(self, email, using):
+        """ print the plans of the queries the list endpoints run """
+        try:
+            user = get_user_model().objects.using(using).get(email=email)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {email}')
+
+        tags = Tag.objects.using(using).filter(user=user)
+        ingredients = Ingredient.objects.using(using).filter(user=user)
+        recipes = Recipe.objects.using(using).filter(user=user)
+        tag_id = tags.values_list('id', flat=True).first()
+        queries = {
+            'tag list': tags.order_by('-name', 'id')[:100],
+            'tag list assigned_only': tags.filter(recipe__isnull=False)
+                                          .order_by('-name', 'id')
+                                          .distinct()[:100],
+            'ingredient list': ingredients.order_by('-name', 'id')[:100],
+            'recipe list': recipes.order_by('-id')[:100],
+        }
+        if tag_id is not None:
+            # the semi-join RecipeViewSet builds for ?tags=
+            queries['recipe list by tag'] = filters.filter_related(
+                recipes, 'tags', [tag_id]
+            ).order_by('-id')[:100]
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.SUCCESS(f'\n{name}'))
+            self.stdout.write(queryset.explain(analyze=True, buffers=True))
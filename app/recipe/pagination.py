@@ -0,0 +1,156 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """ Opaque cursor pagination that seeks on the ordering columns.
+
+    Each page is fetched with a WHERE clause on the last row seen instead
+    of an OFFSET, so a deep page costs the same as the first one as long
+    as `ordering` is backed by an index. The last ordering field must be
+    unique (usually `id`) so that every row has a distinct position.
+    Views can order a request differently through a
+    `get_pagination_ordering()` method returning None or the fields.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    ordering = ('-id',)
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.page_size = self.get_page_size(request)
+        position, self.reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self._invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._seek(ordering, position))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # fetch one extra row to find out if there is a following page
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_ordering(self, view):
+        """ ordering of this request, the view may override the default """
+        get_ordering = getattr(view, 'get_pagination_ordering', None)
+        ordering = get_ordering() if get_ordering else None
+        return tuple(ordering or self.ordering)
+
+    def get_page_size(self, request):
+        """ return the requested page size clamped to max_page_size """
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        """ build the URL pointing past the given row """
+        payload = {'p': [self._position(instance, field)
+                         for field in self.ordering]}
+        if reverse:
+            payload['r'] = 1
+        token = urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        """ return (position, reverse) from the cursor query parameter """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(
+                urlsafe_b64decode(token.encode('ascii')).decode('utf-8')
+            )
+            position = payload['p']
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError,
+                binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list) or
+                len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _seek(self, ordering, position):
+        """ lexicographic "comes after" filter for the given position """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        # bound the index range scan on the leading column as well
+        first = ordering[0]
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{lookup}': position[0]}) & \
+            condition
+
+    def _invert(self, field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def _position(self, instance, field):
+        return getattr(instance, field.lstrip('-'))
+
+
+class RecipePagination(KeysetPagination):
+    """ keyset pagination for recipes, newest first """
+    ordering = ('-id',)
+
+
+class RecipeAttrPagination(KeysetPagination):
+    """ keyset pagination for tags and ingredients ordered by name """
+    ordering = ('-name', 'id')
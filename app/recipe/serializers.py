@@ -1,22 +1,68 @@
+from collections import OrderedDict
+
+from PIL import Image
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
-from core.models import Tag, Ingredient
+from core import signals, snapshots
+from core.metrics import TimedSerializerMixin
+from core.models import Tag, Ingredient, Recipe
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """" Serializer for tag object """
     class Meta:
         model = Tag
         fields=('id','name')
         read_only_fields=('id',)
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for ingredient objects """
     class Meta:
         model = Ingredient
         fields = ('id','name')
         read_only_fields = ('id',)
         
-class RecipeSerializer(serializers.ModelSerializer):
+
+
+class SnapshotRepresentationMixin:
+    """ recipe serializers reading Recipe.related_snapshot, see
+    core.snapshots """
+
+    def to_representation(self, instance):
+        """ render tags and ingredients from the recipe snapshot if built """
+        snapshot = snapshots.load(instance)
+        if snapshot is None:
+            return super().to_representation(instance)
+        ret = OrderedDict()
+        for field in self._readable_fields:
+            if field.field_name in snapshot:
+                ret[field.field_name] = self.snapshot_representation(
+                    field, snapshot[field.field_name]
+                )
+                continue
+            attribute = field.get_attribute(instance)
+            ret[field.field_name] = (
+                None if attribute is None
+                else field.to_representation(attribute)
+            )
+        return ret
+
+    def snapshot_representation(self, field, pairs):
+        """ ids, or id and name objects for nested serializers """
+        if isinstance(field, serializers.ListSerializer):
+            return [OrderedDict((('id', pk), ('name', name)))
+                    for pk, name in pairs]
+        return [pk for pk, _ in pairs]
+
+
+class RecipeSerializer(TimedSerializerMixin,
+                       SnapshotRepresentationMixin,
+                       serializers.ModelSerializer):
     """ Serialize a recipe """
     ingredients = serializers.PrimaryKeyRelatedField(
         many = True,
@@ -28,8 +74,21 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     class Meta:
         model = Recipe
-        fields = ('id', 'title', 'ingredients', 'tags', 'time_minutes', 'price', 'link')
-        read_only_fields = ('id',)
+        fields = ('id', 'title', 'ingredients', 'tags', 'time_minutes', 'price', 'link', 'image_status')
+        read_only_fields = ('id', 'image_status')
+
+    def create(self, validated_data):
+        """ save the recipe and its links, then refresh it once """
+        # a failure fails the request, no savepoint to roll back to
+        with transaction.atomic(savepoint=False), \
+                signals.deferred_refresh():
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        """ save the changes and links, then refresh the recipe once """
+        with transaction.atomic(savepoint=False), \
+                signals.deferred_refresh():
+            return super().update(instance, validated_data)
 
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -37,10 +96,151 @@ class RecipeDetailSerializer(RecipeSerializer):
     ingredients = IngredientSerializer(many=True,read_only=True)
     tags = TagSerializer(many=True, read_only=True)
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+def validate_image_header(upload):
+    """ cheap check of the image header, the full decode is deferred """
+    try:
+        Image.open(upload)
+    except (IOError, SyntaxError):
+        raise serializers.ValidationError(_('Upload a valid image.'))
+    finally:
+        upload.seek(0)
+
+
+class RecipeImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ serializer for uploading images to recipes """
+    image = serializers.FileField(validators=[validate_image_header])
+
+    class Meta:
+        model = Recipe
+        fields =  ('id', 'image', 'image_status')
+        read_only_fields = ('id', 'image_status')
+
+
+def owned_pk(value, owned):
+    """ reject ids outside `owned` the way PrimaryKeyRelatedField does """
+    if value not in owned:
+        raise serializers.ValidationError(
+            _('Invalid pk "%(pk)s" - object does not exist.') % {'pk': value}
+        )
+    return value
+
+
+def validate_bulk_ids(data, owned):
+    """ validate a bulk delete body, a list of ids the user owns """
+    if not isinstance(data, list):
+        raise serializers.ValidationError({
+            api_settings.NON_FIELD_ERRORS_KEY: [_('Expected a list of ids.')]
+        })
+    BulkListSerializer.check_length(data)
+    field = serializers.IntegerField()
+    ids, errors = [], []
+    for value in data:
+        try:
+            ids.append(owned_pk(field.run_validation(value), owned))
+        except serializers.ValidationError as exc:
+            errors.append(exc.detail)
+        else:
+            errors.append([])
+    if any(errors):
+        raise serializers.ValidationError(errors)
+    return ids
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """ list of bulk items, capped at RECIPE_BULK_MAX_ITEMS """
+
+    @staticmethod
+    def check_length(data):
+        limit = settings.RECIPE_BULK_MAX_ITEMS
+        if isinstance(data, list) and len(data) > limit:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    _('Ensure this list has at most %(limit)d items.')
+                    % {'limit': limit}
+                ]
+            })
+
+    def to_internal_value(self, data):
+        self.check_length(data)
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        ids = [item['id'] for item in attrs if 'id' in item]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                _('Each id may appear only once.')
+            )
+        return attrs
+
+
+class BulkItemMixin:
+    """ bulk items carry the id of an owned object when updating.
+
+    The owned ids are preloaded into the context by the view, so a whole
+    batch validates without a query per item.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.partial:
+            fields['id'] = serializers.IntegerField()
+        return fields
+
+    def validate_id(self, value):
+        return owned_pk(value, self.context['ids'])
+
+    def to_representation(self, item):
+        """ echo a validated item, which may only carry some fields """
+        return OrderedDict(
+            (field.field_name, field.to_representation(item[field.source]))
+            for field in self._readable_fields if field.source in item
+        )
+
+    def validate(self, attrs):
+        # partial validation skips missing required fields, id included
+        if self.partial and 'id' not in attrs:
+            raise serializers.ValidationError(
+                {'id': [_('This field is required.')]}
+            )
+        return super().validate(attrs)
+
+
+class TagBulkSerializer(BulkItemMixin, TagSerializer):
+    """ Serializer for one tag of a bulk request """
+    class Meta(TagSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+
+
+class IngredientBulkSerializer(BulkItemMixin, IngredientSerializer):
+    """ Serializer for one ingredient of a bulk request """
+    class Meta(IngredientSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+
+
+class RecipeBulkSerializer(BulkItemMixin, serializers.ModelSerializer):
+    """ Serializer for one recipe of a bulk request """
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
 
     class Meta:
         model = Recipe
-        fields =  ('id', 'image')
-        read_only_fields = ('id',)
\ No newline at end of file
+        fields = (
+            'id', 'title', 'ingredients', 'tags', 'time_minutes', 'price',
+            'link',
+        )
+        read_only_fields = ('id',)
+        list_serializer_class = BulkListSerializer
+
+    def validate_ingredients(self, value):
+        owned = self.context['ingredient_ids']
+        return [owned_pk(pk, owned) for pk in value]
+
+    def validate_tags(self, value):
+        owned = self.context['tag_ids']
+        return [owned_pk(pk, owned) for pk in value]
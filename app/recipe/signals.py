@@ -0,0 +1,35 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import cache
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_attr_list(sender, instance, **kwargs):
+    """ a tag or ingredient was written, drop its owner's cached lists """
+    cache.invalidate(sender, instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_tags_assignment(sender, instance, action, **kwargs):
+    """ recipe tags changed, `assigned_only` lists may differ """
+    if action.startswith('post_'):
+        cache.invalidate(Tag, instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_ingredients_assignment(sender, instance, action, **kwargs):
+    """ recipe ingredients changed, `assigned_only` lists may differ """
+    if action.startswith('post_'):
+        cache.invalidate(Ingredient, instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_assignments(sender, instance, **kwargs):
+    """ deleting a recipe drops its M2M rows without an m2m_changed """
+    cache.invalidate(Tag, instance.user_id)
+    cache.invalidate(Ingredient, instance.user_id)
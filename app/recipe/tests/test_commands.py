@@ -0,0 +1,43 @@
+from io import StringIO
+from unittest import skipIf, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+
+from core.models import Tag
+
+
+class CommandsTestCase(TestCase):
+
+    @skipIf(connection.vendor == 'postgresql', 'runs without PostgreSQL')
+    def test_index_usage_requires_postgres(self):
+        """ test index usage reporting refuses other databases """
+        with self.assertRaises(CommandError):
+            call_command('index_usage', stdout=StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+    def test_index_usage(self):
+        """ test index usage lists the composite indexes and plans """
+        user = get_user_model().objects.create_user('test@gmail.com',
+                                                    'testpass')
+        Tag.objects.create(user=user, name='Vegan')
+        out = StringIO()
+
+        call_command('index_usage', explain='test@gmail.com', stdout=out)
+
+        self.assertIn('core_recipe_tags_tag_recipe_idx', out.getvalue())
+        self.assertIn('recipe list by tag', out.getvalue())
+
+    @skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+    def test_index_usage_without_tags(self):
+        """ test the tag filter plan is left out for a user without tags """
+        get_user_model().objects.create_user('test@gmail.com', 'testpass')
+        out = StringIO()
+
+        call_command('index_usage', explain='test@gmail.com', stdout=out)
+
+        self.assertIn('recipe list', out.getvalue())
+        self.assertNotIn('recipe list by tag', out.getvalue())
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 from django.test import TestCase
 
@@ -34,6 +35,7 @@ class PrivateIngredientsApiTests(TestCase):
         )
 
         self.client.force_authenticate(self.user)
+        cache.clear()
 
     def test_retrieve_ingredient_list(self):
         """ Test retrieving a list of ingredients """
@@ -45,7 +47,7 @@ class PrivateIngredientsApiTests(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """ Test that ingredients for the authenticated user are returned """
@@ -59,8 +61,8 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
 
     def test_create_ingredient_successful(self):
         """ test create a new ingredient """
@@ -101,8 +103,8 @@ class PrivateIngredientsApiTests(TestCase):
 
         serializer1 = IngredientSerializer(ingredient1)
         serializer2 = IngredientSerializer(ingredient2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_ingredient_assigned_unique(self):
         """ test filtering ingredients by assigned returns uniques items """
@@ -124,4 +126,15 @@ class PrivateIngredientsApiTests(TestCase):
         recipe2.ingredients.add(ingredient)
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only':1})
-        self.assertEqual(len(res.data),1)
\ No newline at end of file
+        self.assertEqual(len(res.data['results']),1)
+
+    def test_update_ingredient_invalidates_cache(self):
+        """ test renaming an ingredient refreshes the cached list """
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+        self.client.get(INGREDIENTS_URL)
+
+        ingredient.name = 'Salt'
+        ingredient.save()
+        res = self.client.get(INGREDIENTS_URL)
+
+        self.assertEqual(res.data['results'][0]['name'], 'Salt')
@@ -0,0 +1,110 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def sample_recipe(user, **params):
+    """ create and return sample recipe """
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class KeysetPaginationTests(TestCase):
+    """ test cursor pagination of the recipe list endpoints """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _walk(self, url, params):
+        """ follow next links and return the ids of every page """
+        pages = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append([item['id'] for item in res.data['results']])
+            if not res.data['next']:
+                return pages, res
+            res = self.client.get(res.data['next'])
+
+    def test_recipes_paginated_newest_first(self):
+        """ test recipe pages cover every recipe once, newest first """
+        recipes = [sample_recipe(user=self.user) for _ in range(5)]
+
+        pages, _ = self._walk(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [recipe_id for page in pages for recipe_id in page]
+        self.assertEqual(ids, sorted((r.id for r in recipes), reverse=True))
+
+    def test_tags_paginated_with_duplicate_names(self):
+        """ test tags sharing a name are not skipped or repeated """
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('b', 'a', 'b', 'c', 'b')]
+
+        pages, _ = self._walk(TAGS_URL, {'page_size': 2})
+
+        ids = [tag_id for page in pages for tag_id in page]
+        expected = Tag.objects.filter(
+            id__in=[tag.id for tag in tags]
+        ).order_by('-name', 'id')
+        self.assertEqual(ids, [tag.id for tag in expected])
+
+    def test_previous_link_returns_prior_page(self):
+        """ test following previous returns the page before """
+        for _ in range(5):
+            sample_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+
+        res = self.client.get(second.data['previous'])
+
+        self.assertEqual(res.data['results'], first.data['results'])
+        self.assertIsNone(res.data['previous'])
+        self.assertIsNotNone(res.data['next'])
+
+    def test_page_size_capped(self):
+        """ test page size cannot exceed the maximum """
+        sample_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL, {'page_size': 10 ** 6})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_invalid_cursor(self):
+        """ test a malformed cursor is rejected """
+        res = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deep_page_does_not_use_offset(self):
+        """ test later pages seek on the cursor instead of an OFFSET """
+        for _ in range(6):
+            sample_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(second.data['next'])
+
+        for query in ctx.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'].upper())
@@ -1,10 +1,18 @@
+import csv
+import io
+import json
 import tempfile
 import os
 
 from PIL import Image
 
+from unittest import skipUnless
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -15,13 +23,20 @@ from rest_framework.test import APIClient
 from core.models import Recipe, Tag, Ingredient
 
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe import images
 
 RECIPES_URL = reverse('recipe:recipe-list')
+RECIPES_BULK_URL = reverse('recipe:recipe-bulk')
+RECIPES_EXPORT_URL = reverse('recipe:recipe-export')
 
 def image_upload_url(recipe_id):
     """ return URL for recipe image upload """
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
+def image_url(recipe_id):
+    """ return URL for recipe image thumbnails """
+    return reverse('recipe:recipe-image', args=[recipe_id])
+
 def detail_url(recipe_id):
     """ return recipe detail URL"""
     """ test single argument in the URL """
@@ -52,7 +67,7 @@ class PublicRecipeApiTests(TestCase):
     """ test unauthenticated recipe Api access """
 
     def setUp(self):
-        self.client = APICLient()
+        self.client = APIClient()
 
     def test_auth_required(self):
         """ test that authentication is required """
@@ -69,8 +84,7 @@ class PrivateRecipeApiTests(TestCase):
             'test@gmail.com',
             'testpass'
         )
-
-    self.client.force_authenticate(self.user)
+        self.client.force_authenticate(self.user)
 
     def test_retrieve_recipes(self):
         """ test retrieving a list of recipes """
@@ -81,13 +95,13 @@ class PrivateRecipeApiTests(TestCase):
 
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
-        se;f.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         """ test retrieving recipes for user """
-        user2 = get_user_model().objectss.create_user(
-            'test@gmail.com',
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
             'password123'
         )
         sample_recipe(user=user2)
@@ -98,8 +112,8 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data),1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']),1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_view_recipe_detail(self):
         """ test viewing a recipe detail """
@@ -117,6 +131,98 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeDetailSerializer(recipe)
         self.assertEqual(res.data, serializer.data)
 
+    def test_list_recipes_constant_queries(self):
+        """ test listing recipes does not query tags per recipe """
+        for i in range(5):
+            recipe = sample_recipe(user=self.user)
+            recipe.tags.add(sample_tag(user=self.user, name=f'tag {i}'))
+            recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        # recipes, then one prefetch each for tags and ingredients
+        with self.settings(RECIPE_SNAPSHOT_READS=False), \
+                self.assertNumQueries(3):
+            prefetched = self.client.get(RECIPES_URL)
+        # tags and ingredients read from the recipe snapshot
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 5)
+        self.assertEqual(res.data, prefetched.data)
+
+    def test_list_recipes_facets(self):
+        """ test facet counts cover every filtered recipe in one query """
+        vegan = sample_tag(user=self.user, name='Vegan')
+        quick = sample_tag(user=self.user, name='Quick')
+        rice = sample_ingredient(user=self.user, name='Rice')
+        for i in range(3):
+            recipe = sample_recipe(user=self.user, title=f'recipe {i}')
+            recipe.tags.add(vegan)
+            recipe.ingredients.add(rice)
+        recipe.tags.add(quick)
+        sample_recipe(user=self.user, title='untagged')
+        other = get_user_model().objects.create_user('o@gmail.com', 'pass')
+        sample_recipe(user=other).tags.add(sample_tag(user=other))
+
+        with self.assertNumQueries(2):
+            res = self.client.get(RECIPES_URL, {'facets': 1, 'page_size': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['facets'], {
+            'tags': [
+                {'id': vegan.id, 'name': 'Vegan', 'count': 3},
+                {'id': quick.id, 'name': 'Quick', 'count': 1},
+            ],
+            'ingredients': [{'id': rice.id, 'name': 'Rice', 'count': 3}],
+        })
+
+        res = self.client.get(RECIPES_URL, {'facets': 1, 'tags': quick.id})
+
+        self.assertEqual(res.data['facets']['tags'], [
+            {'id': quick.id, 'name': 'Quick', 'count': 1},
+            {'id': vegan.id, 'name': 'Vegan', 'count': 1},
+        ])
+        self.assertNotIn('facets', self.client.get(RECIPES_URL).data)
+
+    def test_view_recipe_detail_constant_queries(self):
+        """ test recipe detail fetches nested objects in one query each """
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user),
+                        sample_tag(user=self.user, name='Vegan'))
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        with self.settings(RECIPE_SNAPSHOT_READS=False), \
+                self.assertNumQueries(3):
+            prefetched = self.client.get(detail_url(recipe.id))
+        with self.assertNumQueries(1):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data, RecipeDetailSerializer(recipe).data)
+        self.assertEqual(res.data, prefetched.data)
+
+    def test_recipe_snapshot_follows_changes(self):
+        """ test the snapshot tracks links, renames and deletes """
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(user=self.user, name='Vegan')
+        ingredient = sample_ingredient(user=self.user, name='Rice')
+        tag.recipe_set.add(recipe)
+        recipe.ingredients.add(ingredient)
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data['tags'], [{'id': tag.id,
+                                             'name': 'Vegetarian'}])
+        self.assertEqual(res.data['ingredients'], [{'id': ingredient.id,
+                                                    'name': 'Rice'}])
+
+        ingredient.delete()
+        tag.recipe_set.clear()
+        res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data['tags'], [])
+        self.assertEqual(res.data['ingredients'], [])
+
     def test_create_basic_recipe(self):
         """ test creating recipe """
         payload = {
@@ -187,7 +293,7 @@ class PrivateRecipeApiTests(TestCase):
 
     def test_full_update_recipe(self):
         """ Test updating a recipe with put -- updates whole if we ommit a field will not exist """
-        recipe = sample_recipe(user=self.name)
+        recipe = sample_recipe(user=self.user)
         recipe.tags.add(sample_tag(user=self.user))
         payload = {
             'title':'Spaghetti carbonara',
@@ -204,6 +310,264 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags),0)
 
+class RecipeBulkApiTests(TestCase):
+    """ test the bulk recipe endpoint """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+
+    def test_bulk_create_recipes(self):
+        """ test creating many recipes with tags and ingredients """
+        payload = [
+            {'title': f'recipe {i}', 'time_minutes': i, 'price': '5.00',
+             'tags': [self.tag.id], 'ingredients': [self.ingredient.id]}
+            for i in range(200)
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.assertEqual(len(res.data), 200)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([recipe['id'] for recipe in res.data],
+                         [recipe.id for recipe in recipes])
+        self.assertEqual(res.data[1], {
+            'id': recipes[1].id, 'title': 'recipe 1',
+            'ingredients': [self.ingredient.id], 'tags': [self.tag.id],
+            'time_minutes': 1, 'price': '5.00',
+        })
+        self.assertEqual(self.tag.recipe_set.count(), 200)
+        self.assertEqual(self.ingredient.recipe_set.count(), 200)
+
+    def test_bulk_create_foreign_tag_rejected(self):
+        """ test recipes can only link the user's own tags """
+        other = get_user_model().objects.create_user('o@gmail.com', 'pass')
+        payload = [
+            {'title': 'mine', 'time_minutes': 5, 'price': '5.00',
+             'tags': [self.tag.id]},
+            {'title': 'theirs', 'time_minutes': 5, 'price': '5.00',
+             'tags': [sample_tag(user=other).id]},
+        ]
+
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('tags', res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update_recipes(self):
+        """ test partially updating many recipes at once """
+        recipe1 = sample_recipe(user=self.user)
+        recipe1.tags.add(self.tag)
+        recipe2 = sample_recipe(user=self.user, title='Soup')
+        new_tag = sample_tag(user=self.user, name='Curry')
+        payload = [
+            {'id': recipe1.id, 'title': 'Chicken tikka', 'tags': [new_tag.id]},
+            {'id': recipe2.id, 'price': '7.50'},
+        ]
+
+        res = self.client.patch(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe1.title, 'Chicken tikka')
+        self.assertEqual(list(recipe1.tags.all()), [new_tag])
+        self.assertEqual(recipe2.title, 'Soup')
+        self.assertEqual(str(recipe2.price), '7.50')
+        self.assertEqual(res.data[1]['price'], '7.50')
+        res = self.client.get(detail_url(recipe1.id))
+        self.assertEqual(res.data['tags'], [{'id': new_tag.id,
+                                             'name': 'Curry'}])
+
+    def test_bulk_update_duplicate_ids_rejected(self):
+        """ test an id may only be updated once per batch """
+        recipe = sample_recipe(user=self.user)
+        payload = [{'id': recipe.id, 'title': 'a'},
+                   {'id': recipe.id, 'title': 'b'}]
+
+        res = self.client.patch(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_delete_recipes(self):
+        """ test deleting many recipes of the user """
+        recipes = [sample_recipe(user=self.user) for _ in range(3)]
+        recipes[0].tags.add(self.tag)
+
+        res = self.client.delete(
+            RECIPES_BULK_URL, [recipes[0].id, recipes[1].id], format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Recipe.objects.all()), [recipes[2]])
+        self.assertFalse(self.tag.recipe_set.exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+    def test_bulk_created_recipes_searchable(self):
+        """ test bulk inserts maintain the search vectors """
+        payload = [{'title': 'Plain', 'time_minutes': 5, 'price': '5.00',
+                    'tags': [self.tag.id]}]
+        self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        res = self.client.get(RECIPES_URL, {'search': self.tag.name})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+class RecipeExportApiTests(TestCase):
+    """ test streaming the recipe collection """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_export_ndjson(self):
+        """ test every recipe is one JSON line with its tag and
+        ingredient names """
+        recipe = sample_recipe(user=self.user, title='Curry')
+        recipe.tags.add(sample_tag(user=self.user, name='Vegan'))
+        recipe.ingredients.add(sample_ingredient(user=self.user, name='Rice'))
+        sample_recipe(user=self.user, title='Soup')
+        other = get_user_model().objects.create_user('o@gmail.com', 'pass')
+        sample_recipe(user=other, title='Not mine')
+
+        res = self.client.get(RECIPES_EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['title'] for row in rows], ['Curry', 'Soup'])
+        self.assertEqual(rows[0], {
+            'id': recipe.id, 'title': 'Curry', 'time_minutes': 10,
+            'price': '5.00', 'link': '', 'tags': ['Vegan'],
+            'ingredients': ['Rice'],
+        })
+
+    def test_export_csv(self):
+        """ test the CSV export, negotiated from the Accept header """
+        recipe = sample_recipe(user=self.user, title='Curry, hot')
+        recipe.tags.add(sample_tag(user=self.user, name='Vegan'))
+
+        res = self.client.get(RECIPES_EXPORT_URL, HTTP_ACCEPT='text/csv')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Curry, hot')
+        self.assertEqual(json.loads(rows[0]['tags']), ['Vegan'])
+        self.assertEqual(json.loads(rows[0]['ingredients']), [])
+
+    def test_export_constant_queries_per_chunk(self):
+        """ test each chunk of recipes costs the same number of queries """
+        tag = sample_tag(user=self.user)
+        for i in range(5):
+            sample_recipe(user=self.user, title=f'recipe {i}').tags.add(tag)
+
+        with patch('recipe.export.CHUNK_SIZE', 2), \
+                CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPES_EXPORT_URL)
+            lines = b''.join(res.streaming_content).splitlines()
+
+        self.assertEqual(len(lines), 5)
+        # one cursor read plus tags and ingredients for each of 3 chunks
+        self.assertEqual(len(ctx.captured_queries), 1 + 3 * 2)
+
+    def test_export_invalid_type(self):
+        """ test an unknown export type is rejected """
+        res = self.client.get(RECIPES_EXPORT_URL, {'type': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+@skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+class RecipeSearchApiTests(TestCase):
+    """ test full-text searching of recipes """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_search_by_title(self):
+        """ test searching returns recipes matching the title """
+        curry = sample_recipe(user=self.user, title='Thai red curry')
+        sample_recipe(user=self.user, title='Fish and chips')
+
+        res = self.client.get(RECIPES_URL, {'search': 'curry'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [curry.id])
+
+    def test_search_limited_to_user(self):
+        """ test searching does not return other users' recipes """
+        other = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        sample_recipe(user=other, title='Green curry')
+
+        res = self.client.get(RECIPES_URL, {'search': 'curry'})
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_search_tags_and_ingredients_ranked(self):
+        """ test tag and ingredient names match, title matches rank first """
+        by_title = sample_recipe(user=self.user, title='Chicken curry')
+        by_tag = sample_recipe(user=self.user, title='Weeknight dinner')
+        by_tag.tags.add(sample_tag(user=self.user, name='Chicken'))
+        by_ingredient = sample_recipe(user=self.user, title='Roast')
+        ingredient = sample_ingredient(user=self.user, name='Chickens')
+        by_ingredient.ingredients.add(ingredient)
+        sample_recipe(user=self.user, title='Salad')
+
+        res = self.client.get(RECIPES_URL, {'search': 'chicken'})
+
+        self.assertEqual(
+            [r['id'] for r in res.data['results']],
+            [by_title.id, by_tag.id, by_ingredient.id]
+        )
+
+        ingredient.name = 'Beef'
+        ingredient.save()
+        res = self.client.get(RECIPES_URL, {'search': 'chicken'})
+
+        self.assertNotIn(by_ingredient.id,
+                         [r['id'] for r in res.data['results']])
+
+    def test_search_paginated_by_rank(self):
+        """ test cursor pages keep the ranked order """
+        for i in range(5):
+            sample_recipe(user=self.user, title='curry ' * (i + 1))
+
+        first = self.client.get(RECIPES_URL,
+                                {'search': 'curry', 'page_size': 3})
+        second = self.client.get(first.data['next'])
+
+        ids = [r['id'] for r in first.data['results'] +
+               second.data['results']]
+        self.assertEqual(len(set(ids)), 5)
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0)
 class RecipeImageUploadTests(TestCase):
 
     def setUp(self):
@@ -216,8 +580,21 @@ class RecipeImageUploadTests(TestCase):
         self.recipe = sample_recipe(user=self.user)
 
     def tearDown(self):
-        """ delete images after test """
-        self.recipe.image.delete()
+        """ delete images and their derivatives after test """
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            images.delete_image_files(
+                self.recipe.image.storage,
+                self.recipe.image.name
+            )
+
+    def _upload(self, img, image_format='JPEG', **save_kwargs):
+        """ upload a PIL image to the recipe """
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img.save(ntf, format=image_format, **save_kwargs)
+            ntf.seek(0)
+            return self.client.post(url, {'image':ntf}, format='multipart')
 
     def test_upload_image_to_recipe(self):
         """ test uploading image to recipe """
@@ -230,10 +607,73 @@ class RecipeImageUploadTests(TestCase):
             ntf.seek(0)
             res = self.client.post(url, {'image':ntf}, format='multipart')
         self.recipe.refresh_from_db()
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn('image', res.data)
+        self.assertEqual(res.data['image_status'], Recipe.IMAGE_PENDING)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def test_upload_image_processed(self):
+        """ test uploaded images are stripped and resized """
+        img = Image.new('RGB', (2000, 1000))
+        exif = Image.Exif() if hasattr(Image, 'Exif') else None
+        if exif is not None:
+            exif[0x0110] = 'Secret phone'
+            res = self._upload(img, exif=exif.tobytes())
+        else:
+            res = self._upload(img)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+        with Image.open(self.recipe.image.path) as stored:
+            self.assertNotIn('exif', stored.info)
+        name = self.recipe.image.name
+        for path in images.derivative_names(name):
+            self.assertTrue(self.recipe.image.storage.exists(path))
+        thumb = images.derivative_name(name, 300, 'jpg')
+        with Image.open(self.recipe.image.storage.path(thumb)) as small:
+            self.assertEqual(small.size, (300, 150))
+
+    def test_upload_corrupt_image_fails(self):
+        """ test an image with a valid header but bad data is rejected """
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.new('RGB', (50, 50)).save(ntf, format='PNG')
+            ntf.truncate(60)
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_FAILED)
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_reencoded_image_renamed(self):
+        """ test images re-encoded as JPEG are stored under a .jpg name """
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.gif') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='GIF')
+            ntf.seek(0)
+            self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+        self.assertTrue(self.recipe.image.name.endswith('.jpg'))
+        with Image.open(self.recipe.image.path) as stored:
+            self.assertEqual(stored.format, 'JPEG')
+        stem = os.path.splitext(self.recipe.image.path)[0]
+        self.assertFalse(os.path.exists(stem + '.gif'))
+
+    def test_upload_replaces_previous_image(self):
+        """ test uploading a new image removes the old files """
+        self._upload(Image.new('RGB', (10, 10)))
+        self.recipe.refresh_from_db()
+        old = self.recipe.image.path
+
+        self._upload(Image.new('RGB', (10, 10)))
+
+        self.assertFalse(os.path.exists(old))
+
     def test_upload_image_bad_request(self):
         """ test uploading an invalid image """
         url = image_upload_url(self.recipe.id)
@@ -241,6 +681,55 @@ class RecipeImageUploadTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_image_thumbnail(self):
+        """ test a thumbnail is generated once and then served cached """
+        self._upload(Image.new('RGB', (1000, 500)))
+
+        with tempfile.TemporaryDirectory() as root, \
+                self.settings(RECIPE_THUMBNAIL_ROOT=root):
+            res = self.client.get(image_url(self.recipe.id),
+                                  {'size': 150, 'type': 'webp'})
+            # reading the body lets the client close the response
+            content = b''.join(res.streaming_content)
+            again = self.client.get(image_url(self.recipe.id),
+                                    {'size': 150, 'type': 'webp'},
+                                    HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        with Image.open(io.BytesIO(content)) as thumb:
+            self.assertEqual(thumb.size, (200, 100))
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_image_thumbnail_negotiates_webp(self):
+        """ test WebP is served to clients that accept it """
+        self._upload(Image.new('RGB', (100, 100)))
+
+        with tempfile.TemporaryDirectory() as root, \
+                self.settings(RECIPE_THUMBNAIL_ROOT=root):
+            webp = self.client.get(image_url(self.recipe.id),
+                                   HTTP_ACCEPT='image/webp,*/*')
+            jpeg = self.client.get(image_url(self.recipe.id))
+            b''.join(webp.streaming_content)
+            b''.join(jpeg.streaming_content)
+
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        self.assertEqual(jpeg['Content-Type'], 'image/jpeg')
+
+    def test_image_thumbnail_without_image(self):
+        """ test requesting a thumbnail of a recipe with no image """
+        res = self.client.get(image_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_image_thumbnail_invalid_type(self):
+        """ test unsupported thumbnail types are rejected """
+        self._upload(Image.new('RGB', (100, 100)))
+
+        res = self.client.get(image_url(self.recipe.id), {'type': 'gif'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_filter_recipes_by_tags(self):
         """ test returning recipes with specific tags """
         recipe1 = sample_recipe(user=self.user, title='thai vegetable curry')
@@ -257,13 +746,13 @@ class RecipeImageUploadTests(TestCase):
             {'tags':f'{tag1.id}, {tag2.id}'}
         )
 
-        serializer1 = RecipeSerializer(recip1)
+        serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         """ test returning recipes with specific ingredients """
@@ -284,9 +773,53 @@ class RecipeImageUploadTests(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+    def test_filter_recipes_match_any_unique(self):
+        """ test a recipe matching several ids is returned once """
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Quick')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
 
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
 
+    def test_filter_recipes_match_all(self):
+        """ test match=all only returns recipes carrying every id """
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Quick')
+        rice = sample_ingredient(user=self.user, name='Rice')
+        both = sample_recipe(user=self.user, title='both')
+        both.tags.add(tag1, tag2)
+        both.ingredients.add(rice)
+        sample_recipe(user=self.user, title='one').tags.add(tag1)
+        no_rice = sample_recipe(user=self.user, title='no rice')
+        no_rice.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{tag1.id},{tag2.id},{tag1.id}',
+            'ingredients': f'{rice.id}',
+            'match': 'all',
+        })
+
+        self.assertEqual([r['id'] for r in res.data['results']], [both.id])
+
+    def test_filter_recipes_invalid_params(self):
+        """ test malformed filters are rejected with 400, not 500 """
+        for params in ({'tags': '1,abc'}, {'ingredients': '1;2'},
+                       {'tags': '1', 'match': 'some'}):
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_FILTER_MAX_IDS=2)
+    def test_filter_recipes_too_many_ids(self):
+        """ test the number of filter ids is capped """
+        res = self.client.get(RECIPES_URL, {'tags': '1,2,3'})
 
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
@@ -1,12 +1,16 @@
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework import status
 from rest_framework.test import APIClient
 from core.models import Tag, Recipe
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
 
 class PublicTagsApiTests(TestCase):
     """" Test the publicity available tags API"""
@@ -27,6 +31,7 @@ class PrivateTagsApiTests(TestCase):
         )
         self.client = APIClient()
         self.client.force_authenticate(self.user)
+        cache.clear()
 
     def test_retrieve_tags(self):
         """ Test retrieving tags """
@@ -36,7 +41,7 @@ class PrivateTagsApiTests(TestCase):
         tags=Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags,many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """ Test tags returned are for the authenticated user"""
@@ -48,8 +53,8 @@ class PrivateTagsApiTests(TestCase):
         tag = Tag.objects.create(user=self.user, name='Comfort food')
         res=self.client.get(TAGS_URL)
         self.assertEqual(res.status_code,status.HTTP_200_OK)
-        self.assertEqual(len(res.data),1)
-        self.assertEqual(res.data[0]['name'],tag.name)
+        self.assertEqual(len(res.data['results']),1)
+        self.assertEqual(res.data['results'][0]['name'],tag.name)
 
     def test_create_tag_successful(self):
         """ Test creating a new tag """
@@ -81,12 +86,12 @@ class PrivateTagsApiTests(TestCase):
         )
         recipe.tags.add(tag1)
 
-        res =self.client.get(TAGS_URL, {'assignes_only':1})
+        res =self.client.get(TAGS_URL, {'assigned_only':1})
 
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_tags_assigned_unique(self):
         """ Test filtering tags by assigned returns unique items """
@@ -109,4 +114,175 @@ class PrivateTagsApiTests(TestCase):
         recipe2.tags.add(tag)
 
         res = self.client.get(TAGS_URL, {'assigned_only':1})
-        self.assertEqual(len(res.data),1)
\ No newline at end of file
+        self.assertEqual(len(res.data['results']),1)
+
+    def test_retrieve_tags_cached(self):
+        """ Test repeated tag lists are served without querying the db """
+        Tag.objects.create(user=self.user, name='vegan')
+        first = self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data, first.data)
+        self.assertEqual(res['ETag'], first['ETag'])
+
+    def test_retrieve_tags_not_modified(self):
+        """ Test a matching If-None-Match returns 304 """
+        Tag.objects.create(user=self.user, name='vegan')
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_create_tag_invalidates_cache(self):
+        """ Test creating a tag changes the cached list and ETag """
+        first = self.client.get(TAGS_URL)
+        self.client.post(TAGS_URL, {'name': 'dessert'})
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], first['ETag'])
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_tag_write_invalidates_cache_on_commit(self):
+        """ Test a list cached while the write commits is made stale """
+        with patch('django.db.transaction.on_commit') as on_commit:
+            Tag.objects.create(user=self.user, name='dessert')
+        first = self.client.get(TAGS_URL)
+
+        on_commit.call_args[0][0]()
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_assigning_tag_invalidates_assigned_only(self):
+        """ Test adding a tag to a recipe refreshes assigned_only lists """
+        tag = Tag.objects.create(user=self.user, name='lunch')
+        recipe = Recipe.objects.create(
+            title='soup',
+            time_minutes=10,
+            price=5.00,
+            user=self.user
+        )
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(len(res.data['results']), 0)
+
+        recipe.tags.add(tag)
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
+
+        recipe.delete()
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data['results']), 0)
+
+    def test_bulk_create_tags(self):
+        """ Test creating many tags in one request """
+        first = self.client.get(TAGS_URL)
+        payload = [{'name': f'tag {i}'} for i in range(3)]
+
+        res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([tag['name'] for tag in res.data],
+                         ['tag 0', 'tag 1', 'tag 2'])
+        tags = Tag.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([tag.id for tag in tags],
+                         [tag['id'] for tag in res.data])
+        res = self.client.get(TAGS_URL)
+        self.assertNotEqual(res['ETag'], first['ETag'])
+
+    def test_bulk_create_tags_invalid(self):
+        """ Test one invalid item rejects the whole batch """
+        payload = [{'name': 'vegan'}, {'name': ''}]
+
+        res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('name', res.data[1])
+        self.assertFalse(Tag.objects.exists())
+
+    @override_settings(RECIPE_BULK_MAX_ITEMS=2)
+    def test_bulk_create_tags_limit(self):
+        """ Test batches above the item limit are rejected """
+        payload = [{'name': 'a'}, {'name': 'b'}, {'name': 'c'}]
+
+        res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Tag.objects.exists())
+
+    def test_bulk_update_tags(self):
+        """ Test renaming many tags, only the user's own """
+        tag1 = Tag.objects.create(user=self.user, name='vegan')
+        tag2 = Tag.objects.create(user=self.user, name='dessert')
+        other = Tag.objects.create(
+            user=get_user_model().objects.create_user('o@gmail.com', 'pass'),
+            name='fruity'
+        )
+        payload = [{'id': tag1.id, 'name': 'vegetarian'},
+                   {'id': tag2.id, 'name': 'sweets'}]
+
+        res = self.client.patch(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, payload)
+        tag1.refresh_from_db()
+        self.assertEqual(tag1.name, 'vegetarian')
+
+        payload = [{'id': other.id, 'name': 'mine'}, {'name': 'no id'}]
+        res = self.client.patch(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', res.data[0])
+        self.assertIn('id', res.data[1])
+        other.refresh_from_db()
+        self.assertEqual(other.name, 'fruity')
+
+    def test_bulk_delete_tags(self):
+        """ Test deleting many tags, rejecting ids of other users """
+        tags = [Tag.objects.create(user=self.user, name=f'tag {i}')
+                for i in range(3)]
+        other = Tag.objects.create(
+            user=get_user_model().objects.create_user('o@gmail.com', 'pass'),
+            name='fruity'
+        )
+
+        res = self.client.delete(TAGS_BULK_URL, [tags[0].id, other.id],
+                                 format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], [])
+        self.assertEqual(Tag.objects.count(), 4)
+
+        res = self.client.delete(TAGS_BULK_URL, [tags[0].id, tags[1].id],
+                                 format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Tag.objects.filter(user=self.user)), [tags[2]])
+
+    def test_bulk_delete_tags_refreshes_recipes(self):
+        """ Test bulk deleting tags refreshes the recipes and the cache """
+        tags = [Tag.objects.create(user=self.user, name=f'tag {i}')
+                for i in range(2)]
+        recipe = Recipe.objects.create(user=self.user, title='Stew',
+                                       time_minutes=5, price=5.00)
+        recipe.tags.add(*tags)
+        self.client.get(TAGS_URL)
+
+        res = self.client.delete(TAGS_BULK_URL, [tags[0].id], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        recipe.refresh_from_db()
+        self.assertEqual([pk for pk, _ in recipe.related_snapshot['tags']],
+                         [tags[1].id])
+        res = self.client.get(TAGS_URL)
+        self.assertEqual([tag['id'] for tag in res.data['results']],
+                         [tags[1].id])
@@ -0,0 +1,84 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from recipe.thumbnails import ThumbnailCache
+
+
+class ThumbnailCacheTests(TestCase):
+    """ test the size-bounded thumbnail cache """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.settings_override = override_settings(
+            RECIPE_THUMBNAIL_ROOT=self.tmp.name,
+            RECIPE_THUMBNAIL_CACHE_BYTES=25,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.cache = ThumbnailCache()
+        self.renders = []
+
+    def _get(self, digest, cache=None):
+        def render():
+            self.renders.append(digest)
+            return b'x' * 10
+        fp = (cache or self.cache).get_or_create(digest, 100, 'jpg', render)
+        self.addCleanup(fp.close)
+        return fp
+
+    def _path(self, digest):
+        return self.cache.path(digest, 100, 'jpg')
+
+    def test_hit_does_not_render(self):
+        """ test a cached thumbnail is not rendered again """
+        self._get('aa11')
+        second = self._get('aa11')
+
+        self.assertEqual(self.renders, ['aa11'])
+        self.assertEqual(second.read(), b'x' * 10)
+
+    def test_least_recently_used_evicted(self):
+        """ test the cache stays under its byte budget """
+        self._get('aa11')
+        self._get('bb22')
+        self._get('aa11')
+        self._get('cc33')
+
+        self.assertTrue(os.path.exists(self._path('aa11')))
+        self.assertFalse(os.path.exists(self._path('bb22')))
+
+    def test_evicted_after_lookup_still_readable(self):
+        """ test an eviction right after a hit does not break the read """
+        self._get('aa11')
+        fp = self._get('aa11')
+
+        os.remove(self._path('aa11'))
+
+        self.assertEqual(fp.read(), b'x' * 10)
+
+    def test_index_rebuilt_from_disk(self):
+        """ test a new process picks up thumbnails already on disk """
+        self._get('aa11')
+
+        fp = ThumbnailCache().get_or_create('aa11', 100, 'jpg',
+                                            lambda: b'never')
+        self.addCleanup(fp.close)
+        self.assertEqual(fp.read(), b'x' * 10)
+
+    def test_rescan_counts_other_processes(self):
+        """ test files written by another process count after a rescan """
+        other = ThumbnailCache()
+        with patch('recipe.thumbnails.time.monotonic', return_value=0):
+            self._get('aa11')
+            self._get('bb22', cache=other)
+        with patch('recipe.thumbnails.time.monotonic', return_value=61):
+            self._get('cc33')
+
+        remaining = [digest for digest in ('aa11', 'bb22', 'cc33')
+                     if os.path.exists(self._path(digest))]
+        self.assertEqual(len(remaining), 2)
+        self.assertIn('cc33', remaining)
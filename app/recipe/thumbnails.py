@@ -0,0 +1,184 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from django.conf import settings
+
+from core.models import Recipe
+from recipe.images import encode_image
+
+# ?type= value -> (file extension, Pillow format, content type)
+THUMBNAIL_TYPES = {
+    'jpeg': ('jpg', 'JPEG', 'image/jpeg'),
+    'webp': ('webp', 'WEBP', 'image/webp'),
+}
+
+
+def snap_size(size):
+    """ smallest configured thumbnail size at least `size` wide """
+    sizes = sorted(settings.RECIPE_THUMBNAIL_SIZES)
+    for allowed in sizes:
+        if allowed >= size:
+            return allowed
+    return sizes[-1]
+
+
+def source_hash(recipe):
+    """ content hash of the recipe image, computed once if missing """
+    if not recipe.image_hash:
+        digest = hashlib.sha256()
+        with recipe.image.storage.open(recipe.image.name, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(64 * 1024), b''):
+                digest.update(chunk)
+        recipe.image_hash = digest.hexdigest()
+        Recipe.objects.filter(pk=recipe.pk, image=recipe.image.name) \
+                      .update(image_hash=recipe.image_hash)
+    return recipe.image_hash
+
+
+def render_thumbnail(recipe, size, image_format):
+    """ encode the recipe image scaled to fit a size x size box """
+    with recipe.image.storage.open(recipe.image.name, 'rb') as fp:
+        image = Image.open(fp)
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+    image.thumbnail((size, size), Image.LANCZOS)
+    return encode_image(image, image_format)
+
+
+def open_unnamed(path):
+    """ open a file that callers must not look up by path again """
+    # the path may be evicted or renamed while the file is being read
+    return os.fdopen(os.open(path, os.O_RDONLY), 'rb')
+
+
+class ThumbnailCache:
+    """ Size-bounded directory of thumbnails with LRU eviction.
+
+    Files are named after the source content hash, so identical images
+    share thumbnails and a re-uploaded image never hits a stale entry.
+    Recency is kept in an in-process index seeded from file mtimes, and
+    a hit refreshes the mtime so other processes agree on the order.
+
+    Each process rescans the directory every RECIPE_THUMBNAIL_RESCAN
+    seconds to pick up the files written by other workers, so the byte
+    limit holds across processes up to what they wrote since the last
+    scan.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._index_root = None
+        self._scanned = 0
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @property
+    def root(self):
+        return getattr(settings, 'RECIPE_THUMBNAIL_ROOT', None) or \
+            os.path.join(settings.MEDIA_ROOT, 'thumbnails')
+
+    @property
+    def max_bytes(self):
+        return settings.RECIPE_THUMBNAIL_CACHE_BYTES
+
+    @property
+    def rescan(self):
+        return getattr(settings, 'RECIPE_THUMBNAIL_RESCAN', 60)
+
+    def path(self, digest, size, extension):
+        return os.path.join(self.root, digest[:2],
+                            f'{digest}_{size}.{extension}')
+
+    def get_or_create(self, digest, size, extension, render):
+        """ the cached thumbnail opened for reading, rendered on a miss.
+
+        The file is opened before the lock is released, so an eviction
+        right after cannot pull it from under the caller.
+        """
+        path = self.path(digest, size, extension)
+        with self._lock:
+            self._load_index()
+            try:
+                # may have been written by another process
+                fp = open_unnamed(path)
+            except FileNotFoundError:
+                pass
+            else:
+                os.utime(fp.fileno())
+                if path not in self._index:
+                    self._index[path] = os.fstat(fp.fileno()).st_size
+                    self._total += self._index[path]
+                self._index.move_to_end(path)
+                return fp
+
+        data = render()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        fp = open_unnamed(tmp)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._total -= self._index.pop(path, 0)
+            self._index[path] = len(data)
+            self._total += len(data)
+            self._evict(keep=path)
+        return fp
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._total = 0
+
+    def _load_index(self):
+        if self._index is not None and self._index_root == self.root and \
+                time.monotonic() - self._scanned < self.rescan:
+            return
+        self._index_root = self.root
+        self._scanned = time.monotonic()
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((path, size) for _, path, size in entries)
+        self._total = sum(self._index.values())
+
+    def _evict(self, keep):
+        while self._total > self.max_bytes and len(self._index) > 1:
+            path, size = next(iter(self._index.items()))
+            if path == keep:
+                self._index.move_to_end(path)
+                continue
+            del self._index[path]
+            self._total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+thumbnail_cache = ThumbnailCache()
+
+
+def get_thumbnail(recipe, size, thumbnail_type):
+    """ open file and content type of the thumbnail, made on demand """
+    extension, image_format, content_type = THUMBNAIL_TYPES[thumbnail_type]
+    fp = thumbnail_cache.get_or_create(
+        source_hash(recipe), size, extension,
+        lambda: render_thumbnail(recipe, size, image_format)
+    )
+    return fp, content_type
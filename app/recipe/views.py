@@ -1,78 +1,237 @@
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.http import (
+    FileResponse, HttpResponseNotModified, StreamingHttpResponse
+)
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from core.authentication import CachedTokenAuthentication
 from core.models import Tag, Ingredient, Recipe
+from core import snapshots
+from core.search import search_recipes
+from core.views import ReplicaReadMixin
 from recipe import serializers
+from recipe import bulk
+from recipe import cache as list_cache
+from recipe import export
+from recipe import facets
+from recipe import filters
+from recipe import images
+from recipe import thumbnails
+from recipe.pagination import RecipeAttrPagination, RecipePagination
+
+
+class BulkModelMixin:
+    """ POST, PATCH or DELETE a JSON array on the `bulk` list route.
+
+    POST creates every item, PATCH partially updates items carrying an
+    id and DELETE takes a list of ids. A batch is validated as a whole
+    and written in one transaction, errors are reported per item. The
+    response echoes each item as written with its id rather than reading
+    the batch back.
+    """
+    bulk_serializer_class = None
+
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False,
+            url_path='bulk')
+    def bulk(self, request):
+        """ create, update or delete many objects in one request """
+        if request.method == 'DELETE':
+            ids = serializers.validate_bulk_ids(
+                request.data,
+                bulk.owned_ids(self.queryset.model, request.user)
+            )
+            self.perform_bulk_destroy(ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        partial = request.method == 'PATCH'
+        serializer = self.get_serializer(
+            data=request.data, many=True, partial=partial
+        )
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+        if partial:
+            self.perform_bulk_update(items)
+        else:
+            for item, pk in zip(items, self.perform_bulk_create(items)):
+                item['id'] = pk
+        return Response(
+            serializer.data,
+            status=status.HTTP_200_OK if partial else status.HTTP_201_CREATED
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'bulk':
+            context.update(self.get_bulk_context())
+        return context
 
+    def get_bulk_context(self):
+        """ owned ids the bulk serializer validates against """
+        if self.request.method != 'PATCH':
+            return {}
+        return {
+            'ids': bulk.owned_ids(self.queryset.model, self.request.user)
+        }
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+    def perform_bulk_destroy(self, ids):
+        bulk.delete_owned(self.queryset.model, self.request.user, ids)
+
+
+class BaseRecipeAttrViewSet(ReplicaReadMixin,
+                        BulkModelMixin,
+                        viewsets.GenericViewSet,
                         mixins.ListModelMixin,
                         mixins.CreateModelMixin):
     """ base viewset for user owned recipe attributes """
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeAttrPagination
 
     def get_queryset(self):
         """ return objects for the current authenticated user only """
         assigned_only = bool(
             int(self.request.query_params.get('assigned_only',0))
         )
-        queryset = self.get_queryset
+        queryset = self.queryset
         if assigned_only:
             queryset = queryset.filter(recipe__isnull=False)
         return queryset.filter(
             user=self.request.user
             # make sure query returned is unique
-        ).order_by('-name').distinct()
+        ).order_by('-name', 'id').distinct()
+
+    def list(self, request, *args, **kwargs):
+        """ return the cached list, or 304 if the client's copy is current """
+        model = self.queryset.model
+        url = request.build_absolute_uri()
+        version = list_cache.get_version(model, request.user.pk)
+        etag = list_cache.list_etag(version, url)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = list_cache.list_key(model, request.user.pk, version, url)
+            data = cache.get(key)
+            if data is None:
+                data = super().list(request, *args, **kwargs).data
+                cache.set(key, data, list_cache.list_timeout())
+            response = Response(data)
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def get_serializer_class(self):
+        if self.action == 'bulk':
+            return self.bulk_serializer_class
+        return self.serializer_class
 
     def perform_create(self,serializer):
         """ create a new object """
         serializer.save(user=self.request.user)
 
+    def perform_bulk_create(self, items):
+        return bulk.create_attrs(self.queryset.model, self.request.user, items)
+
+    def perform_bulk_update(self, items):
+        return bulk.update_attrs(self.queryset.model, self.request.user, items)
+
 class TagViewSet(BaseRecipeAttrViewSet):
     """ manage tags in db """
     queryset=Tag.objects.all()
     serializer_class=serializers.TagSerializer
+    bulk_serializer_class = serializers.TagBulkSerializer
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """ Manage ingredients in the database """
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    bulk_serializer_class = serializers.IngredientBulkSerializer
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin,
+                    BulkModelMixin,
+                    viewsets.ModelViewSet):
     """ Manage recipes in database  """
     serializer_class = serializers.RecipeSerializer
+    bulk_serializer_class = serializers.RecipeBulkSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
-
-    def _params_to_ints(self, qs):
-        """ convert a list of string IDs to a list of integers"""
-        return [int(str_id) for str_id in qs.split(',')]
+    pagination_class = RecipePagination
+    # related fields each action's serializer emits, fetched in one query
+    # per relation instead of two queries per recipe
+    prefetch_fields = {
+        'list': ('id',),
+        'retrieve': ('id', 'name'),
+    }
 
     def get_queryset(self):
-        """ Retrieve recipes of authenticated user """
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
+        """ Retrieve recipes of authenticated user.
+
+        `tags` and `ingredients` take comma separated ids, `match=all`
+        requires every listed id instead of any of them.
+        """
+        params = self.request.query_params
+        terms = params.get('search', '').strip()
+        match = filters.parse_match(params.get('match'))
         queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            # filter by id foreign key tags->id->return all ids in list we provide
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredients_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredients_ids)
+        if terms:
+            # ranked full-text match on title, tag and ingredient names
+            queryset = search_recipes(queryset, terms)
+        for name in filters.RELATIONS:
+            ids = filters.parse_ids(params.get(name, ''), name)
+            if ids:
+                queryset = filters.filter_related(queryset, name, ids, match)
+        queryset = queryset.prefetch_related(*self.get_prefetch_plan())
         return queryset.filter(user = self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """ list recipes, `facets=1` adds tag and ingredient counts.
+
+        The counts cover every recipe matching the filters, not only the
+        current page.
+        """
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets', '0') not in ('0', 'false', ''):
+            response.data['facets'] = facets.recipe_facets(
+                self.filter_queryset(self.get_queryset())
+            )
+        return response
+
+    def get_pagination_ordering(self):
+        """ best search matches first, newest first otherwise """
+        if self.request.query_params.get('search', '').strip():
+            return ('-rank', '-id')
+        return None
+
+    def get_prefetch_plan(self):
+        """ Return the Prefetch objects needed by the current action """
+        fields = self.prefetch_fields.get(self.action)
+        # recipes render their tags and ingredients from the snapshot
+        if not fields or snapshots.enabled():
+            return []
+        return [
+            Prefetch('tags', queryset=Tag.objects.only(*fields)),
+            Prefetch('ingredients',
+                     queryset=Ingredient.objects.only(*fields)),
+        ]
+
     def get_serializer_class(self):
         """ Return appropriate serializer class """
         if self.action == 'retrieve':
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'bulk':
+            return self.bulk_serializer_class
 
         return self.serializer_class
 
@@ -80,24 +239,123 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """ create a new recipe , assign it to aour authenticated user"""
         serializer.save(user=self.request.user)
 
+    def get_bulk_context(self):
+        """ recipes may only link the user's own tags and ingredients """
+        context = super().get_bulk_context()
+        context['tag_ids'] = bulk.owned_ids(Tag, self.request.user)
+        context['ingredient_ids'] = bulk.owned_ids(
+            Ingredient, self.request.user
+        )
+        return context
+
+    def perform_bulk_create(self, items):
+        return bulk.create_recipes(self.request.user, items)
+
+    def perform_bulk_update(self, items):
+        return bulk.update_recipes(self.request.user, items)
+
     """ identify methods will accept """
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
-       """ upload an image to a recipe """
+       """ upload an image to a recipe, processed in the background """
        recipe = self.get_object()
+       previous = recipe.image.name if recipe.image else None
        serializer = self.get_serializer(
            recipe,
            data=request.data
        )
-       """ validate image is correct """
+       """ only the header is checked here, see recipe.images """
        if serializer.is_valid():
-           serializer.save()
+           serializer.save(image_status=Recipe.IMAGE_PENDING)
+           if previous:
+               images.delete_image_files(recipe.image.storage, previous)
+           images.schedule(recipe.id)
            return Response(
                serializer.data,
-               status=status.HTTP_200_OK
+               status=status.HTTP_202_ACCEPTED
            )
 
        return Response(
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
-        )
\ No newline at end of file
+        )
+
+    def perform_content_negotiation(self, request, force=False):
+        """ image and export responses skip the renderers, accept any type """
+        force = force or self.action in ('image', 'export')
+        return super().perform_content_negotiation(request, force)
+
+    @action(methods=['GET'], detail=True, url_path='image')
+    def image(self, request, pk=None):
+        """ return a cached thumbnail of the recipe image """
+        recipe = self.get_object()
+        if not recipe.image:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if recipe.image_status != Recipe.IMAGE_READY:
+            return Response(
+                {'image_status': recipe.image_status},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            size = thumbnails.snap_size(
+                int(request.query_params.get('size', 0))
+            )
+        except ValueError:
+            return Response(
+                {'size': ['A valid integer is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        thumbnail_type = request.query_params.get('type')
+        if thumbnail_type is None:
+            accept = request.META.get('HTTP_ACCEPT', '')
+            thumbnail_type = 'webp' if 'image/webp' in accept else 'jpeg'
+        if thumbnail_type not in thumbnails.THUMBNAIL_TYPES:
+            choices = ', '.join(thumbnails.THUMBNAIL_TYPES)
+            return Response(
+                {'type': [f'Choose one of {choices}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        etag = quote_etag(
+            f'{thumbnails.source_hash(recipe)}-{size}-{thumbnail_type}'
+        )
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            fp, content_type = thumbnails.get_thumbnail(
+                recipe, size, thumbnail_type
+            )
+            response = FileResponse(fp, content_type=content_type)
+            response['Content-Length'] = os.fstat(fp.fileno()).st_size
+        response['ETag'] = etag
+        patch_cache_control(
+            response, private=True,
+            max_age=settings.RECIPE_THUMBNAIL_MAX_AGE
+        )
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """ stream every recipe of the user as NDJSON or CSV """
+        export_type = request.query_params.get('type')
+        if export_type is None:
+            accept = request.META.get('HTTP_ACCEPT', '')
+            export_type = 'csv' if 'text/csv' in accept else 'ndjson'
+        if export_type not in export.EXPORT_TYPES:
+            choices = ', '.join(export.EXPORT_TYPES)
+            return Response(
+                {'type': [f'Choose one of {choices}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response = StreamingHttpResponse(
+            export.stream(self.queryset.filter(user=request.user),
+                          export_type),
+            content_type=export.EXPORT_TYPES[export_type]
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="recipes.{export_type}"'
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
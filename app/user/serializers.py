@@ -1,9 +1,12 @@
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import ugettext_lazy as _
 
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
 
-class UserSerializer(serializers.ModelSerializer):
+from core.metrics import TimedSerializerMixin
+from core.throttling import login_keys, login_rate_limiter
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializers for the user object """
 
     class Meta:
@@ -20,13 +23,20 @@ class UserSerializer(serializers.ModelSerializer):
     def update(self,instance,validated_data):
         """" Update a user, setting the password correctly and return it """
         password = validated_data.pop('password',None)
-        user = super().update(instance,validated_data)
-
+        # a single UPDATE of the columns that change, none if nothing does
+        changed = [
+            name for name, value in validated_data.items()
+            if getattr(instance, name) != value
+        ]
+        for name in changed:
+            setattr(instance, name, validated_data[name])
         if password:
-            user.set_password(password)
-            user.save()
+            instance.set_password(password)
+            changed.append('password')
+        if changed:
+            instance.save(update_fields=changed + ['updated'])
 
-        return user
+        return instance
 
 class AuthTokenSerializer(serializers.Serializer):
     """ Serializer for the authentication object """
@@ -39,8 +49,15 @@ class AuthTokenSerializer(serializers.Serializer):
     def validate(self,attrs):
         email=attrs.get('email')
         password=attrs.get('password')
+        request=self.context.get('request')
+        # rejected before authenticate() spends time hashing the password
+        keys=login_keys(email, request)
+        wait=login_rate_limiter.acquire(keys)
+        if wait is not None:
+            raise exceptions.Throttled(wait)
+
         user=authenticate(
-            request=self.context.get('request'),
+            request=request,
             username=email,
             password=password
         )
@@ -49,5 +66,6 @@ class AuthTokenSerializer(serializers.Serializer):
             msg=_('Unable to authenticate with provided credentials')
             raise serializers.ValidationError(msg,code='authentication')
 
+        login_rate_limiter.release(keys)
         attrs['user']=user
         return attrs
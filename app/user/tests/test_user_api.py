@@ -1,9 +1,20 @@
-from django.test import TestCase
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from rest_framework.authtoken.models import Token
+
+from core.models import TokenExpiry
+from core.throttling import login_rate_limiter
+
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
@@ -124,6 +135,16 @@ class PrivateUserApiTests(TestCase):
             'email': self.user.email,
         })
 
+    def test_retrieve_profile_reads_row(self):
+        """ Test the profile is read from the row, not the request's user,
+        which may be a stale cached copy """
+        get_user_model().objects.filter(pk=self.user.pk) \
+                                .update(name='changed elsewhere')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'changed elsewhere')
+
     def test_post_me_not_allowed(self):
         """ Test post not allowed on me url """
         res = self.client.post(ME_URL, {})
@@ -140,3 +161,159 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name,payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code,status.HTTP_200_OK)
+
+    def test_update_writes_changed_columns_once(self):
+        """ Test an update is one UPDATE of the changed columns """
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(ME_URL, {'name': 'new name',
+                                             'password': 'newpassword123'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        [update] = [query['sql'] for query in queries.captured_queries
+                    if query['sql'].startswith('UPDATE')]
+        self.assertIn('"name"', update)
+        self.assertIn('"password"', update)
+        self.assertNotIn('"email"', update)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch(ME_URL, {'name': 'new name'})
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('UPDATE')])
+
+    def test_retrieve_profile_not_modified(self):
+        """ Test a current copy of the profile gets a 304 """
+        res = self.client.get(ME_URL)
+        etag = res['ETag']
+
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        res = self.client.get(ME_URL,
+                              HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(ME_URL, {'name': 'new name'})
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_update_precondition(self):
+        """ Test an update of an outdated copy is refused """
+        etag = self.client.get(ME_URL)['ETag']
+        self.client.patch(ME_URL, {'name': 'new name'}, HTTP_IF_MATCH=etag)
+
+        res = self.client.patch(ME_URL, {'name': 'other'}, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'new name')
+
+
+@override_settings(LOGIN_RATE_LIMITS={'email': '2/min', 'ip': '3/min'})
+class TokenLoginTests(TestCase):
+    """ Test the rate limiting and rehashing of token logins """
+
+    def setUp(self):
+        login_rate_limiter.clear()
+        self.client = APIClient()
+        self.user = create_user(email='test@gmail.com', password='Testpass')
+
+    def tearDown(self):
+        login_rate_limiter.clear()
+
+    def test_failed_logins_throttled_per_email(self):
+        """ test failures use up the attempts of an email """
+        payload = {'email': 'Test@gmail.com', 'password': 'wrong'}
+        for _ in range(2):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, {'email': 'test@gmail.com',
+                                           'password': 'Testpass'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+    def test_failed_logins_throttled_per_address(self):
+        """ test failures for different emails use up the client's attempts """
+        for index in range(3):
+            self.client.post(TOKEN_URL, {'email': f'user{index}@gmail.com',
+                                         'password': 'wrong'})
+
+        res = self.client.post(TOKEN_URL, {'email': 'test@gmail.com',
+                                           'password': 'Testpass'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        res = self.client.post(TOKEN_URL, {'email': 'test@gmail.com',
+                                           'password': 'Testpass'},
+                               REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_forwarded_for_ignored_without_proxies(self):
+        """ test a client can't pick its bucket with X-Forwarded-For """
+        for index in range(3):
+            self.client.post(TOKEN_URL, {'email': f'user{index}@gmail.com',
+                                         'password': 'wrong'},
+                             HTTP_X_FORWARDED_FOR=f'10.0.1.{index}')
+
+        res = self.client.post(TOKEN_URL, {'email': 'test@gmail.com',
+                                           'password': 'Testpass'},
+                               HTTP_X_FORWARDED_FOR='10.0.1.9')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_successful_logins_not_throttled(self):
+        """ test logins with the right password give their attempt back """
+        payload = {'email': 'test@gmail.com', 'password': 'Testpass'}
+        for _ in range(5):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_password_rehashed_on_login(self):
+        """ test a hash from another hasher is upgraded on login """
+        self.user.password = make_password('Testpass', hasher='pbkdf2_sha256')
+        self.user.save()
+
+        res = self.client.post(TOKEN_URL, {'email': 'test@gmail.com',
+                                           'password': 'Testpass'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('argon2$'))
+
+    def test_token_reused_while_valid(self):
+        """ test logging in again returns the same token, extended """
+        payload = {'email': 'test@gmail.com', 'password': 'Testpass'}
+        first = self.client.post(TOKEN_URL, payload)
+        TokenExpiry.objects.update(expires=timezone.now() + timedelta(1))
+
+        second = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(second.data['token'], first.data['token'])
+        self.assertEqual(TokenExpiry.objects.get().expires,
+                         second.data['expires'])
+        self.assertGreater(second.data['expires'], timezone.now()
+                           + timedelta(1))
+
+    def test_token_without_expiry_row(self):
+        """ test a valid token missing its expiry row gets one on login """
+        payload = {'email': 'test@gmail.com', 'password': 'Testpass'}
+        first = self.client.post(TOKEN_URL, payload)
+        TokenExpiry.objects.all().delete()
+
+        second = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(second.data['token'], first.data['token'])
+        self.assertEqual(TokenExpiry.objects.get().expires,
+                         second.data['expires'])
+
+    def test_expired_token_rotated(self):
+        """ test logging in after expiry issues a new token """
+        payload = {'email': 'test@gmail.com', 'password': 'Testpass'}
+        first = self.client.post(TOKEN_URL, payload)
+        TokenExpiry.objects.update(expires=timezone.now())
+
+        second = self.client.post(TOKEN_URL, payload)
+
+        self.assertNotEqual(second.data['token'], first.data['token'])
+        self.assertEqual(list(Token.objects.values_list('key', flat=True)),
+                         [second.data['token']])
@@ -1,7 +1,16 @@
-from rest_framework import generics, authentication, permissions
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
+from core.authentication import CachedTokenAuthentication, obtain_token
+from core.views import ReplicaReadMixin
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 class CreateUserView(generics.CreateAPIView):
@@ -13,13 +22,66 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+    def post(self, request, *args, **kwargs):
+        """ Reuse the user's token while valid, rotate it once expired """
+        serializer = self.serializer_class(data=request.data,
+                                           context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        token, expires = obtain_token(serializer.validated_data['user'])
+        return Response({'token': token.key, 'expires': expires})
+
+class ManageUserView(ReplicaReadMixin, generics.RetrieveUpdateAPIView):
     """ Manage the authenticated user """
     serializer_class = UserSerializer
-    authentication_classes=(authentication.TokenAuthentication,)
+    authentication_classes=(CachedTokenAuthentication,)
     permission_classes=(permissions.IsAuthenticated,)
 
     def get_object(self):
-        """ Retrieve and return authenticated user
-         get auth. user and assign it to the request """
-        return self.request.user
+        """ Retrieve and return authenticated user.
+
+        request.user may come from another process's stale auth cache
+        entry, so the profile and its validators are read from the row,
+        once per request.
+        """
+        if not hasattr(self, '_user'):
+            self._user = get_user_model().objects.get(
+                pk=self.request.user.pk
+            )
+        return self._user
+
+    def get_validators(self, user):
+        """ (ETag, Last-Modified timestamp) of the user's profile """
+        digest = hashlib.md5(
+            f'{user.pk}:{user.updated.isoformat()}'.encode('utf-8')
+        ).hexdigest()
+        return quote_etag(digest), int(user.updated.timestamp())
+
+    def retrieve(self, request, *args, **kwargs):
+        """ Return the profile, or 304 if the client's copy is current """
+        user = self.get_object()
+        etag, last_modified = self.get_validators(user)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = Response(self.get_serializer(user).data)
+        return self.set_validators(response, etag, last_modified)
+
+    def update(self, request, *args, **kwargs):
+        """ Update the profile, 412 if If-Match names an older version """
+        etag, last_modified = self.get_validators(self.get_object())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            return response
+        response = super().update(request, *args, **kwargs)
+        return self.set_validators(
+            response, *self.get_validators(self.get_object())
+        )
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response